@@ -0,0 +1,128 @@
+"""Đo tốc độ vòng chép dữ liệu của Drive engine với một máy chủ HTTP cục bộ.
+
+So sánh vòng lặp cũ (`iter_content(8192)`, cập nhật tiến trình mỗi chunk)
+với `drive_engine.copy_response` (chunk thích ứng, buffer dùng lại, tiến
+trình tách khỏi vòng chép). Máy chủ chạy ở tiến trình riêng nên CPU đo được
+chỉ là CPU của phía tải.
+
+    python benchmarks/bench_drive_transfer.py --size-mb 1024 --repeat 3
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from drive_engine import PartialDownload, copy_response, format_progress  # noqa: E402
+
+BLOCK = os.urandom(1024 * 1024)
+
+
+def serve(port_queue, size):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            remaining = size
+            while remaining:
+                block = BLOCK[:min(remaining, len(BLOCK))]
+                self.wfile.write(block)
+                remaining -= len(block)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def expected_md5(size):
+    md5 = hashlib.md5()
+    remaining = size
+    while remaining:
+        block = BLOCK[:min(remaining, len(BLOCK))]
+        md5.update(block)
+        remaining -= len(block)
+    return md5.hexdigest()
+
+
+def legacy_copy(response, f, partial, file_name, total_size):
+    """Vòng chép trước đây: 8 KB mỗi lần, định dạng tiến trình sau mỗi chunk."""
+    written = 0
+    for chunk in response.iter_content(chunk_size=8192):
+        if chunk:
+            f.write(chunk)
+            partial.update(chunk)
+            written += len(chunk)
+            format_progress(file_name, written, total_size)
+    return written
+
+
+def engine_copy(response, f, partial, file_name, total_size):
+    return copy_response(response, f, partial, lambda copied: format_progress(file_name, copied, total_size))
+
+
+def run_once(url, size, md5, workdir, copy, preallocate):
+    file = {'id': 'bench', 'size': str(size), 'md5Checksum': md5}
+    partial = PartialDownload(os.path.join(workdir, 'bench.bin'), file)
+    partial.discard()
+    partial.resume_offset()
+
+    response = requests.get(url, stream=True, timeout=(10, 60))
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    with partial.open(0, size, preallocate) as f:
+        written = copy(response, f, partial, 'bench.bin', size)
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    response.close()
+
+    error = partial.verify()
+    partial.discard()
+    if error or written != size:
+        raise RuntimeError(f"Kết quả sai: {error or written}")
+    return wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=512, help="Kích thước file thử (MB)")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần chạy mỗi cách chép")
+    parser.add_argument("--no-md5", action="store_true", help="Không băm MD5 khi chép")
+    parser.add_argument("--preallocate", action="store_true", help="Cấp phát trước file đích")
+    parser.add_argument("--dir", help="Thư mục ghi file tạm (mặc định thư mục tạm của hệ thống)")
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    if args.dir:
+        os.makedirs(args.dir, exist_ok=True)
+    md5 = None if args.no_md5 else expected_md5(size)
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(port_queue, size), daemon=True)
+    server.start()
+    url = f"http://127.0.0.1:{port_queue.get()}/file"
+
+    try:
+        with tempfile.TemporaryDirectory(dir=args.dir) as workdir:
+            print(f"{'Cách chép':<18}{'MB/s':>10}{'CPU giây/GB':>14}")
+            for name, copy in (("iter_content 8KB", legacy_copy), ("copy_response", engine_copy)):
+                results = [run_once(url, size, md5, workdir, copy, args.preallocate) for _ in range(args.repeat)]
+                wall = min(result[0] for result in results)
+                cpu = min(result[1] for result in results)
+                print(f"{name:<18}{size / wall / (1024 * 1024):>10.1f}{cpu / (size / 1024 ** 3):>14.2f}")
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
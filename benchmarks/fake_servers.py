@@ -0,0 +1,264 @@
+"""Máy chủ giả lập cục bộ cho bộ benchmark: Drive v3 và máy chủ media cho yt-dlp.
+
+Nội dung file được sinh từ id theo một mẫu lặp lại, nên file vài GB cũng
+không chiếm bộ nhớ. Cả hai máy chủ hỗ trợ `Range:` và có thể trả lỗi
+429/5xx ngẫu nhiên (có seed) theo `error_rate` để đo đường thử lại.
+Mỗi máy chủ chạy trong tiến trình riêng (`start`), nên CPU và bộ nhớ của
+máy chủ không lẫn vào số đo của phía tải.
+"""
+import re
+import sys
+import json
+import random
+import hashlib
+import threading
+import multiprocessing
+from urllib.parse import urlparse, parse_qsl
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+PATTERN_SIZE = 64 * 1024
+WRITE_BLOCK = 1024 * 1024
+ERROR_STATUSES = (429, 500, 503)
+
+
+class Content:
+    """Nội dung giả của một file: mẫu 64 KB sinh từ `seed`, lặp lại đến `size` byte."""
+
+    def __init__(self, seed, size):
+        self.size = size
+        pattern = hashlib.sha256(seed.encode()).digest() * (PATTERN_SIZE // 32)
+        # Đủ dài để cắt một khối WRITE_BLOCK từ bất kỳ vị trí nào trong mẫu
+        self.buffer = pattern * (WRITE_BLOCK // PATTERN_SIZE + 1)
+
+    def blocks(self, start, end):
+        """Sinh các khối byte của đoạn [start, end]."""
+        offset = start
+        while offset <= end:
+            length = min(WRITE_BLOCK, end - offset + 1)
+            base = offset % PATTERN_SIZE
+            yield self.buffer[base:base + length]
+            offset += length
+
+    def md5(self):
+        md5 = hashlib.md5()
+        for block in self.blocks(0, self.size - 1):
+            md5.update(block)
+        return md5.hexdigest()
+
+
+class FaultInjector:
+    """Trả lỗi cho một tỉ lệ `error_rate` request (thread-safe, có seed)."""
+
+    def __init__(self, error_rate, seed):
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.injected = 0
+
+    def pick(self, statuses=ERROR_STATUSES):
+        if not self.error_rate:
+            return None
+        with self.lock:
+            if self.random.random() >= self.error_rate:
+                return None
+            self.injected += 1
+            return self.random.choice(statuses)
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Bên tải đóng kết nối giữa chừng (hủy, thử lại) là chuyện bình thường
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send_empty(self, status, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_error_status(self, status):
+        # Retry-After: 0 để lỗi giả lập không làm benchmark chủ yếu đo thời gian chờ
+        self.send_empty(status, [('Retry-After', '0')])
+
+    def send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_content(self, content, content_type='application/octet-stream', head=False):
+        start, end = 0, content.size - 1
+        match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range', ''))
+        if match and content.size:
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), end) if match.group(2) else end
+            else:
+                start = max(0, content.size - int(match.group(2)))
+            if start >= content.size:
+                self.send_empty(416, [('Content-Range', f'bytes */{content.size}')])
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{content.size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1 if content.size else 0))
+        self.end_headers()
+        if head or not content.size:
+            return
+        try:
+            for block in content.blocks(start, end):
+                self.wfile.write(block)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def build_drive_tree(spec):
+    """Tạo cây Drive từ `spec`: {'root', 'depth', 'fanout', 'files_per_folder', 'file_size'}.
+
+    Trả về (files theo id, id con theo id thư mục cha). Thư mục gốc chứa
+    `files_per_folder` file và `fanout` thư mục con, lặp lại đến độ sâu `depth`.
+    """
+    files = {}
+    children = {}
+    counter = [0]
+
+    def new_id(prefix):
+        counter[0] += 1
+        return f"{prefix}{counter[0]:024d}"
+
+    def add(entry, parent_id):
+        files[entry['id']] = entry
+        children.setdefault(parent_id, []).append(entry['id'])
+
+    def fill(folder_id, level):
+        for _ in range(spec['files_per_folder']):
+            file_id = new_id('f')
+            content = Content(file_id, spec['file_size'])
+            add({
+                'id': file_id,
+                'name': f"{file_id}.bin",
+                'mimeType': 'application/octet-stream',
+                'parents': [folder_id],
+                'size': str(content.size),
+                'md5Checksum': content.md5(),
+                'modifiedTime': '2024-01-01T00:00:00.000Z',
+            }, folder_id)
+        if level >= spec['depth']:
+            return
+        for _ in range(spec['fanout']):
+            sub_id = new_id('d')
+            add({'id': sub_id, 'name': sub_id, 'mimeType': FOLDER_MIME, 'parents': [folder_id]}, folder_id)
+            fill(sub_id, level + 1)
+
+    fill(spec['root'], 0)
+    return files, children
+
+
+def serve_drive(ready, spec, page_limit, error_rate, seed):
+    """Máy chủ Drive v3 giả: `files.list` theo trang và `files.get?alt=media` có Range."""
+    files, children = build_drive_tree(spec)
+    faults = FaultInjector(error_rate, seed)
+
+    class DriveHandler(RangeHandler):
+        def do_POST(self):
+            # googleapiclient gửi truy vấn dài (nhiều thư mục cha) bằng POST + X-HTTP-Method-Override
+            if self.headers.get('X-HTTP-Method-Override') != 'GET':
+                self.send_empty(405)
+                return
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+            self.do_GET(dict(parse_qsl(body)))
+
+        def do_GET(self, form=None):
+            url = urlparse(self.path)
+            query = dict(parse_qsl(url.query), **(form or {}))
+            status = faults.pick()
+            if status is not None:
+                self.send_error_status(status)
+                return
+            if url.path.rstrip('/').endswith('/files'):
+                self.list_files(query)
+                return
+            match = re.match(r'.*/files/([^/]+)$', url.path)
+            if match and query.get('alt') == 'media' and match.group(1) in files:
+                file = files[match.group(1)]
+                self.send_content(Content(file['id'], int(file['size'])))
+                return
+            self.send_empty(404)
+
+        def list_files(self, query):
+            parents = re.findall(r"'([^']+)' in parents", query.get('q', ''))
+            ids = [file_id for parent in parents for file_id in children.get(parent, [])]
+            page_size = min(int(query.get('pageSize', 100)), page_limit)
+            start = int(query.get('pageToken') or 0)
+            page = {'files': [files[file_id] for file_id in ids[start:start + page_size]]}
+            if start + page_size < len(ids):
+                page['nextPageToken'] = str(start + page_size)
+            self.send_json(page)
+
+    server = QuietServer(('127.0.0.1', 0), DriveHandler)
+    ready.put((server.server_address[1], len(files)))
+    server.serve_forever()
+
+
+def serve_media(ready, videos, error_rate, seed):
+    """Máy chủ media: `/v/<n>.mp4` là file video trực tiếp mà extractor generic của yt-dlp tải được.
+
+    `videos` là danh sách kích thước (byte). Lỗi giả lập chỉ là 5xx, loại mà
+    yt-dlp tự thử lại khi đang tải.
+    """
+    faults = FaultInjector(error_rate, seed)
+
+    class MediaHandler(RangeHandler):
+        def content(self):
+            match = re.match(r'/v/(\d+)\.mp4$', urlparse(self.path).path)
+            if not match or int(match.group(1)) >= len(videos):
+                return None
+            return Content(f"video{match.group(1)}", videos[int(match.group(1))])
+
+        def do_HEAD(self):
+            content = self.content()
+            if content is None:
+                self.send_empty(404)
+            else:
+                self.send_content(content, 'video/mp4', head=True)
+
+        def do_GET(self):
+            content = self.content()
+            if content is None:
+                self.send_empty(404)
+                return
+            status = faults.pick((500, 503))
+            if status is not None:
+                self.send_error_status(status)
+                return
+            self.send_content(content, 'video/mp4')
+
+    server = QuietServer(('127.0.0.1', 0), MediaHandler)
+    ready.put((server.server_address[1], len(videos)))
+    server.serve_forever()
+
+
+def start(target, *args):
+    """Chạy máy chủ `target` trong tiến trình riêng; trả về (process, cổng, số mục)."""
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=target, args=(ready, *args), daemon=True)
+    process.start()
+    port, count = ready.get(timeout=600)
+    return process, port, count
@@ -0,0 +1,281 @@
+"""Bộ benchmark các engine tải với máy chủ Drive v3 và máy chủ media giả lập cục bộ.
+
+Mỗi kịch bản chạy `DriveDownloader`/`YouTubeDownloader` thật trong một tiến
+trình mới (nên bộ nhớ đỉnh là của riêng kịch bản đó) với máy chủ giả lập ở
+tiến trình khác, rồi báo tốc độ, độ trễ từng mục (p50/p90/p99, lấy từ
+`MetricsRegistry`), số lần thử lại và bộ nhớ đỉnh. Lưu kết quả bằng `--json`
+và so với lần trước bằng `--baseline` để thấy hồi quy hiệu năng.
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py drive-small drive-errors --scale 0.25
+    python benchmarks/run_benchmarks.py --json new.json --baseline old.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import queue
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_servers  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+KB = 1024
+MB = 1024 * 1024
+ROOT_ID = "BenchRootFolder" + "0" * 18
+
+# `scale` là khóa được nhân với --scale (số file hoặc kích thước)
+SCENARIOS = {
+    'drive-small': {
+        'description': "Nhiều file nhỏ trong một thư mục",
+        'tree': {'depth': 0, 'fanout': 0, 'files_per_folder': 2000, 'file_size': 16 * KB},
+        'scale': 'files_per_folder',
+    },
+    'drive-huge': {
+        'description': "Vài file rất lớn (tải nhiều kết nối)",
+        'tree': {'depth': 0, 'fanout': 0, 'files_per_folder': 3, 'file_size': 256 * MB},
+        'scale': 'file_size',
+    },
+    'drive-deep': {
+        'description': "Cây thư mục sâu 6 tầng, mỗi thư mục 3 nhánh",
+        'tree': {'depth': 6, 'fanout': 3, 'files_per_folder': 1, 'file_size': 4 * KB},
+        'scale': 'file_size',
+    },
+    'drive-errors': {
+        'description': "File nhỏ, 5% request bị 429/500/503",
+        'tree': {'depth': 0, 'fanout': 0, 'files_per_folder': 500, 'file_size': 64 * KB},
+        'scale': 'files_per_folder',
+        'error_rate': 0.05,
+    },
+    'youtube-small': {
+        'description': "Nhiều video nhỏ qua extractor generic",
+        'videos': {'count': 40, 'size': 1 * MB},
+        'scale': 'count',
+    },
+    'youtube-large': {
+        'description': "Vài video lớn (tải theo http_chunk_size)",
+        'videos': {'count': 3, 'size': 64 * MB},
+        'scale': 'size',
+    },
+    'youtube-errors': {
+        'description': "Video nhỏ, 5% request bị 500/503",
+        'videos': {'count': 30, 'size': 1 * MB},
+        'scale': 'count',
+        'error_rate': 0.05,
+    },
+}
+
+
+class QuietLogger:
+    """Logger cho yt-dlp: lỗi được đếm trong kết quả, không in ra giữa bảng."""
+
+    def debug(self, message):
+        pass
+
+    info = warning = error = debug
+
+
+class NullProgress:
+    """Bộ báo tiến trình bỏ qua mọi thứ, để benchmark chỉ đo phần tải."""
+
+    def log(self, text):
+        pass
+
+    def update(self, key, formatter, *args):
+        pass
+
+    def finish(self, key, text):
+        pass
+
+
+def percentile_ms(seconds, fraction):
+    if not seconds:
+        return None
+    seconds = sorted(seconds)
+    return seconds[min(len(seconds) - 1, int(fraction * len(seconds)))] * 1000
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux báo KB, macOS báo byte
+    return peak / MB if sys.platform == 'darwin' else peak / KB
+
+
+def run_drive(scenario, port, workers, workdir):
+    os.environ['HDZ_DRIVE_API_ENDPOINT'] = f"http://127.0.0.1:{port}/"
+    from drive_engine import DriveDownloader
+    from engine_common import MetricsRegistry, ThroughputHistory
+
+    metrics = MetricsRegistry()
+    downloader = DriveDownloader(
+        "bench-key", NullProgress(), max_workers=workers,
+        throughput=ThroughputHistory(os.path.join(workdir, "throughput.json")), metrics=metrics,
+        # Không giới hạn request để số đo là của engine, không phải của token bucket
+        requests_per_second=0
+    )
+    start = time.perf_counter()
+    downloader.download_links([f"https://drive.google.com/drive/folders/{ROOT_ID}"], os.path.join(workdir, "out"))
+    elapsed = time.perf_counter() - start
+    items = [event for event in metrics.events if event['metric'] == 'drive_file']
+    folders = [event for event in metrics.events if event['metric'] == 'drive_folder']
+    return {
+        'seconds': elapsed,
+        'items': len(items),
+        'failed': sum(1 for event in items if event['status'] != 'ok'),
+        'bytes': sum(event.get('bytes', 0) for event in items),
+        'latencies': [event['seconds'] for event in items],
+        'retries': sum(event.get('retries', 0) for event in items + folders),
+        'list_calls': sum(event.get('list_calls', 0) for event in folders),
+    }
+
+
+def run_youtube(scenario, port, workers, workdir):
+    from youtube_engine import MetadataCache, YouTubeDownloader
+    from engine_common import MetricsRegistry, ThroughputHistory
+
+    metrics = MetricsRegistry()
+    downloader = YouTubeDownloader(
+        NullProgress(),
+        metadata_cache=MetadataCache(os.path.join(workdir, "metadata_cache.sqlite3")),
+        max_concurrent_videos=workers,
+        extra_ydl_opts={'quiet': True, 'no_warnings': True, 'noprogress': True, 'logger': QuietLogger()},
+        throughput=ThroughputHistory(os.path.join(workdir, "throughput.json")),
+        metrics=metrics
+    )
+    urls = [f"http://127.0.0.1:{port}/v/{n}.mp4" for n in range(scenario['videos']['count'])]
+    start = time.perf_counter()
+    result = downloader.download_videos(urls, os.path.join(workdir, "out"), 'best')
+    elapsed = time.perf_counter() - start
+    items = [event for event in metrics.events if event['metric'] == 'youtube_download']
+    return {
+        'seconds': elapsed,
+        'items': result.total,
+        'failed': len(result.failed),
+        'bytes': sum(event.get('bytes', 0) for event in items),
+        'latencies': [event['seconds'] for event in items if event['status'] == 'ok'],
+        'retries': sum(event.get('retries', 0) for event in items),
+        'list_calls': 0,
+    }
+
+
+def run_scenario(results, name, scenario, port, workers, workdir):
+    """Chạy trong tiến trình con mới: tải, rồi gửi số đo về qua `results`."""
+    os.environ['HDZ_DATA_DIR'] = os.path.join(workdir, "data")
+    runner = run_drive if 'tree' in scenario else run_youtube
+    measured = runner(scenario, port, workers, workdir)
+    latencies = measured.pop('latencies')
+    measured.update({
+        'scenario': name,
+        'throughput_mbps': measured['bytes'] / MB / max(measured['seconds'], 1e-9),
+        'p50_ms': percentile_ms(latencies, 0.5),
+        'p90_ms': percentile_ms(latencies, 0.9),
+        'p99_ms': percentile_ms(latencies, 0.99),
+        'peak_rss_mb': peak_rss_mb(),
+    })
+    results.put(measured)
+
+
+def scaled(scenario, scale):
+    scenario = json.loads(json.dumps(scenario))
+    spec = scenario.get('tree') or scenario['videos']
+    spec[scenario['scale']] = max(1, int(spec[scenario['scale']] * scale))
+    return scenario
+
+
+def benchmark(name, scenario, workers, seed, workdir):
+    error_rate = scenario.get('error_rate', 0)
+    if 'tree' in scenario:
+        tree = dict(scenario['tree'], root=ROOT_ID)
+        server, port, _ = fake_servers.start(fake_servers.serve_drive, tree, 1000, error_rate, seed)
+    else:
+        videos = [scenario['videos']['size']] * scenario['videos']['count']
+        server, port, _ = fake_servers.start(fake_servers.serve_media, videos, error_rate, seed)
+    try:
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        child = context.Process(target=run_scenario, args=(results, name, scenario, port, workers, workdir))
+        child.start()
+        # Tiến trình con lỗi thì không gửi kết quả: chỉ chờ khi nó còn chạy
+        while True:
+            try:
+                measured = results.get(timeout=1)
+                break
+            except queue.Empty:
+                if not child.is_alive():
+                    raise RuntimeError(f"Kịch bản {name} lỗi (mã thoát {child.exitcode})")
+        child.join()
+        return measured
+    finally:
+        server.terminate()
+
+
+def format_number(value, digits=1):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", help=f"Kịch bản cần chạy (mặc định tất cả: {', '.join(SCENARIOS)})")
+    parser.add_argument("--scale", type=float, default=1.0, help="Hệ số nhân số file/kích thước của kịch bản")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="Số mục tải song song (mặc định 4)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed cho lỗi giả lập")
+    parser.add_argument("--dir", help="Thư mục ghi file tạm (mặc định thư mục tạm của hệ thống)")
+    parser.add_argument("--json", metavar="FILE", help="Lưu kết quả ra file JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="File JSON của lần chạy trước để so sánh")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Kịch bản không có: {', '.join(unknown)}")
+    if args.dir:
+        os.makedirs(args.dir, exist_ok=True)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = {entry['scenario']: entry for entry in json.load(f)}
+
+    print(f"{'Kịch bản':<16}{'Mục':>7}{'Lỗi':>6}{'MB':>9}{'Giây':>8}{'MB/s':>9}"
+          f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'Thử lại':>9}{'RSS MB':>9}{'So với gốc':>12}")
+    all_results = []
+    failed = []
+    for name in args.scenarios or SCENARIOS:
+        scenario = scaled(SCENARIOS[name], args.scale)
+        with tempfile.TemporaryDirectory(dir=args.dir) as workdir:
+            try:
+                measured = benchmark(name, scenario, args.jobs, args.seed, workdir)
+            except RuntimeError as e:
+                print(f"{name:<16}{e}", flush=True)
+                failed.append(name)
+                continue
+        all_results.append(measured)
+        delta = ""
+        if name in baseline and baseline[name]['throughput_mbps']:
+            change = measured['throughput_mbps'] / baseline[name]['throughput_mbps'] - 1
+            delta = f"{change:+.1%}"
+        print(
+            f"{name:<16}{measured['items']:>7}{measured['failed']:>6}{measured['bytes'] / MB:>9.1f}"
+            f"{measured['seconds']:>8.2f}{measured['throughput_mbps']:>9.1f}"
+            f"{format_number(measured['p50_ms']):>9}{format_number(measured['p90_ms']):>9}"
+            f"{format_number(measured['p99_ms']):>9}{measured['retries']:>9}"
+            f"{format_number(measured['peak_rss_mb']):>9}{delta:>12}",
+            flush=True
+        )
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(all_results, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,453 @@
+"""Giao diện dòng lệnh (không cần Tk) cho engine tải Google Drive và YouTube.
+
+Ví dụ:
+    python downloader_cli.py drive -o out --api-key-file key.json -i links.txt
+    cat urls.txt | python downloader_cli.py youtube -o out -i - -j 4 -f "bv*+ba/b"
+
+Mục đã tải ở lần chạy trước (theo archive trong thư mục dữ liệu, hoặc
+`--archive-file`) được bỏ qua; dùng `--no-archive` để tải lại tất cả.
+
+`--dry-run` chỉ lập kế hoạch (dung lượng, thời gian dự kiến, chỗ trống) và
+lưu thành file; chạy lại với `--manifest <file>` để tải theo kế hoạch đó mà
+không phải liệt kê lại. `--metrics-file` ghi thời gian liệt kê, trích
+xuất, tải và hậu xử lý của từng mục ra JSON lines hoặc văn bản Prometheus.
+
+Trạng thái từng mục của mỗi lần chạy được lưu thành một lô trong thư mục dữ
+liệu: `--resume-batch` chạy tiếp lô gần nhất chưa xong (sau khi bị dừng hoặc
+crash) với liên kết và thư mục của lô đó, `--retry-failed` chỉ tải lại các
+mục lỗi của lô gần nhất có lỗi.
+
+Băng thông được giới hạn theo file cấu hình (`bandwidth.json` trong thư mục
+dữ liệu, hoặc `--bandwidth-config`): trần tổng, trần theo nguồn và hồ sơ
+theo giờ; `--limit-rate` đặt thêm trần cho lệnh đang chạy.
+
+Mã thoát: 0 khi không có mục lỗi, 1 khi có mục lỗi, 3 khi không mục nào
+thành công (hoặc không đủ chỗ trống với --dry-run), 2 khi sai tham số.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_USAGE = 2
+EXIT_FAILED = 3
+
+
+class UsageError(Exception):
+    """Tham số hoặc file cấu hình sai, phát hiện sau khi phân tích dòng lệnh; thoát với EXIT_USAGE."""
+
+
+class ConsoleProgress:
+    """Bộ báo tiến trình in ra stderr, cùng giao diện với `ProgressBus` của giao diện Tk.
+
+    Trên terminal, dòng tiến trình của mỗi mục được ghi đè tại chỗ và giới hạn
+    `UPDATE_INTERVAL` giây; khi stderr bị chuyển hướng, chỉ in log và kết quả.
+    """
+
+    UPDATE_INTERVAL = 0.5
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self.interactive = self.stream.isatty()
+        self._lock = threading.Lock()
+        self._last_update = 0.0
+        self._line_open = False
+
+    def log(self, text):
+        with self._lock:
+            self._write_line(text)
+
+    def update(self, key, formatter, *args):
+        if not self.interactive:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_update < self.UPDATE_INTERVAL:
+                return
+            self._last_update = now
+            self.stream.write("\r\033[K" + formatter(*args))
+            self.stream.flush()
+            self._line_open = True
+
+    def finish(self, key, text):
+        with self._lock:
+            self._write_line(text)
+
+    def call(self, func, *args):
+        func(*args)
+
+    def _write_line(self, text):
+        if self._line_open:
+            self.stream.write("\r\033[K")
+            self._line_open = False
+        self.stream.write(text + "\n")
+        self.stream.flush()
+
+
+class QuietYtdlpLogger:
+    """Logger cho yt-dlp khi không có --verbose: lỗi đã được báo lại qua kết quả của lô."""
+
+    def debug(self, message):
+        pass
+
+    info = warning = error = debug
+
+
+def read_links(args):
+    """Gộp URL từ tham số vị trí và các file `-i` (`-` là stdin), bỏ dòng trống và dòng `#`."""
+    links = list(args.urls)
+    for path in args.input or []:
+        if path == "-":
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        links.extend(lines)
+    return [link.strip() for link in links if link.strip() and not link.strip().startswith("#")]
+
+
+def load_api_key(args):
+    """Lấy API key từ `--api-key`, `--api-key-file` (JSON có trường `api_key`) hoặc biến môi trường."""
+    if args.api_key:
+        return args.api_key
+    if args.api_key_file:
+        try:
+            with open(args.api_key_file, "r", encoding="utf-8") as f:
+                return json.load(f)["api_key"]
+        except (OSError, ValueError, KeyError) as e:
+            raise UsageError(f"Không đọc được API key từ {args.api_key_file}: {e}")
+    return os.environ.get("HDZ_DRIVE_API_KEY")
+
+
+def open_archive(args):
+    from engine_common import APP_DATA_DIR, DownloadArchive
+
+    if args.no_archive:
+        return None
+    return DownloadArchive(args.archive_file or os.path.join(APP_DATA_DIR, "download_archive.sqlite3"))
+
+
+def open_batch(args, links):
+    """Lô việc của lần chạy: lô cũ với `--resume-batch`/`--retry-failed`, nếu không thì một lô mới."""
+    from engine_common import APP_DATA_DIR, JobStore
+
+    store = JobStore(os.path.join(APP_DATA_DIR, "jobs.sqlite3"))
+    if args.retry_failed:
+        batch = store.latest_failed_batch(args.command)
+        if batch is None:
+            store.close()
+            raise UsageError("Không có lô nào còn mục lỗi")
+        batch.requeue_failed()
+    elif args.resume_batch:
+        batches = store.unfinished_batches(args.command)
+        if not batches:
+            store.close()
+            raise UsageError("Không có lô nào chưa xong")
+        batch = batches[0]
+        batch.resume()
+    else:
+        options = {'format': args.format} if args.command == 'youtube' else {}
+        batch = store.create_batch(args.command, args.output, links, options)
+    return store, batch
+
+
+def configure_bandwidth(args, progress):
+    """Nạp cấu hình băng thông vào bộ chia chung của tiến trình và đặt trần `--limit-rate`."""
+    from engine_common import BANDWIDTH_FILE, parse_rate, shared_shaper
+
+    shaper = shared_shaper()
+    path = args.bandwidth_config or BANDWIDTH_FILE
+    if args.bandwidth_config or os.path.exists(path):
+        try:
+            shaper.load(path)
+        except (OSError, ValueError) as e:
+            raise UsageError(f"Không đọc được cấu hình băng thông {path}: {e}")
+    if args.limit_rate:
+        try:
+            shaper.set_source_limit(args.command, parse_rate(args.limit_rate))
+        except ValueError as e:
+            raise UsageError(f"--limit-rate không hợp lệ: {e}")
+    progress.log(shaper.describe())
+
+
+def run_planned(args, links, progress, source, make_plan, download):
+    """Lập kế hoạch (`--dry-run`) hoặc tải, có thể theo kế hoạch đã lưu (`--manifest`)."""
+    from engine_common import BatchPlan, ThroughputHistory
+
+    if args.dry_run:
+        plan = make_plan()
+        for line in plan.summary(ThroughputHistory().rate(source)):
+            progress.log(line)
+        manifest_path = args.manifest or os.path.join(args.output, f".hdz_plan_{source}.json")
+        plan.save(manifest_path)
+        progress.log(f"Đã lưu kế hoạch: {manifest_path} (chạy lại với --manifest để tải theo kế hoạch này)")
+        return plan
+
+    plan = None
+    if args.manifest:
+        try:
+            plan = BatchPlan.load(args.manifest)
+        except (OSError, ValueError, KeyError) as e:
+            raise UsageError(f"Không đọc được kế hoạch {args.manifest}: {e}")
+        if plan.source != source or not plan.matches(links, args.output):
+            raise UsageError("Kế hoạch được lập cho nguồn, liên kết hoặc thư mục khác")
+    return download(plan)
+
+
+def parse_export_formats(profile, overrides):
+    """Hồ sơ xuất `profile` cộng các ghi đè dạng `document=pdf` hoặc `spreadsheet=xlsx,csv`."""
+    from drive_engine import EXPORT_MIME_TYPES, EXPORT_PROFILES, WORKSPACE_MIME_PREFIX
+
+    if profile not in EXPORT_PROFILES:
+        raise UsageError(f"Hồ sơ xuất không hợp lệ: {profile} (có: {', '.join(EXPORT_PROFILES)})")
+    export_formats = dict(EXPORT_PROFILES[profile])
+    for override in overrides or []:
+        kind, sep, extensions = override.partition("=")
+        extensions = [ext.strip().lower() for ext in extensions.split(",") if ext.strip()]
+        unknown = [ext for ext in extensions if ext not in EXPORT_MIME_TYPES]
+        if not sep or not kind or unknown:
+            raise UsageError(f"--export không hợp lệ: {override} (đuôi hỗ trợ: {', '.join(EXPORT_MIME_TYPES)})")
+        export_formats[WORKSPACE_MIME_PREFIX + kind.strip()] = extensions
+    return export_formats
+
+
+def setup_drive(args, progress, archive, metrics):
+    """Kiểm tra tham số và tạo engine Drive; trả về hàm `run(links, batch)` để tải."""
+    from drive_engine import DriveDownloader
+
+    api_key = load_api_key(args)
+    if not api_key:
+        raise UsageError("Thiếu API key: dùng --api-key, --api-key-file hoặc biến HDZ_DRIVE_API_KEY")
+
+    downloader = DriveDownloader(
+        api_key,
+        progress,
+        max_workers=args.jobs,
+        sync_mode=args.sync,
+        prune_deleted=args.prune,
+        resume=not args.no_resume,
+        archive=archive,
+        preallocate=args.preallocate,
+        segments=args.segments,
+        segment_threshold=args.segment_threshold_mb * 1024 * 1024,
+        export_formats=parse_export_formats(args.export_profile, args.export),
+        metrics=metrics,
+        requests_per_second=args.requests_per_second
+    )
+
+    def run(links, batch=None):
+        return run_planned(
+            args, links, progress, 'drive',
+            lambda: downloader.plan_links(links, args.output),
+            lambda plan: downloader.download_links(links, args.output, plan, batch)
+        )
+    return run
+
+
+def setup_youtube(args, progress, archive, metrics):
+    """Kiểm tra tham số và tạo engine YouTube; trả về hàm `run(links, batch)` để tải."""
+    from youtube_engine import TRANSFER_PROFILES, YouTubeDownloader, parse_playlist_range
+
+    if args.profile not in TRANSFER_PROFILES:
+        raise UsageError(f"Hồ sơ không hợp lệ: {args.profile} (có: {', '.join(TRANSFER_PROFILES)})")
+    try:
+        playlist_range = parse_playlist_range(args.playlist_items)
+    except ValueError as e:
+        raise UsageError(f"--playlist-items không hợp lệ: {e}")
+
+    extra_ydl_opts = {} if args.verbose else {
+        'quiet': True, 'no_warnings': True, 'noprogress': True, 'logger': QuietYtdlpLogger()
+    }
+    if args.no_resume:
+        extra_ydl_opts['continuedl'] = False
+
+    downloader = YouTubeDownloader(
+        progress,
+        max_concurrent_videos=args.jobs,
+        max_postprocessors=args.postprocessors,
+        transfer_profile=args.profile,
+        concurrent_fragments=args.fragments,
+        playlist_range=playlist_range,
+        extra_ydl_opts=extra_ydl_opts,
+        archive=archive,
+        metrics=metrics,
+        remux_format=args.remux,
+        audio_format=args.extract_audio,
+        embed_thumbnail=args.embed_thumbnail
+    )
+
+    def run(links, batch=None):
+        return run_planned(
+            args, links, progress, 'youtube',
+            lambda: downloader.plan_videos(links, args.output, args.format),
+            lambda plan: downloader.download_videos(links, args.output, args.format, plan, batch)
+        )
+    return run
+
+
+def build_parser():
+    from drive_engine import DEFAULT_EXPORT_PROFILE, EXPORT_PROFILES, REQUESTS_PER_SECOND
+    from youtube_engine import AUDIO_FORMATS, DEFAULT_TRANSFER_PROFILE, REMUX_FORMATS
+
+    parser = argparse.ArgumentParser(
+        prog="downloader_cli",
+        description="Tải thư mục Google Drive và video YouTube không cần giao diện."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("urls", nargs="*", help="Các liên kết cần tải")
+    common.add_argument("-i", "--input", action="append", metavar="FILE",
+                        help="File chứa danh sách liên kết, mỗi dòng một liên kết ('-' để đọc stdin)")
+    common.add_argument("-o", "--output", help="Thư mục lưu (không cần với --resume-batch/--retry-failed)")
+    common.add_argument("-j", "--jobs", type=int, default=4, help="Số mục tải song song (mặc định 4)")
+    common.add_argument("--no-resume", action="store_true", help="Không tiếp tục các file tải dở, tải lại từ đầu")
+    common.add_argument("--archive-file", metavar="FILE", help="File archive SQLite ghi nhận các mục đã tải")
+    common.add_argument("--no-archive", action="store_true", help="Không bỏ qua các mục đã tải ở lần trước")
+    common.add_argument("--dry-run", action="store_true",
+                        help="Chỉ lập kế hoạch: tổng dung lượng, thời gian dự kiến, kiểm tra chỗ trống")
+    common.add_argument("--manifest", metavar="FILE",
+                        help="File kế hoạch: nơi lưu khi --dry-run, hoặc kế hoạch dùng lại khi tải")
+    common.add_argument("--resume-batch", action="store_true",
+                        help="Chạy tiếp lô gần nhất chưa xong, với liên kết và thư mục của lô đó")
+    common.add_argument("--retry-failed", action="store_true",
+                        help="Chỉ tải lại các mục lỗi của lô gần nhất có mục lỗi")
+    common.add_argument("--limit-rate", metavar="RATE",
+                        help="Giới hạn tốc độ tải của lệnh này, ví dụ 500K, 2.5M (byte/giây)")
+    common.add_argument("--bandwidth-config", metavar="FILE",
+                        help="File JSON cấu hình băng thông (mặc định bandwidth.json trong thư mục dữ liệu)")
+    common.add_argument("--metrics-file", metavar="FILE",
+                        help="Ghi số đo thời gian/dung lượng của lần chạy (.prom: định dạng Prometheus, khác: JSON lines)")
+
+    # Không nhận tên viết tắt: `--resume` không được hiểu ngầm là `--resume-batch`
+    drive = subparsers.add_parser("drive", parents=[common], allow_abbrev=False, help="Tải thư mục Google Drive")
+    drive.add_argument("--api-key", help="Google Drive API key")
+    drive.add_argument("--api-key-file", help="File JSON chứa trường api_key")
+    drive.add_argument("--sync", action="store_true", help="Chế độ đồng bộ: bỏ qua file không thay đổi")
+    drive.add_argument("--prune", action="store_true", help="Xóa file cục bộ đã bị xóa trên Drive (cần --sync)")
+    drive.add_argument("--preallocate", action="store_true", help="Cấp phát trước dung lượng file trước khi ghi")
+    drive.add_argument("--segments", type=int, default=4,
+                       help="Số kết nối Range song song cho mỗi file lớn (1 để tắt, mặc định 4)")
+    drive.add_argument("--segment-threshold-mb", type=int, default=64,
+                       help="Kích thước tối thiểu (MB) để tải một file bằng nhiều kết nối")
+    drive.add_argument("--requests-per-second", type=float, default=REQUESTS_PER_SECOND,
+                       help="Số request tải file mỗi giây tối đa, để tránh hẳn lỗi hạn mức của Drive API "
+                            "(mặc định 0: không giới hạn, tự lùi lại khi gặp 429/403)")
+    drive.add_argument("--export-profile", default=DEFAULT_EXPORT_PROFILE,
+                       help=f"Hồ sơ xuất tài liệu Google ({', '.join(EXPORT_PROFILES)})")
+    drive.add_argument("--export", action="append", metavar="LOẠI=ĐUÔI",
+                       help="Ghi đè định dạng xuất cho một loại, ví dụ document=pdf hoặc spreadsheet=xlsx,csv")
+    drive.set_defaults(handler=setup_drive)
+
+    youtube = subparsers.add_parser(
+        "youtube", parents=[common], allow_abbrev=False, help="Tải video/playlist bằng yt-dlp"
+    )
+    youtube.add_argument("-f", "--format", default="best", help="Bộ chọn định dạng yt-dlp (mặc định best)")
+    youtube.add_argument("--profile", default=DEFAULT_TRANSFER_PROFILE, help="Hồ sơ tốc độ tải")
+    youtube.add_argument("--fragments", type=int, help="Số fragment tải song song mỗi video")
+    youtube.add_argument("--postprocessors", type=int,
+                         help="Số video hậu xử lý (ghép, remux, ...) cùng lúc, mặc định bằng số nhân CPU")
+    youtube.add_argument("--remux", choices=REMUX_FORMATS, help="Đổi container video sau khi tải (không mã hóa lại)")
+    youtube.add_argument("--extract-audio", choices=AUDIO_FORMATS, metavar="ĐỊNH_DẠNG",
+                         help=f"Chỉ giữ audio, chuyển sang định dạng này ({', '.join(AUDIO_FORMATS)})")
+    youtube.add_argument("--embed-thumbnail", action="store_true", help="Nhúng ảnh thu nhỏ vào file tải về")
+    youtube.add_argument("--playlist-items", default="", metavar="START-END",
+                         help="Chỉ tải các mục trong khoảng này của mỗi playlist, ví dụ 1-50")
+    youtube.add_argument("-v", "--verbose", action="store_true", help="Hiện log của yt-dlp")
+    youtube.set_defaults(handler=setup_youtube)
+
+    return parser
+
+
+def main(argv=None):
+    from engine_common import MetricsRegistry
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs phải lớn hơn 0")
+    if getattr(args, 'requests_per_second', 0) < 0:
+        parser.error("--requests-per-second không được âm")
+
+    reuse_batch = args.resume_batch or args.retry_failed
+    if args.resume_batch and args.retry_failed:
+        parser.error("Chỉ dùng một trong --resume-batch và --retry-failed")
+    if reuse_batch and args.dry_run:
+        parser.error("--dry-run không dùng cùng --resume-batch/--retry-failed")
+
+    try:
+        links = read_links(args)
+    except OSError as e:
+        parser.error(f"Không đọc được danh sách liên kết: {e}")
+    if reuse_batch and links:
+        parser.error("--resume-batch/--retry-failed dùng liên kết đã lưu của lô, không nhận thêm liên kết")
+    if not reuse_batch and not links:
+        parser.error("Không có liên kết nào để tải")
+    if not reuse_batch and not args.output:
+        parser.error("Thiếu thư mục lưu (-o)")
+
+    progress = ConsoleProgress()
+    archive = open_archive(args)
+    metrics = MetricsRegistry()
+    store = batch = None
+    try:
+        if not args.dry_run:
+            configure_bandwidth(args, progress)
+        # Kiểm tra mọi tham số trước khi mở lô, để lỗi tham số không để lại lô dở
+        run = args.handler(args, progress, archive, metrics)
+        if not args.dry_run:
+            store, batch = open_batch(args, links)
+            if reuse_batch:
+                links = batch.links
+                args.output = batch.output_folder
+                if 'format' in batch.options:
+                    args.format = batch.options['format']
+                progress.log(f"Tiếp tục {batch.describe()}")
+        os.makedirs(args.output, exist_ok=True)
+        try:
+            result = run(links, batch)
+        except UsageError:
+            # Lô mới chưa tải gì (ví dụ kế hoạch --manifest không khớp): đóng lại thay vì để lô dở
+            if batch is not None and not reuse_batch:
+                batch.abandon()
+            raise
+    except UsageError as e:
+        parser.exit(EXIT_USAGE, f"{parser.prog}: lỗi: {e}\n")
+    finally:
+        if archive is not None:
+            archive.close()
+        if batch is not None:
+            progress.log(batch.describe())
+            store.close()
+        if args.metrics_file:
+            metrics.export(args.metrics_file)
+            progress.log(f"Đã ghi số đo: {args.metrics_file}")
+
+    if args.dry_run:
+        plan = result
+        if not plan.fits():
+            return EXIT_FAILED
+        return EXIT_PARTIAL if plan.failed else EXIT_OK
+
+    for link, error in result.failed:
+        progress.log(f"LỖI {link}: {error}")
+    progress.log(
+        f"Thành công {result.successful}/{result.total}, lỗi {len(result.failed)}, "
+        f"bỏ qua {result.skipped} mục đã tải"
+    )
+    if result.failed:
+        progress.log("Chạy lại với --retry-failed để chỉ tải lại các mục lỗi")
+
+    if result.ok:
+        return EXIT_OK
+    if result.successful > 0:
+        return EXIT_PARTIAL
+    return EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,366 @@
 import os
+import sys
+import copy
+import queue
+import atexit
+import logging
 import threading
-from tkinter import Tk, Text, END, StringVar, filedialog, Listbox
-import ttkbootstrap as ttk
-from ttkbootstrap.constants import *
-from tkinter.messagebox import showinfo, showerror
-import requests
-from googleapiclient.discovery import build
-from yt_dlp import YoutubeDL
+import time
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# yt-dlp, googleapiclient, requests và pyperclip chỉ được nạp ở lần dùng đầu
+# (trong engine hoặc hàm dùng chúng) để cửa sổ hiện ra nhanh.
+STARTUP_STARTED = time.perf_counter()
+STARTUP_IMPORTS = {}  # Tên module -> thời gian nạp (ms) lúc khởi động
+
+
+@contextmanager
+def timed_import(name):
+    start = time.perf_counter()
+    yield
+    STARTUP_IMPORTS[name] = round((time.perf_counter() - start) * 1000, 1)
+
+
+with timed_import("tkinter"):
+    from tkinter import Tk, Text, END, StringVar, BooleanVar, filedialog, Listbox, TclError
+    import tkinter.font as tkfont
+    from tkinter.messagebox import showinfo, showerror
+    from tkinter import messagebox
+with timed_import("ttkbootstrap"):
+    import ttkbootstrap as ttk
+    from ttkbootstrap.constants import *
 import json
-from typing import Dict, List
-from tkinter import messagebox
-import pyperclip
+
+with timed_import("engine_common"):
+    from engine_common import APP_DATA_DIR, BANDWIDTH_FILE, DownloadArchive, JobStore, parse_rate, shared_shaper
+with timed_import("youtube_engine"):
+    from youtube_engine import (
+        AUDIO_FORMATS,
+        DEFAULT_TRANSFER_PROFILE,
+        REMUX_FORMATS,
+        TRANSFER_PROFILES,
+        MetadataCache,
+        YouTubeDownloader,
+        format_size,
+        parse_playlist_range,
+        summarize_batch_formats,
+    )
+
+
+LOG_DIR = os.path.join(APP_DATA_DIR, "logs")
+LOG_FILE_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+
+def open_file_log(name):
+    """Logger ghi toàn bộ lịch sử ra LOG_DIR/<name>.log (xoay vòng theo dung lượng).
+
+    Việc ghi đĩa chạy trên luồng riêng của `QueueListener`, luồng gọi chỉ
+    đẩy bản ghi vào hàng đợi.
+    """
+    logger = logging.getLogger(f"hdz.{name}")
+    if logger.handlers:
+        return logger
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    try:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        file_handler = RotatingFileHandler(
+            os.path.join(LOG_DIR, f"{name}.log"),
+            maxBytes=LOG_FILE_BYTES, backupCount=LOG_FILE_BACKUPS, encoding='utf-8'
+        )
+    except OSError:
+        logger.addHandler(logging.NullHandler())
+        return logger
+    file_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(QueueHandler(records))
+    return logger
+
+
+class LogView:
+    """Khung log ảo hóa: ring buffer `capacity` dòng gần nhất, chỉ vẽ các dòng đang thấy.
+
+    Listbox chỉ chứa đúng số dòng vừa khung nhìn; thanh cuộn và con lăn chuột
+    dịch cửa sổ nhìn trên ring buffer. Khi đang ở cuối, khung nhìn bám theo
+    dòng mới; khi người dùng cuộn lên, khung nhìn đứng yên.
+    """
+
+    def __init__(self, parent, capacity=5000, font=("Segoe UI", 9)):
+        self.lines = deque(maxlen=capacity)
+        self.first = 0  # Chỉ số (trong ring buffer) của dòng đầu khung nhìn
+        self.follow = True
+        self.frame = ttk.Frame(parent)
+        self.listbox = Listbox(self.frame, font=font, height=1)
+        self.listbox.pack(fill="both", expand=True, side="left")
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.scroll)
+        self.scrollbar.pack(side="right", fill="y")
+        self.line_height = tkfont.Font(font=font).metrics('linespace') + 2 * int(self.listbox.cget('selectborderwidth'))
+        self.visible = 1
+        self.listbox.bind("<Configure>", self._on_resize)
+        self.listbox.bind("<MouseWheel>", lambda e: self.scroll('scroll', -1 if e.delta > 0 else 1, 'units') or "break")
+        self.listbox.bind("<Button-4>", lambda e: self.scroll('scroll', -1, 'units') or "break")
+        self.listbox.bind("<Button-5>", lambda e: self.scroll('scroll', 1, 'units') or "break")
+
+    def append(self, text):
+        for line in str(text).splitlines() or [""]:
+            if len(self.lines) == self.lines.maxlen and not self.follow:
+                # Dòng cũ nhất bị đẩy khỏi buffer: giữ nguyên nội dung đang nhìn
+                self.first = max(0, self.first - 1)
+            self.lines.append(line)
+
+    def scroll(self, action, amount, unit=None):
+        """Lệnh của thanh cuộn: ('moveto', tỉ lệ) hoặc ('scroll', n, 'units'/'pages')."""
+        if action == 'moveto':
+            self.first = int(float(amount) * len(self.lines))
+        else:
+            self.first += int(amount) * (self.visible if unit == 'pages' else 3)
+        self.first = max(0, min(self.first, len(self.lines) - self.visible))
+        self.follow = self.first >= len(self.lines) - self.visible
+        self.refresh()
+
+    def refresh(self):
+        if self.follow:
+            self.first = max(0, len(self.lines) - self.visible)
+        rows = [self.lines[index] for index in range(self.first, min(len(self.lines), self.first + self.visible))]
+        self.listbox.delete(0, END)
+        self.listbox.insert(END, *rows)
+        total = max(len(self.lines), 1)
+        self.scrollbar.set(self.first / total, min(1.0, (self.first + len(rows)) / total))
+
+    def _on_resize(self, event):
+        padding = 2 * (int(self.listbox.cget('borderwidth')) + int(self.listbox.cget('highlightthickness')))
+        visible = max(1, (event.height - padding) // self.line_height)
+        if visible != self.visible:
+            self.visible = visible
+            self.refresh()
+
+
+class ItemTable:
+    """Bảng trạng thái từng mục (`ttk.Treeview`), tách khỏi log.
+
+    Mục đang tải luôn có một dòng; chỉ `capacity` mục đã xong gần nhất được
+    giữ lại, nên số dòng không tăng theo kích thước lô.
+    """
+
+    def __init__(self, parent, capacity=300, height=6):
+        self.capacity = capacity
+        self.rows = {}  # key -> iid của mục đang tải
+        self.finished = deque()
+        self.frame = ttk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, columns=("item", "status"), show="headings", height=height)
+        self.tree.heading("item", text="Mục")
+        self.tree.heading("status", text="Trạng thái")
+        self.tree.column("item", width=220, stretch=False)
+        self.tree.column("status", width=500)
+        self.tree.pack(fill="both", expand=True, side="left")
+        scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.tree.yview)
+        scrollbar.pack(side="right", fill="y")
+        self.tree.config(yscrollcommand=scrollbar.set)
+
+    def set(self, key, status):
+        iid = self.rows.get(key)
+        if iid is None:
+            iid = self.tree.insert("", END, values=(os.path.basename(str(key)) or key, status))
+            self.rows[key] = iid
+            self.tree.see(iid)
+        else:
+            self.tree.set(iid, "status", status)
+
+    def finish(self, key, status):
+        self.set(key, status)
+        self.finished.append(self.rows.pop(key))
+        while len(self.finished) > self.capacity:
+            self.tree.delete(self.finished.popleft())
+
+
+class ProgressBus:
+    """Kênh tiến trình thread-safe giữa các luồng tải và Tk main loop.
+
+    Luồng tải không bao giờ chạm vào widget: chúng đẩy dòng log (`log`), kết
+    quả cuối của một mục (`finish`) hay lời gọi UI (`call`) vào hàng đợi, còn
+    tiến trình (`update`) chỉ ghi đè bản ghi mới nhất của mục đó. Tk rút tất
+    cả theo nhịp `after()` cố định: tiến trình từng mục vào `ItemTable`, log
+    vào `LogView` (vẽ lại một lần mỗi nhịp), nên chi phí UI không phụ thuộc
+    tốc độ tải, số luồng hay độ dài lô. Toàn bộ log và kết quả từng mục được
+    ghi thêm ra file log xoay vòng `log_name`.
+    """
+
+    TICK_MS = 150
+
+    def __init__(self, log_view, item_table, log_name):
+        self.log_view = log_view
+        self.item_table = item_table
+        self.file_log = open_file_log(log_name)
+        self._events = queue.SimpleQueue()
+        self._pending = {}  # key -> (formatter, args) của bản ghi tiến trình mới nhất
+        self._lock = threading.Lock()
+        self.log_view.listbox.after(self.TICK_MS, self._drain)
+
+    def log(self, text):
+        self.file_log.info(text)
+        self._events.put(('log', None, text))
+
+    def update(self, key, formatter, *args):
+        """Ghi nhận tiến trình của `key`; `formatter(*args)` chỉ được gọi trên luồng Tk."""
+        with self._lock:
+            self._pending[key] = (formatter, args)
+
+    def finish(self, key, text):
+        """Ghi kết quả cuối của `key` vào bảng trạng thái và log."""
+        with self._lock:
+            self._pending.pop(key, None)
+        self.file_log.info(text)
+        self._events.put(('finish', key, text))
+
+    def call(self, func, *args):
+        """Chạy `func(*args)` trên luồng Tk (hộp thoại, cập nhật widget...)."""
+        self._events.put(('call', func, args))
+
+    def _drain(self):
+        try:
+            logged = False
+            while True:
+                try:
+                    kind, key, payload = self._events.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == 'log':
+                    self.log_view.append(payload)
+                    logged = True
+                elif kind == 'finish':
+                    self.item_table.finish(key, payload)
+                    self.log_view.append(payload)
+                    logged = True
+                else:
+                    key(*payload)
+
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for key, (formatter, args) in pending.items():
+                self.item_table.set(key, formatter(*args))
+
+            if logged:
+                self.log_view.refresh()
+        finally:
+            try:
+                self.log_view.listbox.after(self.TICK_MS, self._drain)
+            except TclError:
+                pass  # Cửa sổ đã đóng
+
+
+def report_plan(progress, plan, rate):
+    """Ghi kế hoạch vào thư mục tải về, in tổng kết và hiện hộp thoại (gọi từ luồng nền)."""
+    manifest_path = os.path.join(plan.output_folder, f".hdz_plan_{plan.source}.json")
+    os.makedirs(plan.output_folder, exist_ok=True)
+    plan.save(manifest_path)
+    lines = plan.summary(rate)
+    for line in lines:
+        progress.log(line)
+    progress.log(f"Đã lưu kế hoạch: {manifest_path}. Nhấn 'Bắt đầu tải xuống' để tải theo kế hoạch này.")
+    message = "\n".join(lines[:3])
+    if not plan.fits():
+        progress.call(showerror, "Không đủ dung lượng", message)
+    else:
+        progress.call(showinfo, "Kế hoạch tải", message)
+
+
+METRICS_DIR = os.path.join(APP_DATA_DIR, "metrics")
+METRICS_KEEP_RUNS = 20  # Số lần chạy gần nhất giữ lại số đo
+
+
+def save_metrics(progress, metrics, source):
+    """Ghi số đo của một lần chạy ra METRICS_DIR (JSON lines và Prometheus), xóa bớt lần cũ."""
+    run_name = f"{source}-{time.strftime('%Y%m%d-%H%M%S')}"
+    try:
+        metrics.export(os.path.join(METRICS_DIR, run_name + ".jsonl"))
+        metrics.export(os.path.join(METRICS_DIR, run_name + ".prom"))
+        runs = sorted(name for name in os.listdir(METRICS_DIR) if name.startswith(source + "-"))
+        for name in runs[:-METRICS_KEEP_RUNS * 2]:
+            os.remove(os.path.join(METRICS_DIR, name))
+    except OSError as e:
+        progress.log(f"Không ghi được số đo: {e}")
+        return
+    progress.log(f"Đã ghi số đo: {os.path.join(METRICS_DIR, run_name)}.jsonl")
+
+
+JOBS_FILE = os.path.join(APP_DATA_DIR, "jobs.sqlite3")
+
+
+def ask_resume(jobs, source):
+    """Hỏi chạy tiếp lô chưa xong của `source` từ lần mở trước; trả về lô được chọn hoặc None.
+
+    Lô bị từ chối được đóng lại để không hỏi lại lần sau.
+    """
+    for batch in jobs.unfinished_batches(source):
+        if messagebox.askyesno("Lô tải chưa xong", f"{batch.describe()}\n\nTiếp tục tải lô này?"):
+            batch.resume()
+            return batch
+        batch.abandon()
+    return None
+
+
+def take_batch(tab, jobs, source, links, output_folder, options=None):
+    """Lô cho lần tải này: lô đang chờ của `tab` nếu cùng liên kết, thư mục và tùy chọn, nếu không thì lô mới."""
+    batch, tab.batch = tab.batch, None
+    if batch is not None and batch.matches(links, output_folder) and batch.options == (options or {}):
+        tab.progress.log(f"Tiếp tục {batch.describe()}")
+        return batch
+    return jobs.create_batch(source, output_folder, links, options)
+
+
+STARTUP_REPORT_FILE = os.path.join(APP_DATA_DIR, "startup_timing.jsonl")
+
+
+def report_startup(tab_times):
+    """Thêm báo cáo khởi động (nạp module, dựng tab, khung hình đầu) vào STARTUP_REPORT_FILE.
+
+    Thời gian tính từ lúc module này bắt đầu chạy (không gồm khởi động
+    Python và giải nén của bản exe một file). Đặt HDZ_STARTUP_REPORT=1 để in
+    thêm ra stderr.
+    """
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'frozen': bool(getattr(sys, 'frozen', False)),
+        'imports_ms': STARTUP_IMPORTS,
+        'tabs_ms': tab_times,
+        'first_frame_ms': round((time.perf_counter() - STARTUP_STARTED) * 1000, 1),
+    }
+    line = json.dumps(report, ensure_ascii=False)
+    if os.environ.get("HDZ_STARTUP_REPORT"):
+        print(line, file=sys.stderr)
+    try:
+        os.makedirs(APP_DATA_DIR, exist_ok=True)
+        with open(STARTUP_REPORT_FILE, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+    except OSError:
+        pass
+
 
 class GoogleDriveTab:
     def __init__(self, parent):
+        from drive_engine import DEFAULT_EXPORT_PROFILE, EXPORT_PROFILES, REQUESTS_PER_SECOND
+
         self.parent = parent
         self.API_KEY = None
         self.show_password = False
+        self.max_workers = 4
+        self.sync_mode = False
+        self.prune_deleted = False
+        self.use_archive = True
+        self.archive = DownloadArchive(os.path.join(APP_DATA_DIR, "download_archive.sqlite3"))
+        self.jobs = JobStore(JOBS_FILE)
+        self.batch = None  # Lô chạy tiếp (lô dở hoặc mục lỗi), dùng khi tải cùng liên kết và thư mục
+        self.preallocate = False
+        self.segments = 4
+        self.requests_per_second = REQUESTS_PER_SECOND
+        self.export_profile = DEFAULT_EXPORT_PROFILE
+        self.plan = None  # Kế hoạch gần nhất, dùng lại khi tải cùng liên kết và thư mục
         
         # Main container with padding
         main_frame = ttk.Frame(parent, padding="20")
@@ -137,29 +481,134 @@ class GoogleDriveTab:
             width=12
         ).pack(side="right", padx=5)
 
-        # Download button
+        # Number of parallel download workers
+        workers_frame = ttk.Frame(main_frame)
+        workers_frame.pack(fill="x", pady=(0, 15))
+
+        ttk.Label(workers_frame, text="Số luồng tải:").pack(side="left", padx=5)
+        self.workers_var = StringVar(value=str(self.max_workers))
+        ttk.Spinbox(
+            workers_frame,
+            from_=1,
+            to=32,
+            textvariable=self.workers_var,
+            width=5
+        ).pack(side="left", padx=5)
+
+        # Parallel ranged connections for each large file
+        ttk.Label(workers_frame, text="Số kết nối mỗi file lớn:").pack(side="left", padx=5)
+        self.segments_var = StringVar(value=str(self.segments))
+        ttk.Spinbox(
+            workers_frame,
+            from_=1,
+            to=16,
+            textvariable=self.segments_var,
+            width=5
+        ).pack(side="left", padx=5)
+
+        # Optional Drive API request-rate cap (0: unlimited, rely on quota backoff)
+        ttk.Label(workers_frame, text="Request/giây:").pack(side="left", padx=5)
+        self.requests_per_second_var = StringVar(value=str(self.requests_per_second))
+        ttk.Spinbox(
+            workers_frame,
+            from_=0,
+            to=1000,
+            textvariable=self.requests_per_second_var,
+            width=5
+        ).pack(side="left", padx=5)
+
+        # Sync mode: skip unchanged files using the manifest in the output folder
+        self.sync_var = BooleanVar(value=self.sync_mode)
+        ttk.Checkbutton(
+            workers_frame,
+            text="Chế độ đồng bộ (bỏ qua file không đổi)",
+            variable=self.sync_var
+        ).pack(side="left", padx=15)
+
+        self.prune_var = BooleanVar(value=self.prune_deleted)
+        ttk.Checkbutton(
+            workers_frame,
+            text="Xóa file đã bị xóa trên Drive",
+            variable=self.prune_var
+        ).pack(side="left", padx=5)
+
+        # Skip files already downloaded in earlier runs (download archive)
+        self.archive_var = BooleanVar(value=self.use_archive)
+        ttk.Checkbutton(
+            workers_frame,
+            text="Bỏ qua file đã tải ở lần trước",
+            variable=self.archive_var
+        ).pack(side="left", padx=5)
+
+        # Reserve the full file size on disk before writing
+        self.preallocate_var = BooleanVar(value=self.preallocate)
+        ttk.Checkbutton(
+            workers_frame,
+            text="Cấp phát trước dung lượng",
+            variable=self.preallocate_var
+        ).pack(side="left", padx=5)
+
+        # Export format for Google Docs/Sheets/Slides
+        export_frame = ttk.Frame(main_frame)
+        export_frame.pack(fill="x", pady=(0, 15))
+
+        ttk.Label(export_frame, text="Xuất tài liệu Google (Docs/Sheets/Slides) dạng:").pack(side="left", padx=5)
+        self.export_profile_var = StringVar(value=self.export_profile)
+        ttk.Combobox(
+            export_frame,
+            textvariable=self.export_profile_var,
+            values=list(EXPORT_PROFILES),
+            state="readonly",
+            width=25
+        ).pack(side="left", padx=5)
+
+        # Speed cap for Drive transfers, shared with the global bandwidth limits
+        ttk.Label(export_frame, text="Giới hạn tốc độ (vd 2M, trống = không giới hạn):").pack(side="left", padx=(15, 5))
+        self.rate_limit_var = StringVar()
+        ttk.Entry(
+            export_frame,
+            textvariable=self.rate_limit_var,
+            width=10
+        ).pack(side="left", padx=5)
+
+        # Plan and download buttons
+        button_frame = ttk.Frame(main_frame)
+        button_frame.pack(pady=(0, 15))
+
         ttk.Button(
-            main_frame,
+            button_frame,
+            text="Lập kế hoạch",
+            style="info.TButton",
+            command=self.start_plan,
+            width=15
+        ).pack(side="left", padx=5)
+
+        ttk.Button(
+            button_frame,
             text="Bắt đầu tải xuống",
             style="success.TButton",
             command=self.start_download,
             width=15
-        ).pack(pady=(0, 15))
+        ).pack(side="left", padx=5)
+
+        ttk.Button(
+            button_frame,
+            text="Tải lại mục lỗi",
+            style="warning.TButton",
+            command=self.start_retry_failed,
+            width=15
+        ).pack(side="left", padx=5)
 
         # Progress section
         progress_frame = ttk.LabelFrame(main_frame, text="Tiến trình", padding="10")
         progress_frame.pack(fill="both", expand=True)
         
-        self.progress_list = Listbox(
-            progress_frame,
-            font=("Segoe UI", 9)
-        )
-        self.progress_list.pack(fill="both", expand=True, side="left")
-        
-        # Add scrollbar to progress list
-        scrollbar = ttk.Scrollbar(progress_frame, orient="vertical", command=self.progress_list.yview)
-        scrollbar.pack(side="right", fill="y")
-        self.progress_list.config(yscrollcommand=scrollbar.set)
+        # Per-item status table, then the bounded log
+        self.item_table = ItemTable(progress_frame)
+        self.item_table.frame.pack(fill="x", pady=(0, 5))
+        self.log_view = LogView(progress_frame)
+        self.log_view.frame.pack(fill="both", expand=True)
+        self.progress = ProgressBus(self.log_view, self.item_table, "drive")
 
         # Status
         self.status = StringVar()
@@ -169,6 +618,9 @@ class GoogleDriveTab:
             style="success.TLabel"
         ).pack(pady=5)
 
+        # Hỏi về lô dở từ lần mở trước sau khi tab hiện lên
+        parent.after_idle(self.offer_resume)
+
     def toggle_password_visibility(self):
         """Toggle between showing and hiding the API key"""
         self.show_password = not self.show_password
@@ -231,6 +683,8 @@ class GoogleDriveTab:
             return None
 
     def paste_from_clipboard(self):
+        import pyperclip
+
         # Lấy nội dung từ clipboard
         clipboard_content = pyperclip.paste()
 
@@ -264,184 +718,148 @@ class GoogleDriveTab:
             self.output_folder.set(os.path.basename(folder))
             self.output_folder.folder_path = folder
 
-    def start_download(self):
+    def read_settings(self):
+        """Đọc liên kết và cấu hình từ giao diện; trả về (links, output_folder) hoặc None nếu không hợp lệ."""
         if not self.API_KEY:
             showerror("Lỗi", "Vui lòng nhập API Key hoặc chọn file chứa API Key.")
-            return
+            return None
         
         links = self.link_input.get("1.0", END).strip().split("\n")
         output_folder = getattr(self.output_folder, 'folder_path', None)
 
         if not links or not output_folder:
             showerror("Lỗi", "Vui lòng nhập liên kết và chọn thư mục tải về.")
-            return
+            return None
 
-        self.status.set("Đang tải xuống...")
-        threading.Thread(target=self.download_links, args=(links, output_folder)).start()
+        try:
+            self.max_workers = max(1, int(self.workers_var.get()))
+            self.segments = max(1, int(self.segments_var.get()))
+            self.requests_per_second = max(0.0, float(self.requests_per_second_var.get()))
+        except ValueError:
+            showerror("Lỗi", "Số luồng tải, số kết nối mỗi file và số request mỗi giây phải là số dương.")
+            return None
+        try:
+            shared_shaper().set_source_limit('drive', parse_rate(self.rate_limit_var.get()))
+        except ValueError:
+            showerror("Lỗi", "Giới hạn tốc độ phải có dạng 500K, 2M hoặc để trống.")
+            return None
+        self.sync_mode = self.sync_var.get()
+        self.prune_deleted = self.sync_mode and self.prune_var.get()
+        self.use_archive = self.archive_var.get()
+        self.preallocate = self.preallocate_var.get()
+        self.export_profile = self.export_profile_var.get()
+        return links, output_folder
 
-    def download_links(self, links, output_folder):
-        total_folders = len([link for link in links if link.strip()])
-        successful_downloads = 0
-        failed_downloads = []
+    def start_download(self):
+        settings = self.read_settings()
+        if settings is None:
+            return
 
-        for link in links:
-            if not link.strip():  # Skip empty lines
-                continue
-                
-            folder_id = self.extract_folder_id(link)
-            if folder_id:
-                try:
-                    self.progress_list.insert(END, f"Bắt đầu tải thư mục: {link}")
-                    self.progress_list.yview(END)
-                    success = self.download_folder(folder_id, output_folder)
-                    if success:
-                        successful_downloads += 1
-                        self.progress_list.insert(END, f"Đã tải xong: {link}")
-                    else:
-                        failed_downloads.append((link, "Có lỗi khi tải file trong thư mục"))
-                except Exception as e:
-                    failed_downloads.append((link, str(e)))
-                    self.progress_list.insert(END, f"Lỗi khi tải thư mục: {link}\nLỗi: {e}")
-            else:
-                failed_downloads.append((link, "Không thể trích xuất ID thư mục"))
-                self.progress_list.insert(END, f"Không thể trích xuất ID từ liên kết: {link}")
+        self.status.set("Đang tải xuống...")
+        threading.Thread(target=self.download_links, args=settings).start()
 
-        # Show appropriate completion message based on results
-        if failed_downloads:
-            error_message = "Một số thư mục không tải được:\n\n"
-            for link, error in failed_downloads:
-                error_message += f"• {link}: {error}\n"
-            if successful_downloads > 0:
-                error_message += f"\nĐã tải thành công {successful_downloads}/{total_folders} thư mục."
-            showerror("Hoàn tất với lỗi", error_message)
+    def restore_batch(self, batch):
+        """Nạp lại liên kết và thư mục của `batch` vào form; lần tải tiếp theo dùng lô này."""
+        self.link_input.delete("1.0", END)
+        self.link_input.insert("1.0", "\n".join(batch.links))
+        self.output_folder.set(os.path.basename(batch.output_folder))
+        self.output_folder.folder_path = batch.output_folder
+        self.batch = batch
+
+    def offer_resume(self):
+        batch = ask_resume(self.jobs, 'drive')
+        if batch is None:
+            return
+        self.restore_batch(batch)
+        if self.API_KEY:
+            self.start_download()
         else:
-            showinfo("Hoàn tất", f"Đã tải thành công {successful_downloads} thư mục.")
-
-        self.status.set("Hoàn tất!")
-
-    def download_folder(self, folder_id, output_folder):
-        """Tải xuống toàn bộ nội dung thư mục."""
-        service = build('drive', 'v3', developerKey=self.API_KEY)
-        success = True
-        
-        def list_files_in_folder(folder_id):
-            try:
-                query = f"'{folder_id}' in parents and trashed = false"
-                results = service.files().list(
-                    q=query,
-                    fields="files(id, name, mimeType)"
-                ).execute()
-                return results.get('files', [])
-            except Exception as e:
-                self.progress_list.insert(END, f"Lỗi khi lấy danh sách file: {str(e)}")
-                return []
+            showinfo("Tiếp tục tải", "Đã nạp lại liên kết và thư mục của lô. Nhập API Key rồi nhấn 'Bắt đầu tải xuống'.")
 
-        def download_file(file_id, file_name, folder_path):
-            try:
-                url = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media&key={self.API_KEY}"
-                response = requests.get(url, stream=True)
-                
-                if response.status_code != 200:
-                    self.progress_list.insert(END, f"Lỗi khi tải {file_name}: HTTP {response.status_code}")
-                    return False
+    def start_retry_failed(self):
+        batch = self.jobs.latest_failed_batch('drive')
+        if batch is None:
+            showinfo("Tải lại mục lỗi", "Không có lô nào còn file lỗi.")
+            return
+        self.restore_batch(batch)
+        if self.read_settings() is None:
+            return
+        self.progress.log(f"Tải lại {batch.requeue_failed()} mục lỗi của lô {batch.id}")
+        self.start_download()
 
-                file_path = os.path.join(folder_path, file_name)
-                total_size = int(response.headers.get('content-length', 0))
-                
-                self.progress_list.insert(END, f"Đang tải: {file_name}")
-                self.progress_list.yview(END)
-
-                downloaded = 0
-                with open(file_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded += len(chunk)
-                            if total_size > 0:
-                                percent = (downloaded / total_size) * 100
-                                speed = downloaded / (1024 * 1024)
-                                status = f"Đang tải {file_name}: {percent:.1f}% - {speed:.1f} MB"
-                                
-                                last_index = self.progress_list.size() - 1
-                                if last_index >= 0 and file_name in self.progress_list.get(last_index):
-                                    self.progress_list.delete(last_index)
-                                self.progress_list.insert(END, status)
-                                self.progress_list.yview(END)
-
-                self.progress_list.insert(END, f"Đã tải xong: {file_name}")
-                self.progress_list.yview(END)
-                return True
+    def start_plan(self):
+        settings = self.read_settings()
+        if settings is None:
+            return
 
-            except Exception as e:
-                self.progress_list.insert(END, f"Lỗi khi tải {file_name}: {str(e)}")
-                self.progress_list.yview(END)
-                return False
+        self.status.set("Đang lập kế hoạch...")
+        threading.Thread(target=self.plan_links, args=settings).start()
+
+    def plan_links(self, links, output_folder):
+        downloader = self.make_downloader()
+        self.plan = downloader.plan_links(links, output_folder)
+        report_plan(self.progress, self.plan, downloader.throughput.rate('drive'))
+        self.progress.call(self.status.set, "Đã lập kế hoạch")
+
+    def make_downloader(self):
+        """Tạo engine tải Drive theo cấu hình hiện tại của tab."""
+        from drive_engine import EXPORT_PROFILES, DriveDownloader
+
+        return DriveDownloader(
+            self.API_KEY,
+            self.progress,
+            max_workers=self.max_workers,
+            sync_mode=self.sync_mode,
+            prune_deleted=self.prune_deleted,
+            archive=self.archive if self.use_archive else None,
+            preallocate=self.preallocate,
+            segments=self.segments,
+            export_formats=EXPORT_PROFILES[self.export_profile],
+            requests_per_second=self.requests_per_second
+        )
 
-        try:
-            files = list_files_in_folder(folder_id)
-            if not files:
-                self.progress_list.insert(END, "Không tìm thấy file nào trong thư mục")
-                return False
-
-            os.makedirs(output_folder, exist_ok=True)
-
-            download_results = []
-            for file in files:
-                if file['mimeType'] == 'application/vnd.google-apps.folder':
-                    subfolder_path = os.path.join(output_folder, file['name'])
-                    os.makedirs(subfolder_path, exist_ok=True)
-                    subfolder_success = self.download_folder(file['id'], subfolder_path)
-                    download_results.append(subfolder_success)
-                else:
-                    file_success = download_file(file['id'], file['name'], output_folder)
-                    download_results.append(file_success)
+    def download_links(self, links, output_folder):
+        plan = self.plan if self.plan is not None and self.plan.matches(links, output_folder) else None
+        self.plan = None
+        if plan is not None:
+            self.progress.log("Tải theo kế hoạch đã lập, không liệt kê lại thư mục")
+        batch = take_batch(self, self.jobs, 'drive', links, output_folder)
+        downloader = self.make_downloader()
+        result = downloader.download_links(links, output_folder, plan, batch)
+        save_metrics(self.progress, downloader.metrics, 'drive')
 
-            # Return True only if all downloads were successful
-            return all(download_results)
+        # Show appropriate completion message based on results
+        if result.failed:
+            error_message = "Một số thư mục không tải được:\n\n"
+            for link, error in result.failed:
+                error_message += f"• {link}: {error}\n"
+            if result.successful > 0:
+                error_message += f"\nĐã tải thành công {result.successful}/{result.total} thư mục."
+            self.progress.call(showerror, "Hoàn tất với lỗi", error_message)
+        else:
+            self.progress.call(showinfo, "Hoàn tất", f"Đã tải thành công {result.successful} thư mục.")
 
-        except Exception as e:
-            self.progress_list.insert(END, f"Lỗi khi tải thư mục: {str(e)}")
-            self.progress_list.yview(END)
-            return False
-
-    @staticmethod
-    def extract_folder_id(link):
-        link = link.strip()
-        folder_id = None
-        
-        if not link:
-            return None
-            
-        try:
-            # Pattern 1: /folders/FOLDER_ID
-            if "drive.google.com/drive/folders/" in link:
-                folder_id = link.split("/folders/")[1].split("?")[0].split("/")[0]
-            
-            # Pattern 2: /file/d/FOLDER_ID
-            elif "drive.google.com/file/d/" in link:
-                folder_id = link.split("/file/d/")[1].split("/")[0].split("?")[0]
-            
-            # Pattern 3: open?id=FOLDER_ID
-            elif "drive.google.com/open?id=" in link:
-                folder_id = link.split("open?id=")[1].split("&")[0]
-            
-            # Pattern 4: /u/0/folders/FOLDER_ID or /u/[NUMBER]/folders/FOLDER_ID
-            elif "drive.google.com/drive/u/" in link and "/folders/" in link:
-                folder_id = link.split("/folders/")[1].split("?")[0].split("/")[0]
-            
-            # Check if folder_id looks valid (typically 33 characters of letters, numbers, and special chars)
-            if folder_id and len(folder_id) >= 25 and all(c.isalnum() or c in "-_" for c in folder_id):
-                return folder_id
-                
-        except IndexError:
-            return None
-        return None
+        self.progress.call(self.status.set, "Hoàn tất!")
 
 class YouTubeTab:
     def __init__(self, parent):
         self.parent = parent
-        self.format_cache: Dict[str, List] = {}  # Cache for video formats
+        self.format_selectors = {}  # Nhãn định dạng chung của cả lô -> format selector
+        self.metadata_cache = MetadataCache(os.path.join(APP_DATA_DIR, "metadata_cache.sqlite3"))
         self.current_format = StringVar()                
+        self.max_concurrent_videos = 3
+        self.max_postprocessors = os.cpu_count() or 2
+        self.remux_format = None
+        self.audio_format = None
+        self.embed_thumbnail = False
+        self.transfer_profile = DEFAULT_TRANSFER_PROFILE
+        self.playlist_range = (0, None)
+        self.concurrent_fragments = TRANSFER_PROFILES[DEFAULT_TRANSFER_PROFILE]['concurrent_fragment_downloads']
+        self.use_archive = True
+        self.archive = DownloadArchive(os.path.join(APP_DATA_DIR, "download_archive.sqlite3"))
+        self.jobs = JobStore(JOBS_FILE)
+        self.batch = None  # Lô chạy tiếp (lô dở hoặc mục lỗi), dùng khi tải cùng liên kết và thư mục
+        self.plan = None  # Kế hoạch gần nhất, dùng lại khi tải cùng liên kết, thư mục và định dạng
 
         # Main container
         main_frame = ttk.Frame(parent, padding="20")
@@ -524,6 +942,113 @@ class YouTubeTab:
         self.format_combobox['values'] = ["Mặc định: Video chất lượng tốt nhất. Vui lòng nhấn 'Lấy định dạng' để xem các tùy chọn khác."]
         self.format_combobox.set("Mặc định: Video chất lượng tốt nhất. Vui lòng nhấn 'Lấy định dạng' để xem các tùy chọn khác.")     
 
+        # Concurrency settings
+        concurrency_frame = ttk.Frame(format_frame)
+        concurrency_frame.pack(fill="x", pady=5)
+
+        ttk.Label(concurrency_frame, text="Số video tải cùng lúc:").pack(side="left", padx=5)
+        self.concurrent_videos_var = StringVar(value=str(self.max_concurrent_videos))
+        ttk.Spinbox(
+            concurrency_frame,
+            from_=1,
+            to=16,
+            textvariable=self.concurrent_videos_var,
+            width=5
+        ).pack(side="left", padx=5)
+
+        ttk.Label(concurrency_frame, text="Số tác vụ ghép/hậu xử lý:").pack(side="left", padx=5)
+        self.postprocessors_var = StringVar(value=str(self.max_postprocessors))
+        ttk.Spinbox(
+            concurrency_frame,
+            from_=1,
+            to=16,
+            textvariable=self.postprocessors_var,
+            width=5
+        ).pack(side="left", padx=5)
+
+        # Transfer profile (fragment concurrency, chunk size, external downloader)
+        profile_frame = ttk.Frame(format_frame)
+        profile_frame.pack(fill="x", pady=5)
+
+        ttk.Label(profile_frame, text="Hồ sơ tốc độ:").pack(side="left", padx=5)
+        self.profile_var = StringVar(value=self.transfer_profile)
+        profile_combobox = ttk.Combobox(
+            profile_frame,
+            textvariable=self.profile_var,
+            values=list(TRANSFER_PROFILES),
+            state="readonly",
+            width=20
+        )
+        profile_combobox.pack(side="left", padx=5)
+        profile_combobox.bind("<<ComboboxSelected>>", self.on_profile_selected)
+
+        ttk.Label(profile_frame, text="Số fragment song song:").pack(side="left", padx=5)
+        self.fragments_var = StringVar(value=str(self.concurrent_fragments))
+        ttk.Spinbox(
+            profile_frame,
+            from_=1,
+            to=32,
+            textvariable=self.fragments_var,
+            width=5
+        ).pack(side="left", padx=5)
+
+        # Playlist / channel range (e.g. "1-100"), empty means every entry
+        ttk.Label(profile_frame, text="Phạm vi playlist:").pack(side="left", padx=5)
+        self.playlist_range_var = StringVar()
+        ttk.Entry(
+            profile_frame,
+            textvariable=self.playlist_range_var,
+            width=10
+        ).pack(side="left", padx=5)
+
+        # Speed cap for YouTube transfers, shared with the global bandwidth limits
+        ttk.Label(profile_frame, text="Giới hạn tốc độ:").pack(side="left", padx=5)
+        self.rate_limit_var = StringVar()
+        ttk.Entry(
+            profile_frame,
+            textvariable=self.rate_limit_var,
+            width=8
+        ).pack(side="left", padx=5)
+
+        # Skip videos already downloaded in earlier runs (download archive)
+        self.archive_var = BooleanVar(value=self.use_archive)
+        ttk.Checkbutton(
+            profile_frame,
+            text="Bỏ qua video đã tải ở lần trước",
+            variable=self.archive_var
+        ).pack(side="left", padx=15)
+
+        # Optional post-processing, run in the post-processing pool alongside merges
+        postprocess_frame = ttk.Frame(format_frame)
+        postprocess_frame.pack(fill="x", pady=5)
+
+        ttk.Label(postprocess_frame, text="Đổi container:").pack(side="left", padx=5)
+        self.remux_var = StringVar(value="Giữ nguyên")
+        ttk.Combobox(
+            postprocess_frame,
+            textvariable=self.remux_var,
+            values=["Giữ nguyên", *REMUX_FORMATS],
+            state="readonly",
+            width=10
+        ).pack(side="left", padx=5)
+
+        ttk.Label(postprocess_frame, text="Chỉ lấy audio:").pack(side="left", padx=5)
+        self.audio_var = StringVar(value="Không")
+        ttk.Combobox(
+            postprocess_frame,
+            textvariable=self.audio_var,
+            values=["Không", *AUDIO_FORMATS],
+            state="readonly",
+            width=10
+        ).pack(side="left", padx=5)
+
+        self.thumbnail_var = BooleanVar(value=self.embed_thumbnail)
+        ttk.Checkbutton(
+            postprocess_frame,
+            text="Nhúng ảnh thu nhỏ",
+            variable=self.thumbnail_var
+        ).pack(side="left", padx=15)
+
         # Folder selection
         folder_frame = ttk.Frame(main_frame)
         folder_frame.pack(fill="x", pady=(0, 15))
@@ -544,31 +1069,51 @@ class YouTubeTab:
             width=12
         ).pack(side="right", padx=5)
 
-        # Download button
+        # Plan and download buttons
+        button_frame = ttk.Frame(main_frame)
+        button_frame.pack(pady=(0, 15))
+
         ttk.Button(
-            main_frame,
+            button_frame,
+            text="Lập kế hoạch",
+            style="info.TButton",
+            command=self.start_plan,
+            width=15
+        ).pack(side="left", padx=5)
+
+        ttk.Button(
+            button_frame,
             text="Bắt đầu tải xuống",
             style="success.TButton",
             command=self.start_download,
             width=15
-        ).pack(pady=(0, 15))
+        ).pack(side="left", padx=5)
+
+        ttk.Button(
+            button_frame,
+            text="Tải lại mục lỗi",
+            style="warning.TButton",
+            command=self.start_retry_failed,
+            width=15
+        ).pack(side="left", padx=5)
 
         # Progress section
         progress_frame = ttk.LabelFrame(main_frame, text="Tiến trình", padding="10")
         progress_frame.pack(fill="both", expand=True)
         
-        self.progress_list = Listbox(
-            progress_frame,
-            font=("Segoe UI", 9)
-        )
-        self.progress_list.pack(fill="both", expand=True, side="left")
-        
-        # Add scrollbar to progress list
-        scrollbar = ttk.Scrollbar(progress_frame, orient="vertical", command=self.progress_list.yview)
-        scrollbar.pack(side="right", fill="y")
-        self.progress_list.config(yscrollcommand=scrollbar.set)
+        # Per-item status table, then the bounded log
+        self.item_table = ItemTable(progress_frame)
+        self.item_table.frame.pack(fill="x", pady=(0, 5))
+        self.log_view = LogView(progress_frame)
+        self.log_view.frame.pack(fill="both", expand=True)
+        self.progress = ProgressBus(self.log_view, self.item_table, "youtube")
+
+        # Hỏi về lô dở từ lần mở trước sau khi tab hiện lên
+        parent.after_idle(self.offer_resume)
 
     def paste_from_clipboard(self):
+        import pyperclip
+
         # Lấy nội dung từ clipboard
         clipboard_content = pyperclip.paste()
 
@@ -586,11 +1131,9 @@ class YouTubeTab:
         links = [link.strip() for link in content.splitlines() if link.strip()]  # Tạo danh sách URL
 
         if len(links) > 1:
-            # Nếu có nhiều URL, hỏi người dùng có muốn tiếp tục tải tất cả với chất lượng tốt nhất
-            messagebox.showinfo(
-                "Thông báo",
-                "Chất lượng tốt nhất sẽ được tự động chọn cho tất cả các video khi bạn nhập nhiều url"
-            )
+            # Nhiều URL: lấy metadata song song và gộp các định dạng chung
+            self.progress.log(f"Đang lấy định dạng cho {len(links)} video...")
+            threading.Thread(target=self.fetch_batch_formats, args=(links,)).start()
             return
 
         """Fetch available formats for the first video in the input"""
@@ -605,12 +1148,9 @@ class YouTubeTab:
         )
         
         try:
-            if url in self.format_cache:
-                self.update_format_combobox(self.format_cache[url])
-                return
+            from yt_dlp import YoutubeDL
 
-            self.progress_list.insert(END, f"Đang lấy danh sách định dạng cho: {url}")
-            self.progress_list.yview(END)
+            self.progress.log(f"Đang lấy danh sách định dạng cho: {url}")
 
             ydl_opts = {
                 'quiet': True,
@@ -618,7 +1158,8 @@ class YouTubeTab:
             }
 
             with YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
+                raw_info, _ = self.make_downloader().get_video_info(ydl, url)
+                info = ydl.process_ie_result(copy.deepcopy(raw_info), download=False)
                 formats = info.get('formats', [])
                 
                 # Process formats with more detailed information
@@ -674,16 +1215,58 @@ class YouTubeTab:
                     format_str = " ".join(filter(None, format_parts))
                     format_list.append(f"{format_str}")
 
-                # Cache the formats
-                self.format_cache[url] = format_list
                 self.update_format_combobox(format_list)
                 
-                self.progress_list.insert(END, f"Đã tìm thấy {len(format_list)} định dạng")
-                self.progress_list.yview(END)
+                self.progress.log(f"Đã tìm thấy {len(format_list)} định dạng")
 
         except Exception as e:
-            self.progress_list.insert(END, f"Lỗi khi lấy định dạng: {str(e)}")
-            self.progress_list.yview(END)
+            self.progress.log(f"Lỗi khi lấy định dạng: {str(e)}")
+
+    def fetch_batch_formats(self, links):
+        """Hiển thị các định dạng chung của cả lô cùng tổng dung lượng ước tính."""
+        infos, failures = self.make_downloader().probe_videos(links)
+        for link, error in failures:
+            self.progress.log(f"Lỗi khi lấy định dạng {link}: {error}")
+
+        videos = [info for info in infos if info.get('_type', 'video') == 'video']
+        choices = summarize_batch_formats(videos)
+        self.format_selectors = {}
+        format_list = []
+        for choice in choices:
+            label = (
+                f"{choice['label']} - có ở {choice['available']}/{len(videos)} video"
+                f" - tổng ~{format_size(choice['total_bytes'])}"
+            )
+            if choice['unknown']:
+                label += f" ({choice['unknown']} video chưa rõ dung lượng)"
+            self.format_selectors[label] = choice['selector']
+            format_list.append(label)
+
+        self.progress.call(self.update_format_combobox, format_list)
+        self.progress.log(
+            f"Đã lấy định dạng cho {len(infos)}/{len(links)} URL, {len(format_list)} lựa chọn chung"
+        )
+
+    def make_downloader(self):
+        """Tạo engine tải YouTube theo cấu hình hiện tại của tab."""
+        return YouTubeDownloader(
+            self.progress,
+            self.metadata_cache,
+            max_concurrent_videos=self.max_concurrent_videos,
+            max_postprocessors=self.max_postprocessors,
+            transfer_profile=self.transfer_profile,
+            concurrent_fragments=self.concurrent_fragments,
+            playlist_range=self.playlist_range,
+            archive=self.archive if self.use_archive else None,
+            remux_format=self.remux_format,
+            audio_format=self.audio_format,
+            embed_thumbnail=self.embed_thumbnail
+        )
+
+    def on_profile_selected(self, event=None):
+        """Đặt lại số fragment song song theo mặc định của hồ sơ vừa chọn."""
+        profile = TRANSFER_PROFILES.get(self.profile_var.get(), {})
+        self.fragments_var.set(str(profile.get('concurrent_fragment_downloads', 1)))
 
     def update_format_combobox(self, format_list):
         """Update the format combobox with new formats"""
@@ -713,14 +1296,104 @@ class YouTubeTab:
             except Exception as e:
                 showerror("Lỗi", f"Không thể đọc file: {str(e)}")
 
-    def start_download(self):
+    def read_settings(self):
+        """Đọc liên kết và cấu hình từ giao diện; trả về (links, output_folder) hoặc None nếu không hợp lệ."""
         links = [link.strip() for link in self.link_input.get("1.0", END).strip().split("\n") if link.strip()]
         output_folder = getattr(self.output_folder, 'folder_path', None)
-        selected_format = self.current_format.get()
 
         if not links or not output_folder:
             showerror("Lỗi", "Vui lòng nhập liên kết và chọn thư mục tải về.")
+            return None
+
+        try:
+            self.max_concurrent_videos = max(1, int(self.concurrent_videos_var.get()))
+            self.max_postprocessors = max(1, int(self.postprocessors_var.get()))
+            self.concurrent_fragments = max(1, int(self.fragments_var.get()))
+        except ValueError:
+            showerror("Lỗi", "Số video tải cùng lúc, số tác vụ hậu xử lý và số fragment phải là số nguyên dương.")
+            return None
+        self.transfer_profile = self.profile_var.get()
+        self.use_archive = self.archive_var.get()
+        self.remux_format = self.remux_var.get() if self.remux_var.get() in REMUX_FORMATS else None
+        self.audio_format = self.audio_var.get() if self.audio_var.get() in AUDIO_FORMATS else None
+        self.embed_thumbnail = self.thumbnail_var.get()
+        try:
+            shared_shaper().set_source_limit('youtube', parse_rate(self.rate_limit_var.get()))
+        except ValueError:
+            showerror("Lỗi", "Giới hạn tốc độ phải có dạng 500K, 2M hoặc để trống.")
+            return None
+        try:
+            self.playlist_range = parse_playlist_range(self.playlist_range_var.get())
+        except ValueError:
+            showerror("Lỗi", "Phạm vi playlist phải có dạng 5, 1-50 hoặc 10-.")
+            return None
+        return links, output_folder
+
+    def selected_format_id(self):
+        """Định dạng đang chọn, hoặc 'best' nếu chưa chọn."""
+        selected_format = self.current_format.get()
+        if selected_format in self.format_selectors:
+            return self.format_selectors[selected_format]
+        if "ID: " in selected_format:
+            return selected_format.split("ID: ")[1].split(" ")[0]
+        return 'best'
+
+    def restore_batch(self, batch):
+        """Nạp lại liên kết và thư mục của `batch` vào form; lần tải tiếp theo dùng lô này."""
+        self.link_input.delete("1.0", END)
+        self.link_input.insert("1.0", "\n".join(batch.links))
+        self.output_folder.set(os.path.basename(batch.output_folder))
+        self.output_folder.folder_path = batch.output_folder
+        self.batch = batch
+
+    def start_batch(self, batch, settings):
+        """Tải tiếp `batch` với cấu hình đã đọc từ form và định dạng đã lưu của lô."""
+        links, output_folder = settings
+        threading.Thread(
+            target=self.download_videos, args=(links, output_folder, batch.options.get('format', 'best'))
+        ).start()
+
+    def offer_resume(self):
+        batch = ask_resume(self.jobs, 'youtube')
+        if batch is None:
+            return
+        self.restore_batch(batch)
+        settings = self.read_settings()
+        if settings is None:
+            return
+        self.start_batch(batch, settings)
+
+    def start_retry_failed(self):
+        batch = self.jobs.latest_failed_batch('youtube')
+        if batch is None:
+            showinfo("Tải lại mục lỗi", "Không có lô nào còn video lỗi.")
+            return
+        self.restore_batch(batch)
+        settings = self.read_settings()
+        if settings is None:
             return
+        self.progress.log(f"Tải lại {batch.requeue_failed()} mục lỗi của lô {batch.id}")
+        self.start_batch(batch, settings)
+
+    def start_plan(self):
+        settings = self.read_settings()
+        if settings is None:
+            return
+
+        self.progress.log("Đang lập kế hoạch...")
+        threading.Thread(target=self.plan_videos, args=(*settings, self.selected_format_id())).start()
+
+    def plan_videos(self, links, output_folder, format_id):
+        downloader = self.make_downloader()
+        self.plan = downloader.plan_videos(links, output_folder, format_id)
+        report_plan(self.progress, self.plan, downloader.throughput.rate('youtube'))
+
+    def start_download(self):
+        settings = self.read_settings()
+        if settings is None:
+            return
+        links, output_folder = settings
+        selected_format = self.current_format.get()
 
         if not selected_format or selected_format == "Mặc định: Video chất lượng tốt nhất. Vui lòng nhấn 'Lấy định dạng' để xem các tùy chọn khác.":
             # Nếu không chọn định dạng, tải video chất lượng tốt nhất
@@ -750,6 +1423,9 @@ class YouTubeTab:
                     self.fetch_formats()
                     # Quay lại yêu cầu người dùng chọn định dạng
                     return
+        elif selected_format in self.format_selectors:
+            # Định dạng chung của cả lô
+            format_id = self.format_selectors[selected_format]
         else:
             # Extract format ID từ selected_format nếu có
             format_id = selected_format.split("ID: ")[1].split(" ")[0]
@@ -757,100 +1433,36 @@ class YouTubeTab:
         threading.Thread(target=self.download_videos, args=(links, output_folder, format_id)).start()
 
     def download_videos(self, links, output_folder, format_id):
-        ydl_opts = {
-            'outtmpl': os.path.join(output_folder, '%(title)s.%(ext)s'),
-            'progress_hooks': [self.progress_hook],
-            'format': format_id,
-            'merge_output_format': 'mp4' if not format_id.startswith('bestaudio') else 'm4a',
-        }
-        
-        total_downloads = len(links)
-        successful_downloads = 0
-        failed_downloads = []
-        
-        with YoutubeDL(ydl_opts) as ydl:
-            for link in links:
-                try:
-                    self.progress_list.insert(END, f"Bắt đầu tải video: {link}")
-                    self.progress_list.yview(END)
-                    ydl.download([link])
-                    successful_downloads += 1
-                    self.progress_list.insert(END, f"Đã tải xong: {link}")
-                    self.progress_list.yview(END)
-                except Exception as e:
-                    failed_downloads.append((link, str(e)))
-                    self.progress_list.insert(END, f"Lỗi khi tải {link}: {str(e)}")
-                    self.progress_list.yview(END)
+        plan = self.plan
+        self.plan = None
+        if plan is None or not plan.matches(links, output_folder) or plan.data.get('format') != format_id:
+            plan = None
+        else:
+            self.progress.log("Tải theo kế hoạch đã lập, không mở rộng lại playlist")
+        batch = take_batch(self, self.jobs, 'youtube', links, output_folder, {'format': format_id})
+        downloader = self.make_downloader()
+        result = downloader.download_videos(links, output_folder, format_id, plan, batch)
+        save_metrics(self.progress, downloader.metrics, 'youtube')
 
         # Show appropriate completion message based on results
-        if failed_downloads:
+        if result.failed:
             error_message = "Một số video không tải được:\n\n"
-            for link, error in failed_downloads:
+            for link, error in result.failed:
                 error_message += f"• {link}: {error}\n"
-            if successful_downloads > 0:
-                error_message += f"\nĐã tải thành công {successful_downloads}/{total_downloads} video."
-            showerror("Hoàn tất với lỗi", error_message)
+            if result.successful > 0:
+                error_message += f"\nĐã tải thành công {result.successful}/{result.total} video."
+            self.progress.call(showerror, "Hoàn tất với lỗi", error_message)
         else:
-            showinfo("Hoàn tất", f"Đã tải thành công {successful_downloads} video.")
+            message = f"Đã tải thành công {result.successful} video."
+            if result.skipped:
+                message += f"\nBỏ qua {result.skipped} video đã tải ở lần trước."
+            self.progress.call(showinfo, "Hoàn tất", message)
 
         # Reset format combobox
-        self.format_combobox['values'] = ["Mặc định: Video chất lượng tốt nhất. Vui lòng nhấn 'Lấy định dạng' để xem các tùy chọn khác."]
-        self.format_combobox.set("Mặc định: Video chất lượng tốt nhất. Vui lòng nhấn 'Lấy định dạng' để xem các tùy chọn khác.")
-    def progress_hook(self, d):
-        if d['status'] == 'downloading':
-            filename = d.get('filename', 'Tệp không xác định').split('/')[-1]
-            downloaded_bytes = d.get('downloaded_bytes', 0)
-            total_bytes = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
-            speed = d.get('speed', "Unknown")  # Gán "Unknown" nếu không có giá trị
-
-            # Kiểm tra total_bytes
-            if total_bytes == "Unknown" or not total_bytes:
-                progress = 0
-                total_str = "Unknown"
-            else:
-                progress = min((downloaded_bytes / total_bytes) * 100, 100)
-                total_str = self._format_size(total_bytes)
-
-            # Định dạng thông tin tải về
-            downloaded_str = self._format_size(downloaded_bytes)
-            speed_str = self._format_size(speed) + "/s" if speed != "Unknown" else "Unknown"
-
-            # Thời gian ước tính (ETA)
-            eta = d.get('eta', "Unknown")
-            eta_str = self._format_eta(eta) if eta != "Unknown" else "Đang tính..."
-
-            # Định dạng trạng thái hiển thị
-            status_text = f"Đang tải {filename}: {progress:.1f}% ({downloaded_str} / {total_str}) - Tốc độ: {speed_str} - {eta_str}"
-            
-            # Update only the last line if it's for the same file
-            last_index = self.progress_list.size() - 1
-            if last_index >= 0 and "Đang tải" in self.progress_list.get(last_index):
-                self.progress_list.delete(last_index)
-            
-            self.progress_list.insert(END, status_text)
-            self.progress_list.yview(END)
-
-        elif d['status'] == 'finished':
-            # Khi tải xong, hiển thị thông báo hoàn thành
-            filename = d.get('filename', 'Tệp không xác định').split('/')[-1]
-            self.progress_list.insert(END, f"Đã tải xong: {filename}")
-            self.progress_list.yview(END)
-
-    def _format_size(self, bytes_or_unknown):
-        if bytes_or_unknown == "Unknown" or not bytes_or_unknown:
-            return "Unknown"
-        bytes = bytes_or_unknown  # Đảm bảo bytes là số
-        if bytes >= 1024 * 1024 * 1024:  # >= 1GB
-            return f"{bytes / (1024 * 1024 * 1024):.2f}GB"
-        return f"{bytes / (1024 * 1024):.2f}MB"
-
-    def _format_eta(self, eta_or_unknown):
-        if eta_or_unknown == "Unknown" or not eta_or_unknown:
-            return "Đang tính..."
-        eta = eta_or_unknown  # Đảm bảo eta là số
-        eta_minutes = eta // 60
-        eta_seconds = eta % 60
-        return f"ETA: {eta_minutes:.0f} phút {eta_seconds:.0f} giây"
+        self.progress.call(
+            self.update_format_combobox,
+            ["Mặc định: Video chất lượng tốt nhất. Vui lòng nhấn 'Lấy định dạng' để xem các tùy chọn khác."]
+        )
 
 if __name__ == "__main__":
     root = ttk.Window(
@@ -861,6 +1473,13 @@ if __name__ == "__main__":
     
     style = ttk.Style()
     style.configure("TLabelframe", borderwidth=1)
+
+    # Trần băng thông tổng và hồ sơ theo giờ, dùng chung cho cả hai tab
+    if os.path.exists(BANDWIDTH_FILE):
+        try:
+            shared_shaper().load(BANDWIDTH_FILE)
+        except (OSError, ValueError) as e:
+            showerror("Lỗi", f"Không đọc được cấu hình băng thông {BANDWIDTH_FILE}: {e}")
     
     notebook = ttk.Notebook(root)
     notebook.pack(fill="both", expand=True, padx=5, pady=5)
@@ -870,8 +1489,29 @@ if __name__ == "__main__":
     
     notebook.add(youtube_tab_frame, text="YouTube")
     notebook.add(drive_tab_frame, text="Google Drive")
-    
-    YouTubeTab(youtube_tab_frame)
-    GoogleDriveTab(drive_tab_frame)
+
+    # Mỗi tab chỉ được dựng khi được chọn lần đầu
+    tab_builders = {str(youtube_tab_frame): YouTubeTab, str(drive_tab_frame): GoogleDriveTab}
+    tab_times = {}
+
+    def build_selected_tab(event=None):
+        frame = notebook.nametowidget(notebook.select())
+        builder = tab_builders.pop(str(frame), None)
+        if builder is not None:
+            start = time.perf_counter()
+            builder(frame)
+            tab_times[notebook.tab(frame, "text")] = round((time.perf_counter() - start) * 1000, 1)
+
+    first_frame = []
+
+    def on_first_frame(event):
+        # <Map> của cửa sổ gốc; báo cáo sau khi Tk vẽ xong khung hình đầu
+        if str(event.widget) == "." and not first_frame:
+            first_frame.append(True)
+            root.after_idle(report_startup, dict(tab_times))
+
+    notebook.bind("<<NotebookTabChanged>>", build_selected_tab)
+    build_selected_tab()
+    root.bind("<Map>", on_first_frame, add="+")
 
     root.mainloop()
\ No newline at end of file
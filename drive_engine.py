@@ -0,0 +1,1191 @@
+"""Engine tải thư mục Google Drive, không phụ thuộc giao diện Tk."""
+import os
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError
+
+from engine_common import BatchPlan, BatchResult, MetricsRegistry, ThroughputHistory, TokenBucket, shared_shaper
+
+# Gốc của Drive v3 API, có thể trỏ tới một máy chủ Drive giả lập khi kiểm thử
+DRIVE_API_ENDPOINT = os.environ.get("HDZ_DRIVE_API_ENDPOINT", "https://www.googleapis.com/drive/v3/")
+DRIVE_FOLDER_MIME = 'application/vnd.google-apps.folder'
+WORKSPACE_MIME_PREFIX = 'application/vnd.google-apps.'
+
+# Đuôi file -> MIME dùng với files.export
+EXPORT_MIME_TYPES = {
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'odt': 'application/vnd.oasis.opendocument.text',
+    'ods': 'application/vnd.oasis.opendocument.spreadsheet',
+    'odp': 'application/vnd.oasis.opendocument.presentation',
+    'pdf': 'application/pdf',
+    'csv': 'text/csv',
+    'txt': 'text/plain',
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+    'json': 'application/vnd.google-apps.script+json',
+}
+
+# Hồ sơ xuất tài liệu Google: MIME nguồn -> các đuôi ưu tiên theo thứ tự.
+# Loại không có trong hồ sơ (Form, Site, shortcut...) được bỏ qua.
+EXPORT_PROFILES = {
+    "Office (docx/xlsx/pptx)": {
+        'application/vnd.google-apps.document': ['docx', 'pdf'],
+        'application/vnd.google-apps.spreadsheet': ['xlsx', 'pdf'],
+        'application/vnd.google-apps.presentation': ['pptx', 'pdf'],
+        'application/vnd.google-apps.drawing': ['png', 'pdf'],
+        'application/vnd.google-apps.script': ['json'],
+    },
+    "OpenDocument": {
+        'application/vnd.google-apps.document': ['odt', 'pdf'],
+        'application/vnd.google-apps.spreadsheet': ['ods', 'pdf'],
+        'application/vnd.google-apps.presentation': ['odp', 'pdf'],
+        'application/vnd.google-apps.drawing': ['svg', 'pdf'],
+        'application/vnd.google-apps.script': ['json'],
+    },
+    "PDF": {
+        'application/vnd.google-apps.document': ['pdf'],
+        'application/vnd.google-apps.spreadsheet': ['pdf'],
+        'application/vnd.google-apps.presentation': ['pdf'],
+        'application/vnd.google-apps.drawing': ['pdf'],
+        'application/vnd.google-apps.script': ['json'],
+    },
+}
+DEFAULT_EXPORT_PROFILE = "Office (docx/xlsx/pptx)"
+
+
+def build_drive_service(api_key):
+    """Tạo một Drive service dùng chung cho cả lượt tải."""
+    from googleapiclient.discovery import build
+
+    return build(
+        'drive', 'v3',
+        developerKey=api_key,
+        client_options={'api_endpoint': DRIVE_API_ENDPOINT},
+        cache_discovery=False
+    )
+
+
+class ExportFormats:
+    """Chọn định dạng xuất cho từng loại tài liệu Google và nhớ lựa chọn theo MIME nguồn.
+
+    Lần đầu cần, danh sách định dạng Drive cho phép (`about.exportFormats`)
+    được hỏi một lần; nếu không hỏi được (API key không có quyền `about`),
+    đuôi đầu tiên trong `preferences` được dùng.
+    """
+
+    def __init__(self, preferences, service=None):
+        self.preferences = preferences
+        self.service = service
+        self._available = None
+        self._chosen = {}
+        self._lock = threading.Lock()
+
+    def choose(self, source_mime):
+        """Trả về (MIME xuất, đuôi file), hoặc None nếu loại này không xuất được."""
+        with self._lock:
+            if source_mime not in self._chosen:
+                self._chosen[source_mime] = self._resolve(source_mime)
+            return self._chosen[source_mime]
+
+    def _resolve(self, source_mime):
+        extensions = [ext for ext in self.preferences.get(source_mime, ()) if ext in EXPORT_MIME_TYPES]
+        if not extensions:
+            return None
+        if self._available is None:
+            self._available = {}
+            if self.service is not None:
+                try:
+                    about = self.service.about().get(fields="exportFormats").execute()
+                    self._available = about.get('exportFormats') or {}
+                except Exception:
+                    pass
+        allowed = self._available.get(source_mime)
+        for ext in extensions:
+            if allowed is None or EXPORT_MIME_TYPES[ext] in allowed:
+                return EXPORT_MIME_TYPES[ext], ext
+        return EXPORT_MIME_TYPES[extensions[0]], extensions[0]
+
+
+def local_name(file, export=None):
+    """Tên file trên đĩa: thêm đuôi của định dạng xuất cho tài liệu Google."""
+    if export is None or file['name'].lower().endswith('.' + export[1]):
+        return file['name']
+    return f"{file['name']}.{export[1]}"
+
+
+# Số request media mỗi giây mặc định: 0 là không giới hạn. Khi chạm hạn mức của
+# Drive API (429, 403 userRateLimitExceeded), `DriveTransport` tự lùi lại theo
+# backoff; đặt một giới hạn cố định chỉ khi muốn tránh hẳn các lỗi đó, vì nó
+# cũng là trần số file nhỏ tải được mỗi giây dù có bao nhiêu luồng.
+REQUESTS_PER_SECOND = 0
+
+
+class DriveTransport:
+    """Tầng HTTP dùng chung cho các request media của Drive.
+
+    Dùng một `requests.Session` với connection pool bằng số luồng tải, giới
+    hạn tốc độ request bằng `TokenBucket` (`requests_per_second` rỗng hoặc 0
+    để bỏ giới hạn), và tự thử lại các phản hồi 429,
+    5xx hoặc 403 `userRateLimitExceeded` với exponential backoff có jitter.
+    Khi máy chủ gửi `Retry-After`, mọi luồng cùng tạm dừng tới thời điểm đó.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    RATE_LIMIT_REASONS = {'userRateLimitExceeded', 'rateLimitExceeded'}
+
+    def __init__(self, pool_size, requests_per_second=REQUESTS_PER_SECOND, max_retries=5, backoff_base=1.0,
+                 backoff_max=64.0):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(pool_size, 1))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # Dung lượng tối thiểu 1 token: với tốc độ dưới 1 request/giây, bucket dung lượng
+        # bằng tốc độ sẽ chặn mỗi lần lấy về đúng 1 token bất kể tốc độ
+        self.bucket = TokenBucket(requests_per_second, max(1, requests_per_second)) if requests_per_second else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = 0
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def throttle(self):
+        """Chờ lượt request kế tiếp theo giới hạn tốc độ và mọi lệnh tạm dừng đang có."""
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if self.bucket is not None:
+            self.bucket.acquire()
+
+    def get(self, url, **kwargs):
+        """GET có thử lại; trả về phản hồi cuối cùng (có thể vẫn là lỗi)."""
+        for attempt in range(self.max_retries + 1):
+            self.throttle()
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                self._backoff(self._backoff_delay(attempt))
+                continue
+
+            if attempt == self.max_retries or not self._should_retry(response):
+                return response
+
+            delay = self._retry_after(response)
+            response.close()
+            self._backoff(delay if delay is not None else self._backoff_delay(attempt), pause_all=delay is not None)
+        return response
+
+    def close(self):
+        self.session.close()
+
+    def _should_retry(self, response):
+        if response.status_code in self.RETRY_STATUSES:
+            return True
+        if response.status_code == 403:
+            try:
+                body = response.json()
+            except ValueError:
+                return False
+            # `error` có thể là chuỗi (ví dụ lỗi của proxy) thay vì đối tượng lỗi của Google API
+            error = body.get('error') if isinstance(body, dict) else None
+            errors = error.get('errors') if isinstance(error, dict) else None
+            return any(
+                isinstance(item, dict) and item.get('reason') in self.RATE_LIMIT_REASONS for item in errors or []
+            )
+        return False
+
+    def _backoff_delay(self, attempt):
+        # Full jitter: ngẫu nhiên trong [0, base * 2^attempt], chặn trên bởi backoff_max
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _backoff(self, delay, pause_all=False):
+        with self._lock:
+            self.retries += 1
+            if pause_all:
+                self._resume_at = max(self._resume_at, time.monotonic() + delay)
+        time.sleep(delay)
+
+    @staticmethod
+    def _retry_after(response):
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class DriveLister:
+    """Liệt kê toàn bộ cây thư mục Drive theo từng tầng.
+
+    Mỗi tầng gom nhiều thư mục vào một truy vấn `'<id>' in parents`, dùng
+    trang lớn nhất có thể và đi theo mọi `nextPageToken`, nên số lượt gọi API
+    tỉ lệ với số tầng và số trang thay vì số thư mục.
+    """
+
+    PAGE_SIZE = 1000
+    PARENTS_PER_QUERY = 40
+    FIELDS = "nextPageToken, files(id, name, mimeType, parents, size, md5Checksum, modifiedTime)"
+
+    def __init__(self, service, transport=None, metrics=None):
+        self.service = service
+        self.transport = transport
+        self.metrics = metrics
+        self.api_calls = 0
+        self.item_count = 0
+        self.errors = []
+
+    def list_children(self, folder_ids):
+        """Trả về mọi file con của các thư mục trong `folder_ids`, qua tất cả các trang."""
+        parents = " or ".join(f"'{folder_id}' in parents" for folder_id in folder_ids)
+        query = f"({parents}) and trashed = false"
+        page_token = None
+        while True:
+            if self.transport is not None:
+                self.transport.throttle()
+            start = time.perf_counter()
+            results = self.service.files().list(
+                q=query,
+                pageSize=self.PAGE_SIZE,
+                pageToken=page_token,
+                fields=self.FIELDS,
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True
+            ).execute(num_retries=3)
+            self.api_calls += 1
+            if self.metrics is not None:
+                self.metrics.record('drive_list', time.perf_counter() - start, items=len(results.get('files', [])))
+            yield from results.get('files', [])
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return
+
+    def walk(self, root_id, root_path):
+        """Duyệt cây từ `root_id`, trả về từng cặp (file, thư mục cha cục bộ).
+
+        Thư mục con cũng được trả về để bên gọi tạo thư mục tương ứng. Lỗi khi
+        liệt kê một nhóm thư mục được ghi vào `self.errors` và không làm dừng
+        các nhóm còn lại.
+        """
+        folder_paths = {root_id: root_path}
+        level = [root_id]
+        while level:
+            next_level = []
+            for start in range(0, len(level), self.PARENTS_PER_QUERY):
+                batch = level[start:start + self.PARENTS_PER_QUERY]
+                batch_ids = set(batch)
+                try:
+                    for file in self.list_children(batch):
+                        parent_id = next((p for p in file.get('parents', []) if p in batch_ids), batch[0])
+                        parent_path = folder_paths[parent_id]
+                        if file['mimeType'] == DRIVE_FOLDER_MIME:
+                            folder_paths[file['id']] = os.path.join(parent_path, file['name'])
+                            next_level.append(file['id'])
+                        self.item_count += 1
+                        yield file, parent_path
+                except Exception as e:
+                    self.errors.append((batch, str(e)))
+            level = next_level
+
+
+class PlannedListing:
+    """Thay cho `DriveLister` khi tải theo kế hoạch: phát lại cây thư mục đã liệt kê.
+
+    `entries` là danh sách (file, thư mục cha tương đối so với thư mục tải về).
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.api_calls = 0
+        self.item_count = len(entries)
+        self.errors = []
+
+    def walk(self, root_id, root_path):
+        for file, relative_parent in self.entries:
+            yield file, os.path.normpath(os.path.join(root_path, relative_parent))
+
+
+class PartialDownload:
+    """Quản lý file `.part` và journal của một file Drive đang tải dở.
+
+    Journal `<file>.part.json` lưu id, `size`, `md5Checksum` và số byte đã
+    ghi, nhờ đó lần tải sau (hoặc lần thử lại) có thể tiếp tục bằng `Range:`.
+    MD5 được tính dần trên chính các chunk được ghi (`update`), nên không cần
+    đọc lại file sau khi tải; khi tiếp tục, hash được khởi tạo lại từ phần
+    `.part` đã có. File chỉ được đổi tên về tên thật sau khi đã kiểm tra kích
+    thước và MD5. Khi file được cấp phát trước (`open(..., preallocate=True)`),
+    số byte hợp lệ được lấy từ journal thay vì kích thước file. Khi tải nhiều
+    kết nối, journal lưu thêm tiến độ của từng đoạn (`segments`).
+    """
+
+    JOURNAL_INTERVAL = 8 * 1024 * 1024  # Ghi journal sau mỗi 8 MB
+
+    def __init__(self, file_path, file):
+        self.file_path = file_path
+        self.part_path = file_path + '.part'
+        self.journal_path = file_path + '.part.json'
+        self.file_id = file['id']
+        self.expected_size = int(file['size']) if file.get('size') else None
+        self.md5_checksum = file.get('md5Checksum')
+        self.preallocated = False
+        self.segments = None  # [[byte đầu, byte cuối, số byte đã ghi], ...] khi tải nhiều kết nối
+        self.reset()
+
+    def resume_offset(self):
+        """Số byte có thể dùng lại từ lần tải trước, 0 nếu phải tải lại từ đầu."""
+        offset = self._usable_offset()
+        if offset == 0:
+            self.reset()
+        elif offset != self.bytes_hashed:
+            # Khởi tạo hash từ phần đã tải (lần chạy trước) để tiếp tục tính trên các chunk mới;
+            # khi thử lại trong cùng lần chạy, hash đang có đã khớp với file nên không đọc lại
+            self.reset()
+            if self._md5 is not None:
+                with open(self.part_path, 'rb') as f:
+                    remaining = offset
+                    while remaining:
+                        block = f.read(min(remaining, 1024 * 1024))
+                        if not block:
+                            break
+                        self._md5.update(block)
+                        remaining -= len(block)
+            self.bytes_hashed = offset
+        return offset
+
+    def _usable_offset(self):
+        if not os.path.exists(self.part_path):
+            return 0
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            journal = {}
+
+        # File trên Drive đã thay đổi kể từ lần tải trước thì bỏ phần đã tải
+        if (journal.get('id') != self.file_id
+                or journal.get('md5Checksum') != self.md5_checksum
+                or journal.get('size') != self.expected_size):
+            self.discard()
+            return 0
+
+        offset = os.path.getsize(self.part_path)
+        self.preallocated = bool(journal.get('preallocated'))
+        self.segments = journal.get('segments') if self.preallocated else None
+        if self.preallocated:
+            # File đã có đủ kích thước từ đầu: chỉ tin phần đã ghi journal
+            offset = min(offset, journal.get('bytes_written') or 0)
+        if self.expected_size is not None and offset > self.expected_size:
+            self.discard()
+            return 0
+        return offset
+
+    def open(self, offset, total_size=None, preallocate=False):
+        """Mở file `.part` để ghi tiếp từ `offset`.
+
+        Khi bắt đầu từ đầu với `preallocate` và biết `total_size`, file được
+        cấp phát đủ kích thước ngay để hệ thống file ít phân mảnh hơn.
+        """
+        if offset:
+            f = open(self.part_path, 'r+b')
+            f.seek(offset)
+            return f
+        f = open(self.part_path, 'wb')
+        self.preallocated = bool(preallocate and total_size)
+        if self.preallocated:
+            f.truncate(total_size)
+        return f
+
+    def resume_segments(self):
+        """Các đoạn dùng lại được từ lần tải nhiều kết nối trước, hoặc None."""
+        self._usable_offset()
+        if not os.path.exists(self.part_path):
+            self.segments = None
+        return self.segments
+
+    def plan_segments(self, count):
+        """Chia file thành `count` đoạn và cấp phát trước file `.part` để các đoạn ghi vào đúng vị trí.
+
+        File nhỏ hơn `count` byte được chia thành ít đoạn hơn (mỗi đoạn ít nhất 1 byte).
+        """
+        size = self.expected_size
+        step = max(1, -(-size // max(1, min(count, size))))
+        self.segments = [[start, min(start + step, size) - 1, 0] for start in range(0, size, step)]
+        self.open(0, size, preallocate=True).close()
+        self.record(0)
+        return self.segments
+
+    def segment_bytes(self):
+        return sum(segment[2] for segment in self.segments or ())
+
+    def rehash(self):
+        """Băm lại toàn bộ file sau khi các đoạn được ghi không theo thứ tự."""
+        self.reset()
+        if self._md5 is not None:
+            with open(self.part_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    self._md5.update(block)
+        self.bytes_hashed = self.segment_bytes()
+
+    def reset(self):
+        """Bắt đầu lại hash từ byte 0 (tải lại từ đầu)."""
+        self._md5 = hashlib.md5() if self.md5_checksum else None
+        self.bytes_hashed = 0
+
+    def update(self, chunk):
+        """Cộng `chunk` vừa ghi vào hash."""
+        if self._md5 is not None:
+            self._md5.update(chunk)
+        self.bytes_hashed += len(chunk)
+
+    def record(self, bytes_written):
+        if self.segments is not None:
+            # Phần liền mạch từ đầu file, để vẫn tiếp tục được bằng một kết nối
+            bytes_written = 0
+            for start, end, done in self.segments:
+                bytes_written = start + done
+                if done < end - start + 1:
+                    break
+        with open(self.journal_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'id': self.file_id,
+                'size': self.expected_size,
+                'md5Checksum': self.md5_checksum,
+                'bytes_written': bytes_written,
+                'preallocated': self.preallocated,
+                'segments': self.segments,
+            }, f)
+
+    def verify(self):
+        """Trả về thông báo lỗi nếu file `.part` không khớp với Drive, ngược lại None."""
+        actual_size = self.bytes_hashed if self.preallocated else os.path.getsize(self.part_path)
+        if self.expected_size is not None and actual_size != self.expected_size:
+            return f"Sai kích thước: {actual_size}/{self.expected_size} byte"
+        if self._md5 is not None:
+            if self.bytes_hashed != actual_size:
+                return f"Sai MD5: chỉ băm được {self.bytes_hashed}/{actual_size} byte"
+            if self._md5.hexdigest() != self.md5_checksum:
+                return "Sai MD5"
+        return None
+
+    def finalize(self):
+        if self.preallocated and self.expected_size is None:
+            # Cấp phát theo content-length nhưng Drive không báo size: cắt phần thừa
+            with open(self.part_path, 'r+b') as f:
+                f.truncate(self.bytes_hashed)
+        os.replace(self.part_path, self.file_path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def discard(self):
+        for path in (self.part_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class SyncManifest:
+    """Manifest SQLite của chế độ đồng bộ, nằm ngay trong thư mục tải về.
+
+    Mỗi file đã tải được ghi lại theo thư mục gốc (`root_id`) cùng
+    `modifiedTime`, `size` và `md5Checksum`, để lần chạy sau bỏ qua các file
+    không đổi và tìm ra các file đã bị xóa trên Drive.
+    """
+
+    FILENAME = '.hdz_sync.sqlite3'
+
+    def __init__(self, output_folder):
+        self.output_folder = output_folder
+        self._lock = threading.Lock()
+        os.makedirs(output_folder, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(output_folder, self.FILENAME), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " root_id TEXT NOT NULL,"
+            " id TEXT NOT NULL,"
+            " path TEXT NOT NULL,"
+            " modified_time TEXT,"
+            " size INTEGER,"
+            " md5 TEXT,"
+            " synced_at REAL,"
+            " PRIMARY KEY (root_id, id))"
+        )
+        self.conn.commit()
+
+    def is_unchanged(self, root_id, file, file_path):
+        """True nếu file đã được đồng bộ và không thay đổi trên Drive lẫn trên đĩa."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT path, modified_time, size, md5 FROM files WHERE root_id = ? AND id = ?",
+                (root_id, file['id'])
+            ).fetchone()
+        if row is None:
+            return False
+        path, modified_time, size, md5 = row
+        size_now = int(file['size']) if file.get('size') else None
+        if (path != self._relpath(file_path)
+                or modified_time != file.get('modifiedTime')
+                or size != size_now
+                or md5 != file.get('md5Checksum')):
+            return False
+        if not os.path.exists(file_path):
+            return False
+        return size_now is None or os.path.getsize(file_path) == size_now
+
+    def record(self, root_id, file, file_path):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    root_id,
+                    file['id'],
+                    self._relpath(file_path),
+                    file.get('modifiedTime'),
+                    int(file['size']) if file.get('size') else None,
+                    file.get('md5Checksum'),
+                    time.time(),
+                )
+            )
+            self.conn.commit()
+
+    def prune(self, root_id, seen_ids):
+        """Xóa các file không còn trên Drive; trả về danh sách đường dẫn đã xóa."""
+        with self._lock:
+            rows = self.conn.execute("SELECT id, path FROM files WHERE root_id = ?", (root_id,)).fetchall()
+            removed = []
+            for file_id, path in rows:
+                if file_id in seen_ids:
+                    continue
+                file_path = os.path.join(self.output_folder, path)
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                    removed.append(file_path)
+                self.conn.execute("DELETE FROM files WHERE root_id = ? AND id = ?", (root_id, file_id))
+            self.conn.commit()
+        return removed
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def _relpath(self, file_path):
+        return os.path.relpath(file_path, self.output_folder)
+
+
+# Kích thước mỗi lần đọc từ socket: bắt đầu nhỏ để file nhỏ xong nhanh, nhân
+# đôi mỗi khi một lần đọc lấp đầy buffer, tối đa CHUNK_MAX
+CHUNK_MIN = 64 * 1024
+CHUNK_MAX = 4 * 1024 * 1024
+PROGRESS_INTERVAL = 0.25  # Giây giữa hai lần báo tiến trình của một file
+SEGMENT_THRESHOLD = 64 * 1024 * 1024  # File từ kích thước này được tải bằng nhiều kết nối
+
+_copy_buffers = threading.local()
+
+
+def copy_response(response, f, partial, on_progress, progress_interval=PROGRESS_INTERVAL, flow=None):
+    """Chép thân `response` vào `f`, trả về số byte đã chép.
+
+    Dữ liệu được đọc bằng `readinto` vào một buffer cấp phát sẵn, dùng lại
+    cho mọi file của cùng luồng, và được băm vào `partial` nếu có. Vòng chép chỉ ghi và băm; `on_progress(byte
+    đã chép)` được gọi tối đa mỗi `progress_interval` giây và một lần khi kết
+    thúc (kể cả khi lỗi), nên tiến trình và journal không làm chậm việc chép.
+    Với `flow` (`BandwidthFlow`), mỗi lần đọc được trừ vào phần băng thông
+    của lượt tải và cỡ đọc thu nhỏ theo phần đó.
+    """
+    buffer = getattr(_copy_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = _copy_buffers.buffer = memoryview(bytearray(CHUNK_MAX))
+    raw = response.raw
+    raw.decode_content = True  # Giải nén nếu Drive trả về gzip, giống iter_content
+    chunk_size = CHUNK_MIN
+    copied = 0
+    next_report = time.monotonic() + progress_interval
+    try:
+        while True:
+            n = raw.readinto(buffer[:chunk_size if flow is None else flow.read_size(chunk_size)])
+            if not n:
+                break
+            if flow is not None:
+                flow.consume(n)
+            chunk = buffer[:n]
+            f.write(chunk)
+            if partial is not None:
+                partial.update(chunk)
+            copied += n
+            if n == chunk_size and chunk_size < CHUNK_MAX:
+                chunk_size *= 2
+            now = time.monotonic()
+            if now >= next_report:
+                on_progress(copied)
+                next_report = now + progress_interval
+    # Chuyển lỗi urllib3 thành lỗi requests như iter_content vẫn làm
+    except ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e)
+    except ReadTimeoutError as e:
+        raise requests.exceptions.ConnectionError(e)
+    except DecodeError as e:
+        raise requests.exceptions.ContentDecodingError(e)
+    finally:
+        on_progress(copied)
+    return copied
+
+
+def archive_key(file, export=None):
+    """Khóa của file Drive trong `DownloadArchive` và phiên bản đi kèm."""
+    version = file.get('md5Checksum') or file.get('modifiedTime')
+    if export is not None:
+        # Đổi định dạng xuất thì coi như chưa tải
+        version = f"{version}:{export[1]}"
+    return f"gdrive {file['id']}", version
+
+
+def format_progress(file_name, written, total_size):
+    if total_size > 0:
+        percent = (written / total_size) * 100
+        return f"Đang tải {file_name}: {percent:.1f}% - {written / (1024 * 1024):.1f} MB"
+    return f"Đang tải {file_name}: {written / (1024 * 1024):.1f} MB"
+
+
+class DriveDownloader:
+    """Tải các thư mục Google Drive với một pool luồng, báo tiến trình qua `progress`.
+
+    `progress` là bất kỳ đối tượng nào có `log(text)`, `update(key, formatter, *args)`
+    và `finish(key, text)`, ví dụ `ProgressBus` của giao diện hay bộ in ra
+    console của `downloader_cli`. Khi có `archive` (`DownloadArchive`), file
+    đã tải ở lần chạy trước (cùng id và nội dung) được bỏ qua trước khi tải.
+    File từ `segment_threshold` byte trở lên được chia thành `segments` đoạn
+    tải song song bằng `Range:`; `segments=1` tắt chế độ này. Tài liệu Google
+    (Docs, Sheets, Slides...) được tải qua `files.export` theo `export_formats`
+    (MIME nguồn -> các đuôi ưu tiên, mặc định theo `DEFAULT_EXPORT_PROFILE`),
+    cùng pool với các file thường; loại không xuất được bị bỏ qua. Thời gian
+    liệt kê, tải từng file và từng thư mục được ghi vào `metrics`
+    (`MetricsRegistry`). Mỗi file là một lượt trong `shaper`
+    (`BandwidthShaper`, mặc định bộ chung của tiến trình), nên tốc độ tải
+    tuân theo trần băng thông chung với các lượt tải YouTube. Số request
+    media mỗi giây bị giới hạn ở `requests_per_second` (0 để bỏ giới hạn).
+    """
+
+    DOWNLOAD_ATTEMPTS = 3  # Số lần thử (tiếp tục bằng Range) khi mất kết nối
+    SKIP_REASONS = {
+        'unsupported': "không xuất được",
+        'archived': "đã tải ở lần trước",
+        'skipped': "không đổi từ lần đồng bộ trước",
+        'batched': "đã xử lý trong lô này",
+    }
+
+    def __init__(self, api_key, progress, max_workers=4, sync_mode=False, prune_deleted=False, resume=True,
+                 archive=None, preallocate=False, segments=4, segment_threshold=SEGMENT_THRESHOLD,
+                 export_formats=None, throughput=None, metrics=None, shaper=None,
+                 requests_per_second=REQUESTS_PER_SECOND):
+        self.api_key = api_key
+        self.progress = progress
+        self.max_workers = max_workers
+        self.sync_mode = sync_mode
+        self.prune_deleted = sync_mode and prune_deleted
+        self.resume = resume
+        self.archive = archive
+        self.preallocate = preallocate
+        self.segments = max(1, segments)
+        self.segment_threshold = segment_threshold
+        self.export_formats = export_formats or EXPORT_PROFILES[DEFAULT_EXPORT_PROFILE]
+        self.throughput = throughput or ThroughputHistory()
+        self.metrics = metrics or MetricsRegistry()
+        self.shaper = shaper or shared_shaper()
+        self.requests_per_second = requests_per_second
+
+    def download_links(self, links, output_folder, plan=None, batch=None):
+        """Tải lần lượt từng liên kết thư mục; trả về `BatchResult` theo thư mục.
+
+        Với `plan` (`BatchPlan` từ `plan_links`), cây thư mục đã liệt kê trong
+        kế hoạch được dùng lại thay vì gọi API liệt kê lần nữa. Với `batch`
+        (`JobBatch`), trạng thái từng file được lưu lại và file đã xử lý trong
+        lô được bỏ qua; thư mục luôn được liệt kê lại vì việc đó rẻ.
+        """
+        result = BatchResult()
+        result.total = len([link for link in links if link.strip()])
+        service = build_drive_service(self.api_key)
+        manifest = SyncManifest(output_folder) if self.sync_mode else None
+        transport = DriveTransport(self.max_workers * self.segments, self.requests_per_second)
+
+        try:
+            for link in links:
+                if not link.strip():  # Skip empty lines
+                    continue
+
+                folder_id = self.extract_folder_id(link)
+                if folder_id:
+                    try:
+                        self.progress.log(f"Bắt đầu tải thư mục: {link}")
+                        listing = plan.data['folders'].get(folder_id) if plan is not None else None
+                        success = self.download_folder(
+                            folder_id, output_folder, service, manifest, transport, listing, batch, result
+                        )
+                        if success:
+                            result.successful += 1
+                            self.progress.log(f"Đã tải xong: {link}")
+                        else:
+                            result.failed.append((link, "Có lỗi khi tải file trong thư mục"))
+                    except Exception as e:
+                        result.failed.append((link, str(e)))
+                        self.progress.log(f"Lỗi khi tải thư mục: {link}\nLỗi: {e}")
+                else:
+                    result.failed.append((link, "Không thể trích xuất ID thư mục"))
+                    self.progress.log(f"Không thể trích xuất ID từ liên kết: {link}")
+        finally:
+            if manifest is not None:
+                manifest.close()
+            transport.close()
+
+        if batch is not None:
+            batch.mark_expanded()
+            batch.complete()
+        return result
+
+    def plan_links(self, links, output_folder):
+        """Lập kế hoạch (`BatchPlan`) cho các liên kết thư mục mà không tải file nào.
+
+        Các thư mục được liệt kê song song, mỗi luồng một Drive service riêng.
+        File sẽ bị bỏ qua (archive, đồng bộ, không xuất được) được đếm riêng;
+        tài liệu Google xuất ra không biết trước dung lượng.
+        """
+        plan = BatchPlan('drive', output_folder, links)
+        plan.data['folders'] = {}
+        manifest = None
+        if self.sync_mode and os.path.exists(os.path.join(output_folder, SyncManifest.FILENAME)):
+            manifest = SyncManifest(output_folder)
+        transport = DriveTransport(self.max_workers, self.requests_per_second)
+
+        def plan_folder(link, folder_id):
+            service = build_drive_service(self.api_key)
+            exports = ExportFormats(self.export_formats, service)
+            lister = DriveLister(service, transport, self.metrics)
+            entries = []
+            for file, folder_path in lister.walk(folder_id, output_folder):
+                entries.append((file, os.path.relpath(folder_path, output_folder)))
+                if file['mimeType'] == DRIVE_FOLDER_MIME:
+                    continue
+                reason, export = self.classify(file, folder_id, folder_path, exports, manifest)
+                if reason is not None:
+                    plan.skip(self.SKIP_REASONS[reason])
+                    continue
+                file_path = os.path.join(folder_path, local_name(file, export))
+                size = int(file['size']) if file.get('size') and export is None else None
+                plan.add({'root': folder_id, 'id': file['id'], 'path': os.path.relpath(file_path, output_folder)}, size)
+            self.progress.log(f"Đã liệt kê {lister.item_count} mục ({lister.api_calls} lượt gọi API): {link}")
+            if lister.errors:
+                # Không lưu cây thiếu: lần tải thật sẽ liệt kê lại thư mục này
+                plan.failed.append((link, lister.errors[0][1]))
+            else:
+                plan.data['folders'][folder_id] = entries
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="drive-plan") as executor:
+                futures = {}
+                for link in plan.links:
+                    folder_id = self.extract_folder_id(link)
+                    if folder_id:
+                        futures[executor.submit(plan_folder, link, folder_id)] = link
+                    else:
+                        plan.failed.append((link, "Không thể trích xuất ID thư mục"))
+                for future, link in futures.items():
+                    try:
+                        future.result()
+                    except Exception as e:
+                        plan.failed.append((link, str(e)))
+        finally:
+            if manifest is not None:
+                manifest.close()
+            transport.close()
+        return plan
+
+    def classify(self, file, root_id, folder_path, exports, manifest=None):
+        """Quyết định cho một file (không phải thư mục) trong cây.
+
+        Trả về (lý do bỏ qua hoặc None, định dạng xuất hoặc None); lý do là
+        một khóa của `SKIP_REASONS`.
+        """
+        export = None
+        if file['mimeType'].startswith(WORKSPACE_MIME_PREFIX):
+            export = exports.choose(file['mimeType'])
+            if export is None:
+                # Form, Site, shortcut...: không có nội dung tải được
+                return 'unsupported', None
+        if self.archive is not None and self.archive.contains(*archive_key(file, export)):
+            return 'archived', export
+        if manifest is not None and manifest.is_unchanged(
+                root_id, file, os.path.join(folder_path, local_name(file, export))):
+            return 'skipped', export
+        return None, export
+
+    def download_folder(self, folder_id, output_folder, service=None, manifest=None, transport=None, listing=None,
+                        batch=None, result=None):
+        """Tải xuống toàn bộ nội dung thư mục.
+
+        Cây thư mục được liệt kê bởi `DriveLister` trên luồng hiện tại
+        (producer), các file được tải song song bởi một pool gồm
+        `self.max_workers` luồng (consumer). Khi có `manifest` (chế độ đồng
+        bộ), file không đổi được bỏ qua mà không tải byte nào. Mọi request đi
+        qua `transport` (`DriveTransport`) dùng chung. `listing` là cây thư mục
+        đã liệt kê sẵn trong một kế hoạch. Với `batch`, mỗi file là một mục
+        khóa `<folder_id>/<file_id>` và việc liệt kê là mục `<folder_id>/`.
+        Số file đã có trong archive được cộng vào `result.skipped` nếu có.
+        Trả về True chỉ khi việc liệt kê và mọi file đều thành công.
+        """
+        if service is None:
+            service = build_drive_service(self.api_key)
+        if transport is None:
+            transport = DriveTransport(self.max_workers * self.segments, self.requests_per_second)
+        retries_before = transport.retries
+        stats_lock = threading.Lock()
+        stats = {'files': 0, 'bytes': 0, 'skipped': 0, 'archived': 0, 'exported': 0, 'unsupported': 0, 'batched': 0}
+        exports = ExportFormats(self.export_formats, service)
+        failed_files = []
+        seen_ids = set()
+
+        def download_file(file, folder_path, export=None):
+            file_name = local_name(file, export)
+            file_path = os.path.join(folder_path, file_name)
+            partial = PartialDownload(file_path, file)
+            if not self.resume:
+                partial.discard()
+            if export is not None:
+                url = f"{DRIVE_API_ENDPOINT}files/{file['id']}/export?mimeType={quote(export[0])}&key={self.api_key}"
+            else:
+                url = f"{DRIVE_API_ENDPOINT}files/{file['id']}?alt=media&key={self.api_key}"
+            downloaded = 0
+            last_error = None
+            attempt = 1
+            succeeded = False
+            started = time.perf_counter()
+            if batch is not None:
+                batch.start(f"{folder_id}/{file['id']}")
+            # File rỗng luôn tải bằng một kết nối, kể cả khi --segment-threshold-mb 0
+            segmented = (self.segments > 1 and partial.expected_size is not None and partial.expected_size > 0
+                         and partial.expected_size >= self.segment_threshold)
+
+            def on_downloaded(n):
+                nonlocal downloaded
+                downloaded += n
+
+            flow = self.shaper.flow('drive')
+            try:
+                for attempt in range(1, self.DOWNLOAD_ATTEMPTS + 1):
+                    try:
+                        if segmented:
+                            status = self.fetch_segments(
+                                transport, url, partial, file_name, file_path, on_downloaded, flow
+                            )
+                            if status == 200:
+                                # Máy chủ bỏ qua Range: tải bằng một kết nối
+                                self.progress.log(f"Không tải nhiều kết nối được, tải tuần tự: {file_name}")
+                                segmented = False
+                                partial.discard()
+                        if not segmented:
+                            status = self.fetch_stream(
+                                transport, url, partial, file_name, file_path, on_downloaded, flow
+                            )
+                    except requests.RequestException as e:
+                        last_error = str(e)
+                        self.progress.log(
+                            f"Mất kết nối khi tải {file_name} (lần {attempt}/{self.DOWNLOAD_ATTEMPTS}): {last_error}"
+                        )
+                        continue
+
+                    if status is not None:
+                        last_error = f"HTTP {status}"
+                        self.progress.finish(file_path, f"Lỗi khi tải {file_name}: {last_error}")
+                        failed_files.append((file_name, last_error))
+                        return False
+                    if segmented:
+                        partial.rehash()
+
+                    verify_error = partial.verify()
+                    if verify_error:
+                        # Dữ liệu hỏng hoặc thiếu: bỏ phần đã tải và tải lại từ đầu
+                        partial.discard()
+                        last_error = verify_error
+                        self.progress.log(
+                            f"Kiểm tra {file_name} thất bại (lần {attempt}/{self.DOWNLOAD_ATTEMPTS}): {verify_error}"
+                        )
+                        continue
+
+                    partial.finalize()
+                    if manifest is not None:
+                        manifest.record(folder_id, file, file_path)
+                    if export is not None:
+                        with stats_lock:
+                            stats['exported'] += 1
+                    if self.archive is not None:
+                        key, version = archive_key(file, export)
+                        self.archive.add(key, version=version, title=file_name)
+                    self.progress.finish(file_path, f"Đã tải xong: {file_name}")
+                    succeeded = True
+                    return True
+
+                self.progress.finish(file_path, f"Lỗi khi tải {file_name}: {last_error}")
+                failed_files.append((file_name, last_error))
+                return False
+
+            except Exception as e:
+                last_error = str(e)
+                self.progress.finish(file_path, f"Lỗi khi tải {file_name}: {last_error}")
+                failed_files.append((file_name, last_error))
+                return False
+
+            finally:
+                flow.close()
+                with stats_lock:
+                    stats['files'] += 1
+                    stats['bytes'] += downloaded
+                if batch is not None:
+                    batch.finish(f"{folder_id}/{file['id']}", None if succeeded else last_error or "Lỗi không rõ")
+                self.metrics.record(
+                    'drive_file', time.perf_counter() - started, item=file_name,
+                    kind='export' if export is not None else ('segmented' if segmented else 'media'),
+                    status='ok' if succeeded else 'error', bytes=downloaded, retries=attempt - 1
+                )
+
+        start_time = time.monotonic()
+        # Giới hạn số file đang chờ để hàng đợi không phình to với thư mục lớn
+        pending_slots = threading.BoundedSemaphore(self.max_workers * 4)
+        # Chỉ đếm số file lỗi thay vì giữ mọi future, để bộ nhớ không tăng theo kích thước cây
+        unsuccessful = [0]
+        lister = PlannedListing(listing) if listing is not None else DriveLister(service, transport, self.metrics)
+        if batch is not None:
+            # Mục liệt kê còn chờ nếu lần chạy dừng giữa chừng, nên lô không bị đóng khi cây chưa đủ
+            batch.admit(f"{folder_id}/")
+
+        try:
+            os.makedirs(output_folder, exist_ok=True)
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="drive-download") as executor:
+                def on_done(future):
+                    pending_slots.release()
+                    if future.exception() is not None or not future.result():
+                        with stats_lock:
+                            unsuccessful[0] += 1
+
+                def submit(file, folder_path, export):
+                    pending_slots.acquire()
+                    executor.submit(download_file, file, folder_path, export).add_done_callback(on_done)
+
+                for file, folder_path in lister.walk(folder_id, output_folder):
+                    if file['mimeType'] == DRIVE_FOLDER_MIME:
+                        os.makedirs(os.path.join(folder_path, file['name']), exist_ok=True)
+                    else:
+                        reason, export = self.classify(file, folder_id, folder_path, exports, manifest)
+                        if reason == 'unsupported':
+                            self.progress.log(f"Bỏ qua {file['name']}: không xuất được loại {file['mimeType']}")
+                        else:
+                            seen_ids.add(file['id'])
+                        if reason is None and batch is not None and not batch.admit(f"{folder_id}/{file['id']}"):
+                            reason = 'batched'
+                        if reason is not None:
+                            stats[reason] += 1
+                            continue
+                        submit(file, folder_path, export)
+
+            for folder_ids, error in lister.errors:
+                self.progress.log(f"Lỗi khi lấy danh sách file: {error}")
+            if lister.item_count == 0 and not lister.errors:
+                self.progress.log("Không tìm thấy file nào trong thư mục")
+            listing_success = lister.item_count > 0 and not lister.errors
+            if batch is not None:
+                listing_error = lister.errors[0][1] if lister.errors else "Không tìm thấy file nào"
+                batch.finish(f"{folder_id}/", None if listing_success else listing_error)
+
+            # Chỉ xóa khi đã liệt kê đầy đủ, tránh xóa nhầm file khi API lỗi
+            if manifest is not None and self.prune_deleted and listing_success:
+                for removed_path in manifest.prune(folder_id, seen_ids):
+                    self.progress.log(f"Đã xóa (không còn trên Drive): {removed_path}")
+
+            elapsed = max(time.monotonic() - start_time, 1e-6)
+            self.throughput.record('drive', stats['bytes'], elapsed)
+            total_mb = stats['bytes'] / (1024 * 1024)
+            self.progress.log(
+                f"Tổng kết: {stats['files']} file, {total_mb:.1f} MB trong {elapsed:.1f} giây "
+                f"({total_mb / elapsed:.2f} MB/s), {len(failed_files)} file lỗi, "
+                f"{stats['skipped']} file không đổi được bỏ qua, "
+                f"{stats['archived']} file đã tải ở lần trước, "
+                f"{stats['batched']} file đã xử lý trong lô này, "
+                f"{stats['exported']} tài liệu Google đã xuất, "
+                f"{stats['unsupported']} mục không xuất được, "
+                f"{transport.retries - retries_before} lần thử lại, "
+                f"{lister.api_calls} lượt gọi API liệt kê"
+            )
+            for file_name, error in failed_files:
+                self.progress.log(f"• Lỗi: {file_name}: {error}")
+            if result is not None:
+                result.skipped += stats['archived']
+
+            # Return True only if all downloads were successful
+            success = listing_success and not unsuccessful[0]
+            self.metrics.record(
+                'drive_folder', elapsed, item=folder_id, status='ok' if success else 'error',
+                bytes=stats['bytes'], files=stats['files'], failed_files=len(failed_files),
+                retries=transport.retries - retries_before, list_calls=lister.api_calls
+            )
+            return success
+
+        except Exception as e:
+            self.progress.log(f"Lỗi khi tải thư mục: {str(e)}")
+            return False
+
+    def fetch_stream(self, transport, url, partial, file_name, file_path, on_downloaded, flow=None):
+        """Tải (tiếp) file bằng một kết nối, từ chỗ `partial` đã dừng.
+
+        Trả về None khi đã nhận hết dữ liệu, hoặc mã HTTP nếu máy chủ từ chối.
+        """
+        offset = partial.resume_offset()
+        partial.segments = None
+        headers = {'Range': f"bytes={offset}-"} if offset else {}
+        response = transport.get(url, headers=headers, stream=True, timeout=(10, 60))
+
+        if response.status_code == 416 and offset:
+            # Phần đã tải đã đủ, chỉ cần kiểm tra
+            response.close()
+            return None
+        if response.status_code not in (200, 206):
+            response.close()
+            return response.status_code
+
+        written = offset
+        if response.status_code == 200:
+            # Máy chủ bỏ qua Range: tải lại từ đầu
+            written = 0
+            partial.reset()
+        total_size = written + int(response.headers.get('content-length', 0))
+
+        if written:
+            self.progress.log(f"Tiếp tục tải: {file_name} từ {written / (1024 * 1024):.1f} MB")
+        self.progress.update(file_path, format_progress, file_name, written, total_size)
+
+        start = written
+        next_journal = start + PartialDownload.JOURNAL_INTERVAL
+        f = partial.open(start, total_size, self.preallocate)
+
+        def on_progress(copied):
+            nonlocal written, next_journal
+            written = start + copied
+            if written >= next_journal:
+                f.flush()
+                partial.record(written)
+                next_journal = written + PartialDownload.JOURNAL_INTERVAL
+            self.progress.update(file_path, format_progress, file_name, written, total_size)
+
+        try:
+            with f, response:
+                copy_response(response, f, partial, on_progress, flow=flow)
+        finally:
+            on_downloaded(written - start)
+            partial.record(written)
+        return None
+
+    def fetch_segments(self, transport, url, partial, file_name, file_path, on_downloaded, flow=None):
+        """Tải file lớn bằng `self.segments` kết nối `Range:` song song.
+
+        Mỗi đoạn ghi thẳng vào vị trí của nó trong file `.part` đã cấp phát
+        trước; tiến độ từng đoạn được ghi vào journal nên lần thử sau chỉ tải
+        phần còn thiếu. Trả về None khi mọi đoạn đã xong, 200 nếu máy chủ bỏ
+        qua `Range:` (không tải nhiều kết nối được), hoặc mã HTTP lỗi khác.
+        """
+        size = partial.expected_size
+        segments = partial.resume_segments()
+        if segments is None:
+            segments = partial.plan_segments(self.segments)
+        else:
+            self.progress.log(
+                f"Tiếp tục tải: {file_name} từ {partial.segment_bytes() / (1024 * 1024):.1f} MB ({len(segments)} đoạn)"
+            )
+        lock = threading.Lock()
+        next_journal = partial.segment_bytes() + PartialDownload.JOURNAL_INTERVAL
+
+        def fetch(segment):
+            start, end, done = segment
+            if start + done > end:
+                return None
+            response = transport.get(
+                url, headers={'Range': f"bytes={start + done}-{end}"}, stream=True, timeout=(10, 60)
+            )
+            if response.status_code != 206:
+                response.close()
+                return response.status_code
+
+            def on_progress(copied):
+                nonlocal next_journal
+                with lock:
+                    segment[2] = done + copied
+                    total = partial.segment_bytes()
+                    if total >= next_journal:
+                        partial.record(total)
+                        next_journal = total + PartialDownload.JOURNAL_INTERVAL
+                self.progress.update(file_path, format_progress, file_name, total, size)
+
+            try:
+                with open(partial.part_path, 'r+b') as f, response:
+                    f.seek(start + done)
+                    copy_response(response, f, None, on_progress, flow=flow)
+            finally:
+                on_downloaded(segment[2] - done)
+            return None
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(segments), thread_name_prefix="drive-segment") as executor:
+                futures = [executor.submit(fetch, segment) for segment in segments]
+            # Lỗi kết nối được ném lại để lần thử sau tiếp tục các đoạn còn thiếu
+            statuses = [future.result() for future in futures]
+        finally:
+            with lock:
+                partial.record(partial.segment_bytes())
+        return next((status for status in statuses if status is not None), None)
+
+    @staticmethod
+    def extract_folder_id(link):
+        link = link.strip()
+        folder_id = None
+        
+        if not link:
+            return None
+            
+        try:
+            # Pattern 1: /folders/FOLDER_ID
+            if "drive.google.com/drive/folders/" in link:
+                folder_id = link.split("/folders/")[1].split("?")[0].split("/")[0]
+            
+            # Pattern 2: /file/d/FOLDER_ID
+            elif "drive.google.com/file/d/" in link:
+                folder_id = link.split("/file/d/")[1].split("/")[0].split("?")[0]
+            
+            # Pattern 3: open?id=FOLDER_ID
+            elif "drive.google.com/open?id=" in link:
+                folder_id = link.split("open?id=")[1].split("&")[0]
+            
+            # Pattern 4: /u/0/folders/FOLDER_ID or /u/[NUMBER]/folders/FOLDER_ID
+            elif "drive.google.com/drive/u/" in link and "/folders/" in link:
+                folder_id = link.split("/folders/")[1].split("?")[0].split("/")[0]
+            
+            # Check if folder_id looks valid (typically 33 characters of letters, numbers, and special chars)
+            if folder_id and len(folder_id) >= 25 and all(c.isalnum() or c in "-_" for c in folder_id):
+                return folder_id
+                
+        except IndexError:
+            return None
+        return None
@@ -0,0 +1,860 @@
+"""Phần dùng chung của các engine tải (Drive, YouTube) và giao diện dòng lệnh."""
+import os
+import json
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Thư mục dữ liệu dùng chung của ứng dụng (cache, chỉ mục...)
+APP_DATA_DIR = os.environ.get("HDZ_DATA_DIR", os.path.join(os.path.expanduser("~"), ".hdz_downloader"))
+
+
+class TokenBucket:
+    """Token bucket thread-safe: tối đa `rate` token mỗi giây, dồn tối đa `capacity` token.
+
+    Bucket bắt đầu đầy, hoặc với `initial` token nếu có.
+    """
+
+    def __init__(self, rate, capacity=None, initial=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity if initial is None else float(initial)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        """Chờ cho tới khi lấy được `tokens` token; trả về số token đã lấy.
+
+        Yêu cầu lớn hơn `capacity` chỉ lấy được `capacity` token. Giới hạn này
+        tính lại sau mỗi lần chờ vì `set_rate` có thể giảm `capacity` giữa chừng.
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                wanted = min(tokens, self.capacity)
+                if self._tokens >= wanted:
+                    self._tokens -= wanted
+                    return wanted
+                wait = (wanted - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def set_rate(self, rate, capacity=None):
+        """Đổi tốc độ (và dung lượng) khi đang dùng; token đã dồn được giữ lại trong giới hạn mới."""
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+            self.capacity = float(capacity if capacity is not None else rate)
+            self._tokens = min(self._tokens, self.capacity)
+
+
+RATE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_rate(text):
+    """Tốc độ dạng `500K`, `2.5M`, `1G` (byte/giây, cơ số 1024) hoặc số byte.
+
+    Trả về None (không giới hạn) với chuỗi rỗng hoặc 0; ValueError nếu sai dạng.
+    """
+    text = str(text if text is not None else "").strip().upper().removesuffix("/S").removesuffix("B")
+    if not text:
+        return None
+    unit = text[-1] if text[-1] in RATE_UNITS else ''
+    try:
+        rate = float(text[:len(text) - len(unit)]) * RATE_UNITS[unit]
+    except ValueError:
+        raise ValueError(f"Tốc độ không hợp lệ: {text}")
+    if rate < 0:
+        raise ValueError(f"Tốc độ không hợp lệ: {text}")
+    return rate or None
+
+
+def parse_clock(text):
+    """'HH:MM' -> số phút từ nửa đêm."""
+    hours, sep, minutes = str(text).partition(":")
+    try:
+        value = int(hours) * 60 + int(minutes or 0)
+    except ValueError:
+        value = -1
+    if not 0 <= value <= 24 * 60:
+        raise ValueError(f"Giờ không hợp lệ: {text} (cần dạng HH:MM)")
+    return value
+
+
+class BandwidthFlow:
+    """Một lượt truyền (một file Drive, một video) trong `BandwidthShaper`.
+
+    `rate` là phần băng thông hiện tại của lượt (None: không giới hạn).
+    Bên tự đọc dữ liệu (Drive) gọi `consume` sau mỗi lần đọc; bên tự giới
+    hạn tốc độ (yt-dlp) nhận phần mới qua `on_rate(rate)`.
+    """
+
+    # Tối thiểu mỗi lần đọc khi bị giới hạn, và số lần đọc mỗi giây nhắm tới
+    MIN_READ = 16 * 1024
+    READS_PER_SECOND = 4
+
+    def __init__(self, shaper, source, weight, on_rate=None):
+        self.shaper = shaper
+        self.source = source
+        self.weight = weight
+        self.on_rate = on_rate
+        self.rate = None
+        self.bucket = None
+        if on_rate is not None:
+            on_rate(None)
+
+    def set_rate(self, rate):
+        self.rate = rate
+        if rate is not None:
+            capacity = max(rate / self.READS_PER_SECOND, self.MIN_READ)
+            if self.bucket is None:
+                # Bắt đầu rỗng: lượt mới không được dồn một đợt vượt phần của mình
+                self.bucket = TokenBucket(rate, capacity, initial=0)
+            else:
+                self.bucket.set_rate(rate, capacity)
+        if self.on_rate is not None:
+            self.on_rate(rate)
+
+    def read_size(self, size):
+        """Cỡ đọc phù hợp với phần băng thông, để tốc độ đều thay vì từng đợt lớn."""
+        rate = self.rate
+        if rate is None:
+            return size
+        return max(self.MIN_READ, min(size, int(rate / self.READS_PER_SECOND)))
+
+    def consume(self, n):
+        """Trừ `n` byte vừa đọc vào phần của lượt, chờ nếu vượt."""
+        self.shaper.poll()
+        bucket = self.bucket if self.rate is not None else None
+        if bucket is None:
+            return
+        while n > 0:
+            n -= bucket.acquire(n)
+
+    def close(self):
+        self.shaper.leave(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BandwidthShaper:
+    """Bộ chia băng thông dùng chung cho mọi lượt tải của tiến trình (Drive và YouTube).
+
+    Có trần tổng `limit`, trần riêng từng nguồn `source_limits` và các hồ sơ
+    theo giờ `schedule` (ghi đè trần trong khung giờ, có thể chỉ vài ngày
+    trong tuần). Băng thông được chia cho các lượt đang chạy theo trọng số:
+    mỗi nguồn nhận phần tổng theo tổng trọng số các lượt của nó, nguồn chạm
+    trần riêng nhường phần dư cho nguồn khác, rồi phần của nguồn chia cho
+    các lượt theo trọng số (`weights`, mặc định 1). Phần được tính lại khi
+    có lượt vào/ra, khi đổi cấu hình và khi sang khung giờ khác.
+    """
+
+    CHECK_INTERVAL = 15  # Giây giữa hai lần xem lại khung giờ
+
+    def __init__(self, limit=None, source_limits=None, schedule=None, weights=None):
+        self._lock = threading.Lock()
+        self._flows = []
+        self.extra_limits = {}  # Trần đặt thêm từ giao diện/dòng lệnh, áp dụng cùng cấu hình
+        self.configure(limit, source_limits, schedule, weights)
+
+    def configure(self, limit=None, source_limits=None, schedule=None, weights=None):
+        """Đặt lại toàn bộ cấu hình; các giá trị tốc độ là byte/giây hoặc chuỗi cho `parse_rate`."""
+        profiles = []
+        for entry in schedule or []:
+            days = entry.get('days')
+            if days is not None and not all(isinstance(day, int) and 0 <= day <= 6 for day in days):
+                raise ValueError(f"'days' phải là danh sách số 0-6 (thứ Hai là 0): {days}")
+            profile = {
+                'start': parse_clock(entry['start']),
+                'end': parse_clock(entry['end']),
+                'days': days,
+                'label': f"{entry['start']}-{entry['end']}",
+                'sources': {source: parse_rate(rate) for source, rate in (entry.get('sources') or {}).items()},
+            }
+            if 'limit' in entry:
+                profile['limit'] = parse_rate(entry['limit'])
+            profiles.append(profile)
+        weights = dict(weights or {})
+        if not all(isinstance(weight, (int, float)) and weight > 0 for weight in weights.values()):
+            raise ValueError(f"Trọng số phải là số dương: {weights}")
+        with self._lock:
+            self.limit = parse_rate(limit)
+            self.source_limits = {source: parse_rate(rate) for source, rate in (source_limits or {}).items()}
+            self.schedule = profiles
+            self.weights = weights
+            self._next_check = 0.0
+        self.rebalance()
+
+    def load(self, path):
+        """Đọc cấu hình từ file JSON: {"limit", "sources", "weights", "schedule": [{"start", "end", "days", "limit", "sources"}]}."""
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        try:
+            self.configure(config.get('limit'), config.get('sources'), config.get('schedule'), config.get('weights'))
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Cấu hình băng thông không hợp lệ: {e!r}")
+
+    def set_source_limit(self, source, rate):
+        """Đặt thêm trần cho `source` (None: bỏ), ngoài trần trong cấu hình; trần thấp hơn được áp dụng."""
+        with self._lock:
+            self.extra_limits[source] = rate
+        self.rebalance()
+
+    def active_profile(self, now=None):
+        """Hồ sơ theo giờ đang áp dụng, hoặc None."""
+        now = time.localtime(now)
+        minute = now.tm_hour * 60 + now.tm_min
+        for profile in self.schedule:
+            start, end = profile['start'], profile['end']
+            inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+            # Khung qua nửa đêm thuộc về ngày bắt đầu
+            weekday = now.tm_wday if start <= end or minute >= start else (now.tm_wday - 1) % 7
+            if inside and (profile['days'] is None or weekday in profile['days']):
+                return profile
+        return None
+
+    def current_limits(self, now=None):
+        """(trần tổng, trần theo nguồn, nhãn hồ sơ) đang áp dụng."""
+        profile = self.active_profile(now)
+        limit, source_limits = self.limit, dict(self.source_limits)
+        if profile is not None:
+            if 'limit' in profile:
+                limit = profile['limit']
+            source_limits.update(profile['sources'])
+        for source, rate in self.extra_limits.items():
+            if rate is not None:
+                source_limits[source] = min(rate, source_limits.get(source) or rate)
+        return limit, source_limits, profile['label'] if profile is not None else None
+
+    def describe(self):
+        limit, source_limits, label = self.current_limits()
+        parts = [f"tổng {format_bytes(limit)}/s"] if limit else []
+        parts += [f"{source} {format_bytes(rate)}/s" for source, rate in sorted(source_limits.items()) if rate]
+        if not parts:
+            return "Băng thông: không giới hạn" + (f" (hồ sơ {label})" if label else "")
+        return "Giới hạn băng thông: " + ", ".join(parts) + (f" (hồ sơ {label})" if label else "")
+
+    def flow(self, source, weight=None, on_rate=None):
+        """Đăng ký một lượt truyền của `source`; dùng với `with` để tự rời khi xong."""
+        flow = BandwidthFlow(self, source, weight if weight is not None else self.weights.get(source, 1), on_rate)
+        with self._lock:
+            self._flows.append(flow)
+        self.rebalance()
+        return flow
+
+    def leave(self, flow):
+        with self._lock:
+            if flow not in self._flows:
+                return
+            self._flows.remove(flow)
+        self.rebalance()
+
+    def poll(self):
+        """Tính lại phần khi sang khung giờ khác (gọi thường xuyên, rẻ khi chưa tới hạn)."""
+        if time.monotonic() < self._next_check:
+            return
+        self.rebalance()
+
+    def rebalance(self):
+        with self._lock:
+            self._next_check = time.monotonic() + self.CHECK_INTERVAL
+            limit, source_limits, _ = self.current_limits()
+            weights = {}
+            for flow in self._flows:
+                weights[flow.source] = weights.get(flow.source, 0) + flow.weight
+            shares = {}
+            remaining = dict(weights)
+            budget = limit
+            while remaining:
+                total = sum(remaining.values())
+                capped = [
+                    source for source, weight in remaining.items()
+                    if source_limits.get(source) is not None
+                    and (budget is None or source_limits[source] <= budget * weight / total)
+                ]
+                if not capped:
+                    for source, weight in remaining.items():
+                        shares[source] = None if budget is None else budget * weight / total
+                    break
+                for source in capped:
+                    shares[source] = source_limits[source]
+                    if budget is not None:
+                        budget -= source_limits[source]
+                    del remaining[source]
+            updates = [
+                (flow, None if shares[flow.source] is None else shares[flow.source] * flow.weight / weights[flow.source])
+                for flow in self._flows
+            ]
+        for flow, rate in updates:
+            if rate != flow.rate:
+                flow.set_rate(rate)
+
+
+_SHARED_SHAPER = None
+_SHARED_SHAPER_LOCK = threading.Lock()
+
+
+def shared_shaper():
+    """`BandwidthShaper` dùng chung của tiến trình (ban đầu không giới hạn)."""
+    global _SHARED_SHAPER
+    with _SHARED_SHAPER_LOCK:
+        if _SHARED_SHAPER is None:
+            _SHARED_SHAPER = BandwidthShaper()
+        return _SHARED_SHAPER
+
+
+# File cấu hình băng thông mặc định (trần tổng, trần theo nguồn, hồ sơ theo giờ)
+BANDWIDTH_FILE = os.path.join(APP_DATA_DIR, "bandwidth.json")
+
+
+class BatchResult:
+    """Kết quả của một lô tải: tổng số mục, số mục thành công, số mục bỏ qua và danh sách lỗi."""
+
+    def __init__(self):
+        self.total = 0
+        self.successful = 0
+        self.skipped = 0  # Mục đã có trong archive, không tính vào `total`
+        self.failed = []  # (mục, lỗi)
+
+    @property
+    def ok(self):
+        return not self.failed
+
+
+class DownloadArchive:
+    """Chỉ mục các mục đã tải qua mọi lần chạy, lưu trong SQLite.
+
+    Khóa có dạng `<nguồn> <id>` giống file archive của yt-dlp: `youtube X` cho
+    video (id chuẩn của extractor) và `gdrive <file id>` cho file Drive. Tra
+    cứu theo khóa chính nên vẫn nhanh với hàng trăm nghìn mục. Đối tượng có
+    `__contains__` và `add` nên truyền thẳng được vào tham số
+    `download_archive` của YoutubeDL. URL đã gặp được lưu làm bí danh để các
+    cách viết URL khác nhau của cùng một mục đều được nhận ra.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            " key TEXT PRIMARY KEY,"
+            " version TEXT,"
+            " title TEXT,"
+            " archived_at REAL NOT NULL) WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS aliases (url TEXT PRIMARY KEY, key TEXT NOT NULL) WITHOUT ROWID")
+        self.conn.commit()
+
+    def __bool__(self):
+        # YoutubeDL bỏ qua kiểm tra archive khi đối tượng "rỗng"
+        return True
+
+    def __contains__(self, key):
+        return self.contains(key)
+
+    def contains(self, key, version=None):
+        """True nếu `key` đã được tải; khi có `version`, phiên bản cũng phải khớp."""
+        if key is None:
+            return False
+        with self._lock:
+            row = self.conn.execute("SELECT version FROM items WHERE key = ?", (key,)).fetchone()
+        return row is not None and (version is None or row[0] == version)
+
+    def key_for_url(self, url):
+        """Khóa đã ghi nhận cho `url`, hoặc None."""
+        with self._lock:
+            row = self.conn.execute("SELECT key FROM aliases WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, key, version=None, title=None, urls=()):
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO items VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET"
+                " version = COALESCE(excluded.version, version),"
+                " title = COALESCE(excluded.title, title),"
+                " archived_at = excluded.archived_at",
+                (key, version, title, time.time())
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO aliases VALUES (?, ?)",
+                [(url, key) for url in urls]
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class JobStore:
+    """Hàng đợi việc bền vững của các lô tải dài, lưu trong SQLite (WAL).
+
+    Mỗi lô (`JobBatch`) ghi lại nguồn, thư mục đích, liên kết và tùy chọn;
+    mỗi mục (URL video, file Drive) là một việc với trạng thái queued,
+    running, done hoặc failed, số lần thử và lỗi gần nhất. Trạng thái được
+    ghi ngay khi đổi nên ứng dụng đóng hay bị crash giữa lô vẫn tiếp tục được
+    từ chỗ dừng (`unfinished_batches`, `JobBatch.resume`).
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            " id INTEGER PRIMARY KEY,"
+            " source TEXT NOT NULL,"
+            " output_folder TEXT NOT NULL,"
+            " links TEXT NOT NULL,"
+            " options TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " expanded INTEGER NOT NULL DEFAULT 0,"
+            " finished REAL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " seq INTEGER PRIMARY KEY,"
+            " batch_id INTEGER NOT NULL,"
+            " key TEXT NOT NULL,"
+            " state TEXT NOT NULL DEFAULT 'queued',"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " last_error TEXT,"
+            " updated REAL NOT NULL,"
+            " UNIQUE (batch_id, key))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (batch_id, state)")
+        self.conn.commit()
+
+    def execute(self, sql, params=()):
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+            self.conn.commit()
+        return rows
+
+    def create_batch(self, source, output_folder, links, options=None):
+        links = [link.strip() for link in links if link.strip()]
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO batches (source, output_folder, links, options, created) VALUES (?, ?, ?, ?, ?)",
+                (source, os.path.abspath(output_folder), json.dumps(links), json.dumps(options or {}), time.time())
+            )
+            self.conn.commit()
+        return self.open_batch(cursor.lastrowid)
+
+    def open_batch(self, batch_id):
+        rows = self.execute(
+            "SELECT id, source, output_folder, links, options, created, expanded FROM batches WHERE id = ?",
+            (batch_id,)
+        )
+        return JobBatch(self, *rows[0]) if rows else None
+
+    def unfinished_batches(self, source):
+        """Các lô chưa xong của `source`, mới nhất trước."""
+        rows = self.execute("SELECT id FROM batches WHERE source = ? AND finished IS NULL ORDER BY id DESC", (source,))
+        return [self.open_batch(row[0]) for row in rows]
+
+    def latest_failed_batch(self, source):
+        """Lô gần nhất của `source` còn mục lỗi, hoặc None."""
+        rows = self.execute(
+            "SELECT batch_id FROM jobs JOIN batches ON batches.id = jobs.batch_id"
+            " WHERE source = ? AND state = 'failed' ORDER BY batch_id DESC LIMIT 1",
+            (source,)
+        )
+        return self.open_batch(rows[0][0]) if rows else None
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class JobBatch:
+    """Một lô trong `JobStore`. Engine gọi `admit` khi gặp một mục, rồi `start`/`finish` quanh lúc tải."""
+
+    def __init__(self, store, batch_id, source, output_folder, links, options, created, expanded):
+        self.store = store
+        self.id = batch_id
+        self.source = source
+        self.output_folder = output_folder
+        self.links = json.loads(links)
+        self.options = json.loads(options)
+        self.created = created
+        self.expanded = bool(expanded)
+
+    def matches(self, links, output_folder):
+        """True nếu lô được tạo cho đúng các liên kết và thư mục này."""
+        return (self.links == [link.strip() for link in links if link.strip()]
+                and self.output_folder == os.path.abspath(output_folder))
+
+    def admit(self, key):
+        """Ghi nhận mục `key` (nếu chưa có); True nếu mục cần tải (đang ở trạng thái queued).
+
+        Mục đã xong hoặc đã lỗi ở lần chạy trước không được tải lại tự động;
+        mục lỗi chỉ chạy lại sau `requeue_failed`.
+        """
+        with self.store._lock:
+            self.store.conn.execute(
+                "INSERT OR IGNORE INTO jobs (batch_id, key, updated) VALUES (?, ?, ?)", (self.id, key, time.time())
+            )
+            row = self.store.conn.execute(
+                "SELECT state FROM jobs WHERE batch_id = ? AND key = ?", (self.id, key)
+            ).fetchone()
+            self.store.conn.commit()
+        return row[0] == 'queued'
+
+    def start(self, key):
+        self.store.execute(
+            "UPDATE jobs SET state = 'running', attempts = attempts + 1, updated = ? WHERE batch_id = ? AND key = ?",
+            (time.time(), self.id, key)
+        )
+
+    def finish(self, key, error=None):
+        self.store.execute(
+            "UPDATE jobs SET state = ?, last_error = ?, updated = ? WHERE batch_id = ? AND key = ?",
+            ('failed' if error else 'done', error, time.time(), self.id, key)
+        )
+
+    def pending(self):
+        """Khóa các mục còn chờ tải, theo thứ tự được ghi nhận."""
+        rows = self.store.execute(
+            "SELECT key FROM jobs WHERE batch_id = ? AND state = 'queued' ORDER BY seq", (self.id,)
+        )
+        return [row[0] for row in rows]
+
+    def counts(self):
+        rows = self.store.execute(
+            "SELECT state, COUNT(*) FROM jobs WHERE batch_id = ? GROUP BY state", (self.id,)
+        )
+        counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        counts.update(dict(rows))
+        return counts
+
+    def failures(self):
+        """(khóa, số lần thử, lỗi gần nhất) của các mục lỗi."""
+        return self.store.execute(
+            "SELECT key, attempts, last_error FROM jobs WHERE batch_id = ? AND state = 'failed' ORDER BY seq",
+            (self.id,)
+        )
+
+    def mark_expanded(self):
+        """Đánh dấu đã liệt kê/mở rộng đủ mọi liên kết: lần tiếp tục chỉ cần `pending()`."""
+        self.expanded = True
+        self.store.execute("UPDATE batches SET expanded = 1 WHERE id = ?", (self.id,))
+
+    def resume(self):
+        """Chuẩn bị chạy tiếp: mục đang chạy dở khi ứng dụng dừng được đưa về hàng đợi."""
+        self.store.execute(
+            "UPDATE jobs SET state = 'queued', updated = ? WHERE batch_id = ? AND state = 'running'",
+            (time.time(), self.id)
+        )
+        self.store.execute("UPDATE batches SET finished = NULL WHERE id = ?", (self.id,))
+
+    def requeue_failed(self):
+        """Đưa các mục lỗi về hàng đợi; trả về số mục."""
+        with self.store._lock:
+            count = self.store.conn.execute(
+                "UPDATE jobs SET state = 'queued', updated = ? WHERE batch_id = ? AND state = 'failed'",
+                (time.time(), self.id)
+            ).rowcount
+            self.store.conn.commit()
+        self.resume()
+        return count
+
+    def complete(self):
+        """Đóng lô nếu đã liệt kê đủ và không còn mục chờ; trả về True nếu đã đóng."""
+        counts = self.counts()
+        if not self.expanded or counts['queued'] or counts['running']:
+            return False
+        self.abandon()
+        return True
+
+    def abandon(self):
+        """Đóng lô, không tiếp tục nữa (các mục vẫn được giữ để xem lại)."""
+        self.store.execute("UPDATE batches SET finished = ? WHERE id = ?", (time.time(), self.id))
+
+    def describe(self):
+        counts = self.counts()
+        return (
+            f"Lô {self.id} ({time.strftime('%d/%m %H:%M', time.localtime(self.created))}, {self.output_folder}):"
+            f" {counts['done']} xong, {counts['queued'] + counts['running']} còn chờ, {counts['failed']} lỗi"
+        )
+
+
+class ThroughputHistory:
+    """Tốc độ tải đo được ở các lần chạy trước, theo nguồn ('drive', 'youtube').
+
+    Lưu trong APP_DATA_DIR dưới dạng trung bình trượt để ước tính thời gian
+    tải của một kế hoạch trước khi chạy.
+    """
+
+    DEFAULT_RATES = {'drive': 10 * 1024 * 1024, 'youtube': 5 * 1024 * 1024}
+    SMOOTHING = 0.3  # Trọng số của lần đo mới nhất
+    MIN_SAMPLE_BYTES = 1024 * 1024  # Lần tải quá nhỏ không phản ánh tốc độ
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(APP_DATA_DIR, "throughput.json")
+        self._lock = threading.Lock()
+
+    def rate(self, source):
+        """Tốc độ ước tính (byte/giây) của `source`."""
+        return self._load().get(source) or self.DEFAULT_RATES.get(source, self.DEFAULT_RATES['drive'])
+
+    def record(self, source, total_bytes, seconds):
+        if total_bytes < self.MIN_SAMPLE_BYTES or seconds <= 0:
+            return
+        measured = total_bytes / seconds
+        with self._lock:
+            rates = self._load()
+            previous = rates.get(source)
+            rates[source] = measured if previous is None else (
+                self.SMOOTHING * measured + (1 - self.SMOOTHING) * previous
+            )
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(rates, f)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+
+def format_bytes(size):
+    for unit, scale in (("GB", 1024 ** 3), ("MB", 1024 ** 2), ("KB", 1024)):
+        if size >= scale:
+            return f"{size / scale:.1f} {unit}"
+    return f"{size} B"
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours} giờ {minutes} phút"
+    if minutes:
+        return f"{minutes} phút {seconds} giây"
+    return f"{seconds} giây"
+
+
+class BatchPlan:
+    """Kế hoạch của một lô tải, lập trước khi tải byte dữ liệu nào.
+
+    `items` là các mục sẽ được tải (kèm `size`, None nếu chưa biết),
+    `skipped` đếm các mục sẽ bị bỏ qua theo lý do, `data` giữ dữ liệu riêng
+    của engine để lần tải thật dùng lại (cây thư mục Drive, danh sách URL
+    video đã mở rộng). Kế hoạch được lưu thành file JSON.
+    """
+
+    VERSION = 1
+
+    def __init__(self, source, output_folder, links):
+        self.source = source
+        self.output_folder = output_folder
+        self.links = [link.strip() for link in links if link.strip()]
+        self.created = time.time()
+        self.items = []
+        self.skipped = {}
+        self.failed = []  # (mục, lỗi)
+        self.data = {}
+        self._lock = threading.Lock()
+
+    def add(self, item, size):
+        with self._lock:
+            self.items.append(dict(item, size=size))
+
+    def skip(self, reason):
+        with self._lock:
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    @property
+    def total_bytes(self):
+        return sum(item['size'] or 0 for item in self.items)
+
+    @property
+    def unknown_sizes(self):
+        return sum(1 for item in self.items if item['size'] is None)
+
+    def free_space(self):
+        """Dung lượng trống của ổ chứa thư mục tải về."""
+        path = os.path.abspath(self.output_folder)
+        while not os.path.exists(path):
+            path = os.path.dirname(path)
+        return shutil.disk_usage(path).free
+
+    def fits(self):
+        return self.total_bytes <= self.free_space()
+
+    def matches(self, links, output_folder):
+        """True nếu kế hoạch được lập cho đúng các liên kết và thư mục này."""
+        return (self.links == [link.strip() for link in links if link.strip()]
+                and os.path.abspath(self.output_folder) == os.path.abspath(output_folder))
+
+    def summary(self, rate):
+        """Các dòng tổng kết kế hoạch với tốc độ `rate` byte/giây."""
+        lines = [
+            f"Kế hoạch: {len(self.items)} mục, tổng {format_bytes(self.total_bytes)}"
+            + (f" ({self.unknown_sizes} mục chưa rõ dung lượng)" if self.unknown_sizes else ""),
+            f"Thời gian dự kiến: {format_duration(self.total_bytes / rate)} ở {format_bytes(rate)}/s",
+            f"Dung lượng trống: {format_bytes(self.free_space())}"
+            + ("" if self.fits() else " - KHÔNG ĐỦ CHỖ"),
+        ]
+        for reason, count in self.skipped.items():
+            lines.append(f"Bỏ qua {count} mục: {reason}")
+        for item, error in self.failed:
+            lines.append(f"Lỗi: {item}: {error}")
+        return lines
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': self.VERSION,
+                'source': self.source,
+                'output_folder': self.output_folder,
+                'links': self.links,
+                'created': self.created,
+                'items': self.items,
+                'skipped': self.skipped,
+                'failed': self.failed,
+                'data': self.data,
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved.get('version') != cls.VERSION:
+            raise ValueError(f"Phiên bản kế hoạch không hỗ trợ: {saved.get('version')}")
+        plan = cls(saved['source'], saved['output_folder'], saved['links'])
+        plan.created = saved['created']
+        plan.items = saved['items']
+        plan.skipped = saved['skipped']
+        plan.failed = [tuple(failure) for failure in saved['failed']]
+        plan.data = saved['data']
+        return plan
+
+
+class MetricsRegistry:
+    """Số đo của một lần chạy: thời gian, số byte, số lần thử lại theo từng bước.
+
+    Mỗi lần đo (`timer` hoặc `record`) là một sự kiện gồm tên bước (ví dụ
+    'drive_file', 'youtube_extract'), nhãn và các giá trị đếm được. Sự kiện
+    được xuất dạng JSON lines (`write_jsonl`) hoặc tổng hợp theo (tên, nhãn)
+    thành văn bản Prometheus (`write_prometheus`). Thread-safe.
+    """
+
+    PREFIX = "hdz_"
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self):
+        self.started = time.time()
+        self.events = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, name, item=None, **labels):
+        """Đo thời gian của khối lệnh; khối lệnh ghi thêm giá trị vào dict được trả về.
+
+        Ví dụ `with metrics.timer('drive_file', item=name) as sample: sample['bytes'] = n`.
+        Khối lệnh ném lỗi được ghi với nhãn status='error'.
+        """
+        sample = {}
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            yield sample
+            status = sample.pop('status', 'ok')
+        finally:
+            self.record(name, time.perf_counter() - start, item=item, status=status, **labels, **sample)
+
+    def record(self, name, seconds, item=None, **values):
+        """Ghi một sự kiện đã đo; giá trị số là số đếm, giá trị chuỗi là nhãn."""
+        event = {'time': round(time.time(), 3), 'metric': name, 'seconds': round(seconds, 6)}
+        if item is not None:
+            event['item'] = item
+        event.update(values)
+        if event.get('bytes') and seconds > 0:
+            event['throughput'] = round(event['bytes'] / seconds, 1)
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self):
+        """Tổng hợp theo (tên, nhãn): số lần, tổng giây, tổng các giá trị đếm và các thời lượng."""
+        groups = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            labels = tuple(sorted(
+                (key, value) for key, value in event.items()
+                if isinstance(value, str) and key not in ('metric', 'item')
+            ))
+            group = groups.setdefault((event['metric'], labels), {'count': 0, 'durations': [], 'totals': {}})
+            group['count'] += 1
+            group['durations'].append(event['seconds'])
+            for key, value in event.items():
+                if key in ('time', 'seconds', 'throughput') or isinstance(value, (str, bool)):
+                    continue
+                if isinstance(value, (int, float)):
+                    group['totals'][key] = group['totals'].get(key, 0) + value
+        return groups
+
+    def write_jsonl(self, path):
+        with self._lock:
+            events = list(self.events)
+        with open(path, 'w', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def write_prometheus(self, path):
+        families = {}  # Tên họ số đo -> (kiểu, các dòng mẫu); các mẫu cùng họ phải liền nhau
+
+        def emit(family, kind, labels, value, suffix=""):
+            label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+            sample = f"{family}{suffix}{{{label_text}}}" if label_text else f"{family}{suffix}"
+            families.setdefault(family, (kind, []))[1].append(f"{sample} {value:g}")
+
+        for (name, labels), group in sorted(self.summary().items()):
+            base = self.PREFIX + name
+            durations = sorted(group['durations'])
+            total_seconds = sum(durations)
+            for quantile in self.QUANTILES:
+                index = min(len(durations) - 1, int(quantile * len(durations)))
+                emit(f"{base}_seconds", "summary", labels + (('quantile', str(quantile)),), durations[index])
+            emit(f"{base}_seconds", "summary", labels, total_seconds, "_sum")
+            emit(f"{base}_seconds", "summary", labels, group['count'], "_count")
+            for key, value in sorted(group['totals'].items()):
+                emit(f"{base}_{key}_total", "counter", labels, value)
+            if group['totals'].get('bytes') and total_seconds > 0:
+                emit(f"{base}_throughput_bytes_per_second", "gauge", labels, group['totals']['bytes'] / total_seconds)
+
+        with open(path, 'w', encoding='utf-8') as f:
+            for family, (kind, samples) in families.items():
+                f.write(f"# TYPE {family} {kind}\n")
+                f.write("\n".join(samples) + "\n")
+
+    def export(self, path):
+        """Ghi ra `path`: đuôi .prom là định dạng Prometheus, còn lại là JSON lines."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if path.endswith(".prom"):
+            self.write_prometheus(path)
+        else:
+            self.write_jsonl(path)
@@ -0,0 +1,909 @@
+"""Engine tải YouTube (và mọi trang yt-dlp hỗ trợ), không phụ thuộc giao diện Tk."""
+import os
+import copy
+import itertools
+import json
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from engine_common import APP_DATA_DIR, BatchPlan, BatchResult, MetricsRegistry, ThroughputHistory, shared_shaper
+
+# Hồ sơ tốc độ tải: các tham số được truyền thẳng vào YoutubeDL
+TRANSFER_PROFILES = {
+    "Tiêu chuẩn": {
+        'concurrent_fragment_downloads': 1,
+    },
+    "Nhanh": {
+        'concurrent_fragment_downloads': 8,
+        'http_chunk_size': 10 * 1024 * 1024,
+        'buffersize': 1024 * 1024,
+    },
+    "Rất nhanh (aria2c)": {
+        'concurrent_fragment_downloads': 16,
+        'buffersize': 1024 * 1024,
+        'external_downloader': {'default': 'aria2c'},
+        'external_downloader_args': {'aria2c': ['-x16', '-s16', '-k1M', '--file-allocation=none']},
+    },
+}
+DEFAULT_TRANSFER_PROFILE = "Nhanh"
+
+
+def build_transfer_options(profile_name, concurrent_fragments=None):
+    """Tạo các tham số tải của YoutubeDL từ hồ sơ tốc độ.
+
+    `concurrent_fragments` (nếu có) ghi đè số fragment song song của hồ sơ.
+    Hồ sơ dùng aria2c sẽ quay về bộ tải mặc định khi không tìm thấy aria2c.
+    """
+    options = dict(TRANSFER_PROFILES.get(profile_name, TRANSFER_PROFILES[DEFAULT_TRANSFER_PROFILE]))
+    if concurrent_fragments:
+        options['concurrent_fragment_downloads'] = concurrent_fragments
+    if 'external_downloader' in options and shutil.which('aria2c') is None:
+        options.pop('external_downloader')
+        options.pop('external_downloader_args', None)
+        options.setdefault('http_chunk_size', 10 * 1024 * 1024)
+    return options
+
+
+_EXTRACTOR_CLASSES = None
+
+
+def extractor_classes():
+    """Danh sách extractor của yt-dlp, nạp ở lần dùng đầu tiên."""
+    global _EXTRACTOR_CLASSES
+    if _EXTRACTOR_CLASSES is None:
+        from yt_dlp.extractor import gen_extractor_classes
+        _EXTRACTOR_CLASSES = list(gen_extractor_classes())
+    return _EXTRACTOR_CLASSES
+
+
+def canonical_video_key(url):
+    """Khóa chuẩn `<extractor> <id>` của một URL, tính không cần mạng.
+
+    Nhờ vậy `youtu.be/X` và `watch?v=X` có cùng khóa. Trả về None khi
+    extractor không suy ra được id từ URL (ví dụ extractor generic).
+    """
+    from yt_dlp.utils import make_archive_id
+
+    for ie in extractor_classes():
+        if ie.suitable(url):
+            temp_id = ie.get_temp_id(url)
+            return make_archive_id(ie.ie_key(), temp_id) if temp_id else None
+    return None
+
+
+def url_return_type(url, ie_key=None):
+    """Loại kết quả mà extractor của `url` (hoặc extractor `ie_key`) trả về: 'video', 'playlist' hoặc 'any'."""
+    for ie in extractor_classes():
+        if (ie.ie_key() == ie_key) if ie_key else ie.suitable(url):
+            return ie._RETURN_TYPE or 'any'
+    return 'any'
+
+
+def parse_playlist_range(text):
+    """Chuyển phạm vi playlist dạng "5", "1-50" hoặc "10-" (đánh số từ 1)
+    thành (start, stop) dùng cho `itertools.islice`; chuỗi rỗng là toàn bộ."""
+    text = text.strip()
+    if not text:
+        return 0, None
+    start, sep, stop = text.partition('-')
+    start = int(start) if start.strip() else 1
+    if not sep:
+        stop = start
+    else:
+        stop = int(stop) if stop.strip() else None
+    if start < 1 or (stop is not None and stop < start):
+        raise ValueError(f"Phạm vi playlist không hợp lệ: {text}")
+    return start - 1, stop
+
+
+class MetadataCache:
+    """Cache trên đĩa cho kết quả `extract_info` thô của yt-dlp.
+
+    Khóa là id chuẩn của extractor; URL đã từng gặp được lưu thêm dưới dạng
+    bí danh để các URL không suy ra được id vẫn dùng lại được cache. Mục hết
+    hạn sau `ttl` giây (URL định dạng đã ký của YouTube chỉ sống vài giờ) và
+    các mục ít dùng nhất bị loại khi tổng dung lượng vượt `max_bytes`.
+    """
+
+    DEFAULT_TTL = 5 * 3600
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " info BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS aliases (url TEXT PRIMARY KEY, key TEXT NOT NULL)")
+        self.conn.commit()
+
+    def key_for_url(self, url):
+        key = canonical_video_key(url)
+        if key is None:
+            with self._lock:
+                row = self.conn.execute("SELECT key FROM aliases WHERE url = ?", (url,)).fetchone()
+            key = row[0] if row else None
+        return key
+
+    def get(self, key):
+        """Trả về info đã lưu, hoặc None nếu không có hay đã hết hạn."""
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute("SELECT info, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, info, urls=()):
+        """Lưu một info (đã sanitize) và trả về khóa của nó."""
+        from yt_dlp.utils import make_archive_id
+
+        key = make_archive_id(info['extractor_key'], info['id'])
+        blob = zlib.compress(json.dumps(info).encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now)
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO aliases VALUES (?, ?)",
+                [(url, key) for url in urls]
+            )
+            self._evict()
+            self.conn.commit()
+        return key
+
+    def invalidate(self, key):
+        with self._lock:
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.conn.commit()
+
+    def _evict(self):
+        self.conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self.conn.execute("DELETE FROM aliases WHERE key NOT IN (SELECT key FROM entries)")
+
+
+# Họ codec video dùng khi gộp định dạng của nhiều video: (tên, điều kiện lọc của yt-dlp, tiền tố vcodec)
+VIDEO_CODEC_FAMILIES = (
+    ("H.264", "[vcodec^=avc1]", ("avc1",)),
+    ("VP9", "[vcodec~='^vp0?9']", ("vp9", "vp09")),
+    ("AV1", "[vcodec^=av01]", ("av01",)),
+)
+
+
+def _estimate_format_size(fmt, duration):
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if not size and fmt.get('tbr') and duration:
+        size = fmt['tbr'] * 1000 / 8 * duration
+    return size or 0
+
+
+def summarize_batch_formats(infos):
+    """Gộp định dạng của nhiều video thành các lựa chọn chung cho cả lô.
+
+    Trả về danh sách dict (label, selector, available, total_bytes, unknown):
+    `available` là số video có đúng độ phân giải/codec đó, `total_bytes` là
+    tổng dung lượng ước tính từ `filesize`/`filesize_approx` của định dạng
+    mà selector sẽ chọn, `unknown` là số video không ước tính được.
+    """
+    per_video = []
+    heights = set()
+    for info in infos:
+        formats = info.get('formats') or []
+        duration = info.get('duration')
+        videos = [f for f in formats if f.get('vcodec') not in (None, 'none') and f.get('height')]
+        audios = [f for f in formats if f.get('vcodec') == 'none' and f.get('acodec') not in (None, 'none')]
+        m4a_audios = [f for f in audios if f.get('ext') == 'm4a'] or audios
+        best_audio = max(m4a_audios, key=lambda f: f.get('abr') or f.get('tbr') or 0, default=None)
+        heights.update(f['height'] for f in videos)
+        per_video.append((videos, best_audio, duration))
+
+    choices = []
+    for height in sorted(heights, reverse=True):
+        for family, codec_filter, prefixes in VIDEO_CODEC_FAMILIES:
+            available = 0
+            total_bytes = 0
+            unknown = 0
+            for videos, best_audio, duration in per_video:
+                in_family = [f for f in videos if f['height'] <= height and f['vcodec'].startswith(prefixes)]
+                candidates = in_family or [f for f in videos if f['height'] <= height]
+                if not candidates:
+                    unknown += 1
+                    continue
+                chosen = max(candidates, key=lambda f: (f['height'], f.get('tbr') or 0))
+                if in_family and chosen['height'] == height:
+                    available += 1
+                size = _estimate_format_size(chosen, duration)
+                if chosen.get('acodec') in (None, 'none') and best_audio:
+                    size = size and size + _estimate_format_size(best_audio, duration)
+                if size:
+                    total_bytes += size
+                else:
+                    unknown += 1
+            if available:
+                choices.append({
+                    'label': f"{height}p {family} + m4a",
+                    'selector': f"bv*[height<={height}]{codec_filter}+ba[ext=m4a]/bv*[height<={height}]+ba/b[height<={height}]",
+                    'available': available,
+                    'total_bytes': total_bytes,
+                    'unknown': unknown,
+                })
+
+    audio_bytes = 0
+    audio_available = 0
+    for _, best_audio, duration in per_video:
+        if best_audio:
+            audio_available += 1
+            audio_bytes += _estimate_format_size(best_audio, duration)
+    if audio_available:
+        choices.append({
+            'label': "Chỉ âm thanh (m4a)",
+            'selector': "bestaudio[ext=m4a]/bestaudio",
+            'available': audio_available,
+            'total_bytes': audio_bytes,
+            'unknown': len(per_video) - audio_available,
+        })
+    return choices
+
+
+# Định dạng cho các bước hậu xử lý tùy chọn
+REMUX_FORMATS = ('mp4', 'mkv', 'mov', 'webm')
+AUDIO_FORMATS = ('mp3', 'm4a', 'opus', 'flac', 'wav')
+
+
+def build_postprocess_options(remux_format=None, audio_format=None, embed_thumbnail=False):
+    """Tạo tham số YoutubeDL cho các bước hậu xử lý tùy chọn, chạy trong pool hậu xử lý cùng bước ghép.
+
+    Tách audio (`audio_format`) thay cho remux vì file video không được giữ
+    lại; nhúng ảnh thu nhỏ chạy sau cùng như thứ tự của yt-dlp.
+    """
+    postprocessors = []
+    options = {}
+    if audio_format:
+        postprocessors.append({'key': 'FFmpegExtractAudio', 'preferredcodec': audio_format})
+        options['final_ext'] = audio_format
+    elif remux_format:
+        postprocessors.append({'key': 'FFmpegVideoRemuxer', 'preferedformat': remux_format})
+        options['final_ext'] = remux_format
+    if embed_thumbnail:
+        postprocessors.append({'key': 'EmbedThumbnail', 'already_have_thumbnail': False})
+        options['writethumbnail'] = True
+    if postprocessors:
+        options['postprocessors'] = postprocessors
+    return options
+
+
+_PIPELINED_CLASS = None
+
+
+# Giao thức yt-dlp tải theo fragment (mỗi fragment một kết nối riêng)
+FRAGMENTED_PROTOCOLS = ('m3u8', 'm3u8_native', 'http_dash_segments', 'http_dash_segments_generator', 'ism', 'f4m')
+
+
+def pipelined_class():
+    """Lớp `PipelinedYoutubeDL`, định nghĩa ở lần dùng đầu vì phải kế thừa YoutubeDL."""
+    global _PIPELINED_CLASS
+    if _PIPELINED_CLASS is not None:
+        return _PIPELINED_CLASS
+    from yt_dlp import YoutubeDL
+
+    class PipelinedYoutubeDL(YoutubeDL):
+        """YoutubeDL chuyển hậu xử lý (ghép, remux, nhúng ảnh, tách audio bằng
+        ffmpeg) sang `postprocess_pool` dùng chung, nên luồng tải sang video
+        kế tiếp ngay thay vì chờ ffmpeg. `take_postprocessing()` trả về các
+        future hậu xử lý của video vừa tải; video chỉ được ghi vào download
+        archive khi hậu xử lý xong. Thời gian hậu xử lý (và thời gian chờ
+        lượt trong pool) được ghi vào `metrics` nếu có. `set_bandwidth` giữ
+        `ratelimit` khớp với phần băng thông của video đang tải."""
+
+        def __init__(self, params, postprocess_pool, metrics=None):
+            super().__init__(params)
+            self._postprocess_pool = postprocess_pool
+            self._metrics = metrics
+            self._postprocessing = []
+            self._bandwidth = None
+            self._fragmented = False
+
+        def set_bandwidth(self, rate):
+            """Gọi từ `BandwidthFlow` khi phần băng thông đổi; bộ tải HTTP đọc `ratelimit` ở mỗi khối.
+
+            yt-dlp giới hạn riêng từng kết nối fragment (HLS/DASH) và chép
+            tham số lúc bắt đầu, nên với fragment phần được chia cho số
+            fragment song song và chỉ áp dụng từ định dạng tải tiếp theo.
+            """
+            self._bandwidth = rate
+            if rate is None:
+                self.params.pop('ratelimit', None)
+                return
+            if self._fragmented:
+                rate /= max(1, self.params.get('concurrent_fragment_downloads') or 1)
+            self.params['ratelimit'] = max(1, int(rate))
+
+        def dl(self, name, info, subtitle=False, test=False):
+            if not test:
+                self._fragmented = bool(info.get('fragments')) or info.get('protocol') in FRAGMENTED_PROTOCOLS
+                self.set_bandwidth(self._bandwidth)
+            return super().dl(name, info, subtitle, test)
+
+        def post_process(self, filename, info, files_to_move=None):
+            queued = time.perf_counter()
+            post_process = super().post_process
+
+            def run(info):
+                if self._metrics is None:
+                    return post_process(filename, info, files_to_move)
+                with self._metrics.timer('youtube_postprocess', item=info.get('title') or filename) as sample:
+                    sample['wait_seconds'] = round(time.perf_counter() - queued, 6)
+                    return post_process(filename, info, files_to_move)
+
+            # Pool làm trên bản sao: luồng tải vẫn đọc `info` sau khi hàm này trả về
+            self._postprocessing.append(self._postprocess_pool.submit(run, dict(info)))
+            info['filepath'] = filename
+            return info
+
+        def record_download_archive(self, info_dict):
+            if not self._postprocessing:
+                return super().record_download_archive(info_dict)
+            info_dict = dict(info_dict)
+
+            def record(future):
+                if future.exception() is None:
+                    YoutubeDL.record_download_archive(self, info_dict)
+
+            self._postprocessing[-1].add_done_callback(record)
+
+        def take_postprocessing(self):
+            futures, self._postprocessing = self._postprocessing, []
+            return futures
+
+    _PIPELINED_CLASS = PipelinedYoutubeDL
+    return _PIPELINED_CLASS
+
+
+def format_size(bytes_or_unknown):
+    if bytes_or_unknown == "Unknown" or not bytes_or_unknown:
+        return "Unknown"
+    bytes = bytes_or_unknown  # Đảm bảo bytes là số
+    if bytes >= 1024 * 1024 * 1024:  # >= 1GB
+        return f"{bytes / (1024 * 1024 * 1024):.2f}GB"
+    return f"{bytes / (1024 * 1024):.2f}MB"
+
+
+def format_eta(eta_or_unknown):
+    if eta_or_unknown == "Unknown" or not eta_or_unknown:
+        return "Đang tính..."
+    eta = eta_or_unknown  # Đảm bảo eta là số
+    eta_minutes = eta // 60
+    eta_seconds = eta % 60
+    return f"ETA: {eta_minutes:.0f} phút {eta_seconds:.0f} giây"
+
+
+def format_progress(filename, downloaded_bytes, total_bytes, speed, eta):
+    # Kiểm tra total_bytes
+    if total_bytes == "Unknown" or not total_bytes:
+        progress = 0
+        total_str = "Unknown"
+    else:
+        progress = min((downloaded_bytes / total_bytes) * 100, 100)
+        total_str = format_size(total_bytes)
+
+    # Định dạng thông tin tải về
+    downloaded_str = format_size(downloaded_bytes)
+    speed_str = format_size(speed) + "/s" if speed != "Unknown" else "Unknown"
+
+    # Thời gian ước tính (ETA)
+    eta_str = format_eta(eta) if eta != "Unknown" else "Đang tính..."
+
+    # Định dạng trạng thái hiển thị
+    return f"Đang tải {filename}: {progress:.1f}% ({downloaded_str} / {total_str}) - Tốc độ: {speed_str} - {eta_str}"
+
+
+class YouTubeDownloader:
+    """Tải danh sách video/playlist bằng yt-dlp, báo tiến trình qua `progress`.
+
+    `progress` có cùng giao diện với `DriveDownloader`: `log`, `update` và
+    `finish`. `extra_ydl_opts` được gộp vào tham số YoutubeDL của mỗi luồng
+    tải (ví dụ `quiet` khi chạy từ dòng lệnh). Khi có `archive`
+    (`DownloadArchive`), video đã tải ở lần chạy trước được bỏ qua trước khi
+    trích xuất và video mới được ghi vào archive sau khi tải xong. Thời gian
+    trích xuất, tải và hậu xử lý từng video được ghi vào `metrics`
+    (`MetricsRegistry`). Mỗi video đang tải là một lượt trong `shaper`
+    (`BandwidthShaper`, mặc định bộ chung của tiến trình), dùng chung trần
+    băng thông với các lượt tải Drive.
+    """
+
+    PROBE_WORKERS = 8  # Số video được lấy metadata song song khi lấy định dạng cho nhiều URL
+
+    def __init__(self, progress, metadata_cache=None, max_concurrent_videos=3, max_postprocessors=None,
+                 transfer_profile=DEFAULT_TRANSFER_PROFILE, concurrent_fragments=None,
+                 playlist_range=(0, None), extra_ydl_opts=None, archive=None, throughput=None, metrics=None,
+                 shaper=None, remux_format=None, audio_format=None, embed_thumbnail=False):
+        self.progress = progress
+        if metadata_cache is None:
+            metadata_cache = MetadataCache(os.path.join(APP_DATA_DIR, "metadata_cache.sqlite3"))
+        self.metadata_cache = metadata_cache
+        self.max_concurrent_videos = max_concurrent_videos
+        self.max_postprocessors = max_postprocessors or os.cpu_count() or 2
+        self.transfer_profile = transfer_profile
+        self.concurrent_fragments = concurrent_fragments
+        self.playlist_range = playlist_range
+        self.extra_ydl_opts = extra_ydl_opts or {}
+        self.archive = archive
+        self.throughput = throughput or ThroughputHistory()
+        self.metrics = metrics or MetricsRegistry()
+        self.shaper = shaper or shared_shaper()
+        self.remux_format = remux_format
+        self.audio_format = audio_format
+        self.embed_thumbnail = embed_thumbnail
+        self._finished_bytes = 0
+        self._video_bytes = {}  # id video -> số byte đã tải xong, cho số đo từng video
+        self._finished_lock = threading.Lock()
+
+    def probe_videos(self, links):
+        """Lấy metadata của nhiều URL song song (tối đa `PROBE_WORKERS` luồng).
+
+        Trả về (infos, failures) với failures là danh sách (link, lỗi).
+        """
+        from yt_dlp import YoutubeDL
+
+        worker_state = threading.local()
+        worker_ydls = []
+        worker_ydls_lock = threading.Lock()
+
+        def probe(link):
+            ydl = getattr(worker_state, 'ydl', None)
+            if ydl is None:
+                ydl = YoutubeDL({'quiet': True, 'no_warnings': True, **self.extra_ydl_opts})
+                worker_state.ydl = ydl
+                with worker_ydls_lock:
+                    worker_ydls.append(ydl)
+            info, _ = self.get_video_info(ydl, link)
+            return info
+
+        infos = []
+        failures = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.PROBE_WORKERS, thread_name_prefix="youtube-probe") as executor:
+                futures = {executor.submit(probe, link): link for link in links}
+                for future in as_completed(futures):
+                    try:
+                        infos.append(future.result())
+                    except Exception as e:
+                        failures.append((futures[future], str(e)))
+        finally:
+            for ydl in worker_ydls:
+                ydl.close()
+        return infos, failures
+
+    def plan_videos(self, links, output_folder, format_id):
+        """Lập kế hoạch (`BatchPlan`) cho `links` với định dạng `format_id`, không tải video nào.
+
+        Playlist được mở rộng như khi tải thật, rồi metadata của từng video
+        được lấy song song (và lưu vào cache metadata) để tính dung lượng của
+        định dạng đã chọn. Danh sách URL video được lưu trong kế hoạch để lần
+        tải thật không phải mở rộng playlist lại.
+        """
+        from yt_dlp import YoutubeDL
+
+        plan = BatchPlan('youtube', output_folder, links)
+        urls = list(self.expand_links(
+            plan.links,
+            lambda link, error: plan.failed.append((link, error)),
+            lambda link: plan.skip("đã tải ở lần trước")
+        ))
+        plan.data['urls'] = urls
+        plan.data['format'] = format_id
+        worker_state = threading.local()
+        worker_ydls = []
+        worker_ydls_lock = threading.Lock()
+
+        def probe(url):
+            ydl = getattr(worker_state, 'ydl', None)
+            if ydl is None:
+                ydl = YoutubeDL({'quiet': True, 'no_warnings': True, **self.extra_ydl_opts, 'format': format_id})
+                worker_state.ydl = ydl
+                with worker_ydls_lock:
+                    worker_ydls.append(ydl)
+            info, _ = self.get_video_info(ydl, url)
+            info = ydl.process_ie_result(copy.deepcopy(info), download=False)
+            size = 0
+            for fmt in info.get('requested_formats') or [info]:
+                fmt_size = fmt.get('filesize') or fmt.get('filesize_approx')
+                if not fmt_size:
+                    size = None
+                    break
+                size += fmt_size
+            plan.add({'url': url, 'title': info.get('title')}, size)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.PROBE_WORKERS, thread_name_prefix="youtube-plan") as executor:
+                futures = {executor.submit(probe, url): url for url in urls}
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        plan.failed.append((futures[future], str(e)))
+        finally:
+            for ydl in worker_ydls:
+                ydl.close()
+        return plan
+
+    def is_archived(self, url, entry=None):
+        """True nếu video của `url` (hoặc mục playlist phẳng `entry`) đã có trong archive."""
+        from yt_dlp.utils import make_archive_id
+
+        if self.archive is None:
+            return False
+        key = None
+        if entry and entry.get('ie_key') and entry.get('id'):
+            key = make_archive_id(entry['ie_key'], entry['id'])
+        key = key or canonical_video_key(url) or self.archive.key_for_url(url)
+        return key in self.archive
+
+    # Số tầng playlist lồng nhau tối đa (kênh -> tab -> playlist -> video)
+    MAX_PLAYLIST_DEPTH = 5
+
+    def expand_links(self, links, on_error, on_archived=None):
+        """Sinh lần lượt URL của từng video, mở rộng playlist/kênh một cách lười.
+
+        Playlist được trích xuất phẳng (`extract_flat`) nên mỗi trang mục được
+        đưa ra ngay khi tải về, việc tải có thể bắt đầu sau vài giây và bộ nhớ
+        không tăng theo kích thước playlist. Playlist lồng nhau (kênh gồm các
+        tab) và mục chuyển hướng tới extractor có thể trả về playlist được mở
+        rộng đệ quy, nên chỉ URL video được đưa ra; mục của extractor generic
+        để luồng tải tự xử lý. `self.playlist_range` giới hạn các mục
+        được lấy trong mỗi playlist. URL đã có trong archive không được đưa ra
+        mà được báo qua `on_archived(url)`.
+        """
+        from yt_dlp import YoutubeDL
+
+        start, stop = self.playlist_range
+        expander = YoutubeDL({
+            'quiet': True,
+            'no_warnings': True,
+            **self.extra_ydl_opts,
+            'extract_flat': 'in_playlist',
+            'lazy_playlist': True,
+        })
+        expanding = set()  # URL playlist đang mở rộng, tránh vòng lặp chuyển hướng
+
+        def report_archived(url):
+            if on_archived is not None:
+                on_archived(url)
+
+        def may_be_playlist(url, ie_key):
+            return_type = url_return_type(url, ie_key)
+            return return_type == 'playlist' or (return_type == 'any' and ie_key not in (None, 'Generic'))
+
+        def expand_info(url, info, depth):
+            """Sinh URL video từ kết quả trích xuất `info` của `url`."""
+            result_type = info.get('_type', 'video')
+            if result_type in ('url', 'url_transparent'):
+                if may_be_playlist(info['url'], info.get('ie_key')):
+                    yield from expand_url(info['url'], depth + 1, info.get('ie_key'))
+                else:
+                    # Chuyển hướng tới video: luồng tải tự đi theo, giữ metadata của URL gốc
+                    yield url
+                return
+            if result_type != 'playlist':
+                # Video: metadata đã nằm trong cache cho luồng tải
+                yield url
+                return
+
+            title = info.get('title') or url
+            self.progress.log(f"Đang mở rộng playlist: {title}")
+            count = 0
+            for entry in itertools.islice(info.get('entries') or [], start, stop):
+                entry_url = entry and (entry.get('webpage_url') or entry.get('url'))
+                if not entry_url:
+                    continue
+                entry_type = entry.get('_type', 'video')
+                nested = None
+                if entry_type == 'playlist':
+                    nested = expand_info(entry_url, entry, depth + 1)
+                elif entry_type in ('url', 'url_transparent') and may_be_playlist(entry_url, entry.get('ie_key')):
+                    nested = expand_url(entry_url, depth + 1, entry.get('ie_key'))
+                if nested is not None:
+                    for video_url in expand_nested(entry_url, nested):
+                        count += 1
+                        yield video_url
+                    continue
+                if self.is_archived(entry_url, entry):
+                    report_archived(entry_url)
+                    continue
+                count += 1
+                yield entry_url
+            self.progress.log(f"Đã mở rộng {count} mục từ: {title}")
+
+        def expand_nested(url, videos):
+            # Lỗi của một playlist con chỉ bỏ playlist đó, không dừng playlist cha
+            try:
+                yield from videos
+            except Exception as e:
+                on_error(url, str(e))
+
+        def expand_url(url, depth=0, ie_key=None):
+            """Sinh URL video của `url`, trích xuất phẳng nếu nó có thể là playlist."""
+            return_type = url_return_type(url, ie_key)
+            if return_type != 'playlist' and self.is_archived(url):
+                report_archived(url)
+                return
+            if return_type == 'video':
+                yield url
+                return
+            if depth > self.MAX_PLAYLIST_DEPTH or url in expanding:
+                raise ValueError(f"Playlist lồng quá sâu hoặc chuyển hướng vòng: {url}")
+            expanding.add(url)
+            try:
+                info, _ = self.get_video_info(expander, url)
+                yield from expand_info(url, info, depth)
+            finally:
+                expanding.discard(url)
+
+        try:
+            for link in links:
+                try:
+                    yield from expand_url(link)
+                except Exception as e:
+                    on_error(link, str(e))
+        finally:
+            expander.close()
+
+    def get_video_info(self, ydl, url):
+        """Lấy kết quả `extract_info` thô của `url`, ưu tiên cache trên đĩa.
+
+        Trả về (info, from_cache). Chỉ kết quả của một video đơn lẻ được lưu
+        cache; playlist và URL chuyển hướng được trả về nguyên trạng.
+        """
+        from yt_dlp.utils import DownloadError
+
+        start = time.perf_counter()
+        cached = self.metadata_cache.get(self.metadata_cache.key_for_url(url))
+        if cached is not None:
+            self.metrics.record('youtube_extract', time.perf_counter() - start, item=url, status='ok', cache='hit')
+            return cached, True
+
+        with self.metrics.timer('youtube_extract', item=url, cache='miss'):
+            info = ydl.extract_info(url, download=False, process=False)
+        if info is None:
+            raise DownloadError(f"Không thể lấy thông tin: {url}")
+        if info.get('_type', 'video') == 'video' and info.get('id') and info.get('extractor_key'):
+            self.metadata_cache.put(ydl.sanitize_info(copy.deepcopy(info), remove_private_keys=True), urls=[url])
+        return info, False
+
+    def download_videos(self, links, output_folder, format_id, plan=None, batch=None):
+        """Tải mọi video của `links` (playlist được mở rộng); trả về `BatchResult`.
+
+        Với `plan` (`BatchPlan` từ `plan_videos`), danh sách video đã mở rộng
+        trong kế hoạch được dùng thay cho `links`. Với `batch` (`JobBatch`),
+        trạng thái từng video được lưu lại; lô đã mở rộng xong chỉ tải các
+        mục còn chờ thay vì mở rộng playlist lại từ đầu.
+        """
+        from yt_dlp.utils import DownloadError, make_archive_id
+
+        if plan is not None:
+            links = plan.data['urls']
+        if batch is not None and batch.expanded:
+            links = batch.pending()
+        ydl_opts = {
+            'outtmpl': os.path.join(output_folder, '%(title)s.%(ext)s'),
+            'progress_hooks': [self.progress_hook],
+            'format': format_id,
+            'merge_output_format': 'mp4' if not format_id.startswith('bestaudio') else 'm4a',
+        }
+        ydl_opts.update(build_transfer_options(self.transfer_profile, self.concurrent_fragments))
+        ydl_opts.update(build_postprocess_options(self.remux_format, self.audio_format, self.embed_thumbnail))
+        ydl_opts.update(self.extra_ydl_opts)
+        if self.archive is not None:
+            # YoutubeDL tra `in` và gọi `add` trực tiếp trên archive
+            ydl_opts['download_archive'] = self.archive
+
+        result = BatchResult()
+        results_lock = threading.Lock()
+
+        # Mỗi luồng tải có YoutubeDL riêng; hậu xử lý (ffmpeg) của mọi luồng chạy
+        # trong một pool cỡ bằng số nhân CPU, chồng lên việc tải video kế tiếp
+        postprocess_pool = ThreadPoolExecutor(
+            max_workers=self.max_postprocessors, thread_name_prefix="youtube-postprocess"
+        )
+        # Giới hạn số video đang tải hoặc hậu xử lý để playlist lớn không được nạp hết vào bộ nhớ
+        pending_slots = threading.BoundedSemaphore(self.max_concurrent_videos * 2)
+        worker_state = threading.local()
+        worker_ydls = []
+        worker_ydls_lock = threading.Lock()
+
+        def get_worker_ydl():
+            ydl = getattr(worker_state, 'ydl', None)
+            if ydl is None:
+                # Bản sao riêng: YoutubeDL giữ `params` theo tham chiếu và `set_bandwidth` ghi vào đó
+                ydl = pipelined_class()(dict(ydl_opts), postprocess_pool, self.metrics)
+                worker_state.ydl = ydl
+                with worker_ydls_lock:
+                    worker_ydls.append(ydl)
+            return ydl
+
+        def download_one(link):
+            """Tải một video; trả về (info, các future hậu xử lý còn chạy trong pool)."""
+            self.progress.log(f"Bắt đầu tải video: {link}")
+            if batch is not None:
+                batch.start(link)
+            ydl = get_worker_ydl()
+            info, from_cache = self.get_video_info(ydl, link)
+            with self.shaper.flow('youtube', on_rate=ydl.set_bandwidth), \
+                    self.metrics.timer('youtube_download', item=link) as sample:
+                try:
+                    ydl.process_ie_result(info, download=True)
+                except DownloadError:
+                    if not from_cache:
+                        raise
+                    # URL định dạng trong cache có thể đã hết hạn: trích xuất lại
+                    self.metadata_cache.invalidate(make_archive_id(info['extractor_key'], info['id']))
+                    sample['retries'] = 1
+                    ydl.take_postprocessing()
+                    ydl.download([link])
+                finally:
+                    with self._finished_lock:
+                        sample['bytes'] = self._video_bytes.pop(info.get('id'), 0)
+            return info, ydl.take_postprocessing()
+
+        def finish(link, info, error):
+            pending_slots.release()
+            if error is not None:
+                with results_lock:
+                    result.failed.append((link, str(error)))
+                if batch is not None:
+                    batch.finish(link, str(error))
+                self.progress.log(f"Lỗi khi tải {link}: {str(error)}")
+                return
+            if self.archive is not None and info.get('id') and info.get('extractor_key'):
+                # Ghi thêm tiêu đề và URL gốc để lần sau nhận ra URL dù extractor không suy ra được id
+                self.archive.add(
+                    make_archive_id(info['extractor_key'], info['id']),
+                    title=info.get('title'),
+                    urls=[link]
+                )
+            with results_lock:
+                result.successful += 1
+            if batch is not None:
+                batch.finish(link)
+            self.progress.log(f"Đã tải xong: {link}")
+
+        def on_done(future, link):
+            # Luồng tải đã rảnh; video chỉ xong khi mọi bước hậu xử lý trong pool xong
+            try:
+                info, postprocessing = future.result()
+            except Exception as e:
+                finish(link, None, e)
+                return
+            if not postprocessing:
+                finish(link, info, None)
+                return
+            remaining = [len(postprocessing)]
+
+            def on_postprocessed(_):
+                with results_lock:
+                    remaining[0] -= 1
+                    if remaining[0]:
+                        return
+                errors = [f.exception() for f in postprocessing if f.exception() is not None]
+                finish(link, info, errors[0] if errors else None)
+
+            for postprocess_future in postprocessing:
+                postprocess_future.add_done_callback(on_postprocessed)
+
+        def on_archived(link):
+            with results_lock:
+                result.skipped += 1
+            self.progress.log(f"Bỏ qua (đã tải ở lần trước): {link}")
+
+        def on_expand_error(link, error):
+            result.total += 1
+            with results_lock:
+                result.failed.append((link, error))
+            if batch is not None:
+                # Playlist lỗi được lưu như một mục lỗi để `requeue_failed` mở rộng lại
+                batch.admit(link)
+                batch.finish(link, error)
+            self.progress.log(f"Lỗi khi lấy thông tin {link}: {error}")
+
+        def admitted(video_urls):
+            # Ghi mọi video vào lô; video đã xử lý trong lô này không được tải lại
+            for video_url in video_urls:
+                expanded.add(video_url)
+                if batch.admit(video_url):
+                    yield video_url
+                else:
+                    with results_lock:
+                        result.skipped += 1
+                    self.progress.log(f"Bỏ qua (đã xử lý trong lô này): {video_url}")
+
+        start_time = time.monotonic()
+        self._finished_bytes = 0
+        expanded = set()
+        video_urls = self.expand_links(links, on_expand_error, on_archived)
+        if batch is not None:
+            video_urls = admitted(video_urls)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrent_videos, thread_name_prefix="youtube-download") as executor:
+                # Producer: video được đưa vào hàng đợi ngay khi được phát hiện
+                for video_url in video_urls:
+                    pending_slots.acquire()
+                    result.total += 1
+                    future = executor.submit(download_one, video_url)
+                    future.add_done_callback(lambda f, link=video_url: on_done(f, link))
+        finally:
+            # Chờ hậu xử lý xong trước khi đóng các YoutubeDL mà pool đang dùng
+            postprocess_pool.shutdown(wait=True)
+            for ydl in worker_ydls:
+                ydl.close()
+        if batch is not None:
+            failed_links = {link for link, _ in result.failed}
+            for link in links:
+                # Playlist được tải lại đã mở rộng thành công: mục của chính playlist xong
+                if link not in expanded and link not in failed_links:
+                    batch.finish(link)
+            batch.mark_expanded()
+            batch.complete()
+
+        elapsed = time.monotonic() - start_time
+        self.throughput.record('youtube', self._finished_bytes, elapsed)
+        self.metrics.record(
+            'youtube_batch', elapsed, status='ok' if result.ok else 'error', bytes=self._finished_bytes,
+            videos=result.total, failed_videos=len(result.failed), skipped_videos=result.skipped
+        )
+        return result
+
+    def progress_hook(self, d):
+        # Chạy trên luồng tải: chỉ ghi bản ghi gọn, việc định dạng để luồng hiển thị làm
+        key = d.get('filename', 'Tệp không xác định')
+        if d['status'] == 'downloading':
+            self.shaper.poll()  # Áp dụng hồ sơ băng thông theo giờ giữa chừng video dài
+            self.progress.update(
+                key,
+                format_progress,
+                key.split('/')[-1],
+                d.get('downloaded_bytes', 0),
+                d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0),
+                d.get('speed') or "Unknown",  # Gán "Unknown" nếu không có giá trị
+                d.get('eta') or "Unknown"
+            )
+
+        elif d['status'] == 'finished':
+            finished_bytes = d.get('total_bytes') or d.get('downloaded_bytes') or 0
+            video_id = (d.get('info_dict') or {}).get('id')
+            with self._finished_lock:
+                self._finished_bytes += finished_bytes
+                self._video_bytes[video_id] = self._video_bytes.get(video_id, 0) + finished_bytes
+            # Khi tải xong, hiển thị thông báo hoàn thành
+            self.progress.finish(key, f"Đã tải xong: {key.split('/')[-1]}")